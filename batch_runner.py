@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+SUMO Sci-Fi Dashboard - Headless Batch Runner
+---------------------------------------------
+Runs a scenario without the GUI: generates its demand, writes the SUMO
+configuration, steps the simulation over TraCI and writes the metrics
+as JSON. The exit status tells whether the run succeeded.
+
+    python batch_runner.py scenario.json --output-dir runs/a --metrics a.json
+
+A scenario spec is a JSON object with the fields of scenario.Scenario,
+e.g. {"network_file": "city.net.xml", "vehicle_count": 500, "seed": 7}.
+Relative paths are resolved against the directory of the spec.
+
+With --checkpoint the simulation state is saved at the given times, and
+--restore starts from the state saved at a time instead of simulating the
+warm-up (which is simulated once if no state is cached yet).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from network_cache import NetworkCache
+from network_model import NetworkModel
+from output_stats import read_trip_stats
+from scenario import (CheckpointCache, Scenario, ScenarioCache, TRIPINFO_FILE, normalize_scenario,
+                      scenario_fingerprint, scenario_router, write_scenario_config,
+                      write_scenario_routes)
+from traci_controller import TraciSimulationController, TRACI_AVAILABLE
+
+# Exit statuses
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_BAD_SPEC = 2
+
+# Scenario fields holding file paths, resolved relative to the spec
+PATH_FIELDS = ("network_file", "demand_file", "taz_file")
+
+# Accepted JSON types of each scenario field (paths may also be null)
+FIELD_TYPES = {
+    "network_file": str,
+    "vehicle_count": int,
+    "duration": (int, float),
+    "distribution": str,
+    "demand_mode": str,
+    "route_type": str,
+    "routing_index": bool,
+    "step_length": (int, float),
+    "seed": int,
+    "demand_file": (str, type(None)),
+    "taz_file": (str, type(None)),
+}
+
+
+def load_scenario(spec_file, **overrides):
+    """
+    Read a scenario spec
+
+    Args:
+        spec_file (str): JSON file with Scenario fields
+        **overrides: Fields replacing the ones in the spec (None values are ignored)
+
+    Returns:
+        Scenario: The normalized scenario
+    """
+    with open(spec_file, 'r') as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError("The spec must be a JSON object")
+
+    spec.update({name: value for name, value in overrides.items() if value is not None})
+    return scenario_from_dict(spec, os.path.dirname(os.path.abspath(spec_file)))
+
+
+def scenario_from_dict(spec, base_dir="."):
+    """
+    Build a scenario from a dict of Scenario fields
+
+    Args:
+        spec (dict): Scenario fields; network_file is required
+        base_dir (str): Directory relative paths are resolved against
+
+    Returns:
+        Scenario: The normalized scenario
+    """
+    unknown = set(spec) - set(Scenario._fields)
+    if unknown:
+        raise ValueError(f"Unknown scenario fields: {', '.join(sorted(unknown))}")
+    if not spec.get("network_file"):
+        raise ValueError("The spec needs a network_file")
+    for name, value in spec.items():
+        # bool is an int in Python, but true is no vehicle count
+        if not isinstance(value, FIELD_TYPES[name]) or (
+                isinstance(value, bool) and FIELD_TYPES[name] is not bool):
+            raise ValueError(f"{name} has the wrong type: {type(value).__name__}")
+
+    spec = dict(spec)
+    for name in PATH_FIELDS:
+        if spec.get(name):
+            spec[name] = os.path.join(base_dir, spec[name])
+            if not os.path.exists(spec[name]):
+                raise ValueError(f"{name} not found: {spec[name]}")
+
+    return normalize_scenario(Scenario(**spec))
+
+
+def tripinfo_metrics(tripinfo_file):
+    """
+    Summarize the trips in a SUMO tripinfo output
+
+    Returns:
+        dict: Trip KPIs (see output_stats.TripStats.kpis), empty if there is no file
+    """
+    if not os.path.exists(tripinfo_file):
+        return {}
+    return read_trip_stats(tripinfo_file).kpis()
+
+
+def run_scenario(scenario, output_dir, network_cache=None, scenario_cache=None, port=8813,
+                 controller=None, checkpoint_times=(), checkpoint_cache=None, restore_time=None,
+                 on_restore=None, end_time=None, workers=1):
+    """
+    Run a scenario to the end without the GUI
+
+    Same chain as the simulation panel: demand generation (reused from
+    the scenario cache when possible), configuration, then stepping
+    SUMO over TraCI until the scenario's duration or the last vehicle.
+
+    With restore_time, the run starts from the state cached at that time.
+    If there is none yet, the warm-up is simulated once (in a "warmup"
+    subdirectory) to save it. SUMO outputs, and so the trip metrics, then
+    only cover the simulation after restore_time.
+
+    Args:
+        scenario (Scenario): The scenario
+        output_dir (str): Directory for the route, configuration and output files
+        network_cache (NetworkCache): Parsed network cache (optional)
+        scenario_cache (ScenarioCache): Cache of generated demand (optional)
+        port (int): TraCI port for SUMO
+        controller (TraciSimulationController): Controller to run with (optional)
+        checkpoint_times (list): Simulation times to save the state at
+        checkpoint_cache (CheckpointCache): Where saved states are kept
+            (required for checkpoint_times and restore_time)
+        restore_time (float): Start from the state saved at this time (optional)
+        on_restore (callable): Called with the controller right after the state is
+            restored, e.g. to apply a what-if intervention (optional)
+        end_time (float): Stop at this time instead of the scenario's duration
+        workers (int): Number of processes routing the demand (the result does not
+            depend on it)
+
+    Returns:
+        dict: Run metrics
+    """
+    if (checkpoint_times or restore_time is not None) and checkpoint_cache is None:
+        raise ValueError("Checkpoints need a checkpoint cache")
+
+    os.makedirs(output_dir, exist_ok=True)
+    fingerprint = scenario_fingerprint(scenario, network_cache)
+    end_time = scenario.duration if end_time is None else end_time
+    controller = controller or TraciSimulationController()
+
+    restore_file = None
+    if restore_time is not None:
+        restore_file = checkpoint_cache.lookup(fingerprint, restore_time)
+        if restore_file is None:
+            run_scenario(scenario, os.path.join(output_dir, "warmup"), network_cache,
+                         scenario_cache, port, controller, [restore_time], checkpoint_cache,
+                         end_time=restore_time, workers=workers)
+            restore_file = checkpoint_cache.lookup(fingerprint, restore_time)
+            if restore_file is None:
+                raise RuntimeError(f"No simulation state was saved at {restore_time}s")
+
+    # States already in the cache need not be saved again
+    checkpoint_times = [
+        t for t in checkpoint_times
+        if checkpoint_cache.lookup(fingerprint, t) is None
+        and (restore_time is None or t > restore_time)
+    ]
+
+    route_file = os.path.join(output_dir, "routes.rou.xml")
+    cached_file = scenario_cache.lookupRoutes(fingerprint) if scenario_cache else None
+    if cached_file:
+        shutil.copyfile(cached_file, route_file)
+    else:
+        model = NetworkModel.load(scenario.network_file, cache=network_cache)
+        router = scenario_router(scenario, model, network_cache)
+        write_scenario_routes(scenario, route_file, router, workers=workers)
+        if scenario_cache:
+            scenario_cache.storeRoutes(fingerprint, route_file)
+
+    config_file = write_scenario_config(scenario, output_dir, route_file)
+
+    # Saving the random number generators makes a restored run continue
+    # exactly like the run the state was saved in
+    options = ["--save-state.rng"] if checkpoint_times else None
+    if not controller.connect(config_file, port, options):
+        raise RuntimeError("Failed to connect to SUMO via TraCI")
+
+    steps = 0
+    vehicle_steps = 0
+    peak_vehicles = 0
+    simulated_time = 0
+    start = time.time()
+    try:
+        if restore_file:
+            if not controller.loadState(restore_file):
+                raise RuntimeError(f"Could not restore the simulation state {restore_file}")
+            if on_restore:
+                on_restore(controller)
+        controller.setCheckpoints(checkpoint_times, os.path.join(output_dir, "checkpoints"))
+
+        while True:
+            running = controller.step()
+            steps += 1
+
+            vehicles = len(controller.getVehicles())
+            vehicle_steps += vehicles
+            peak_vehicles = max(peak_vehicles, vehicles)
+
+            simulated_time = controller.getSimulationTime()
+            if not running or simulated_time >= end_time:
+                break
+    finally:
+        controller.disconnect()
+        controller.setCheckpoints([], None)
+
+    for checkpoint_time, state_file in controller.checkpoints:
+        checkpoint_cache.store(fingerprint, checkpoint_time, state_file)
+
+    if controller.error:
+        raise RuntimeError(f"Simulation stopped at {simulated_time}s: {controller.error}")
+
+    metrics = {
+        "fingerprint": fingerprint,
+        "scenario": scenario._asdict(),
+        "restored_from": restore_time,
+        "steps": steps,
+        "simulated_time": simulated_time,
+        "wall_time": time.time() - start,
+        "peak_vehicles": peak_vehicles,
+        "mean_vehicles": vehicle_steps / steps if steps else 0,
+    }
+    metrics.update(tripinfo_metrics(os.path.join(output_dir, TRIPINFO_FILE)))
+    return metrics
+
+
+def branch_variants(scenario, branch_time, variants, output_dir, network_cache=None,
+                    scenario_cache=None, checkpoint_cache=None, port=8813):
+    """
+    Run what-if variants of a scenario that all start from one saved state
+
+    The scenario is simulated up to branch_time once (or not at all if
+    its state is cached), then each variant restores that state, applies
+    its intervention and runs to the end.
+
+    Args:
+        scenario (Scenario): The scenario
+        branch_time (float): Simulation time the variants branch at
+        variants (dict): Variant name -> callable taking the controller, applied
+            after the state is restored (None runs the scenario unchanged)
+        output_dir (str): Directory with one subdirectory per variant
+        network_cache (NetworkCache): Parsed network cache (optional)
+        scenario_cache (ScenarioCache): Cache of generated demand (optional)
+        checkpoint_cache (CheckpointCache): Where the branch state is kept
+        port (int): TraCI port for SUMO
+
+    Returns:
+        dict: Variant name -> run metrics
+    """
+    checkpoint_cache = checkpoint_cache or CheckpointCache()
+    results = {}
+    for name, intervention in variants.items():
+        metrics = run_scenario(
+            scenario, os.path.join(output_dir, name), network_cache, scenario_cache, port,
+            checkpoint_cache=checkpoint_cache, restore_time=branch_time, on_restore=intervention
+        )
+        metrics["variant"] = name
+        results[name] = metrics
+    return results
+
+
+def write_metrics(metrics, metrics_file):
+    """Write metrics as JSON to a file, or to stdout for '-'"""
+    if metrics_file == "-":
+        json.dump(metrics, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    directory = os.path.dirname(os.path.abspath(metrics_file))
+    os.makedirs(directory, exist_ok=True)
+    with open(metrics_file, 'w') as f:
+        json.dump(metrics, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sumo-dashboard-batch",
+        description="Run a SUMO dashboard scenario headless and write its metrics."
+    )
+    parser.add_argument("spec", help="scenario spec (JSON object with scenario.Scenario fields)")
+    parser.add_argument("-o", "--output-dir",
+                        help="directory for routes, configuration and SUMO outputs (default: a new temporary directory)")
+    parser.add_argument("-m", "--metrics",
+                        help="metrics file to write (default: <output-dir>/metrics.json, '-' for stdout)")
+    parser.add_argument("--seed", type=int, help="override the scenario seed")
+    parser.add_argument("--port", type=int, default=8813, help="TraCI port (default: 8813)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="processes routing the demand (default: 1)")
+    parser.add_argument("--checkpoint", type=float, action="append", default=[], metavar="TIME",
+                        help="save the simulation state at this time (repeatable)")
+    parser.add_argument("--restore", type=float, metavar="TIME",
+                        help="start from the state saved at this time instead of simulating up to it")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="simulate even if results for this scenario are cached")
+    args = parser.parse_args(argv)
+
+    try:
+        scenario = load_scenario(args.spec, seed=args.seed)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Invalid scenario spec {args.spec}: {e}", file=sys.stderr)
+        return EXIT_BAD_SPEC
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="sumo-batch-")
+    metrics_file = args.metrics or os.path.join(output_dir, "metrics.json")
+
+    network_cache = NetworkCache()
+    scenario_cache = ScenarioCache()
+    checkpoint_cache = CheckpointCache()
+
+    try:
+        fingerprint = scenario_fingerprint(scenario, network_cache)
+        # Restored runs only measure the time after the restore
+        result_key = fingerprint if args.restore is None else f"{fingerprint}-from-{args.restore:g}"
+        # A cached result would skip the run that saves the checkpoints
+        use_cache = not args.no_cache and not args.checkpoint
+        metrics = scenario_cache.lookupResult(result_key) if use_cache else None
+        if metrics is not None:
+            metrics["cached"] = True
+        else:
+            if not TRACI_AVAILABLE:
+                raise RuntimeError("TraCI is not available; set SUMO_HOME to your SUMO installation")
+            metrics = run_scenario(scenario, output_dir, network_cache, scenario_cache, args.port,
+                                   checkpoint_times=args.checkpoint,
+                                   checkpoint_cache=checkpoint_cache,
+                                   restore_time=args.restore, workers=args.workers)
+            scenario_cache.storeResult(result_key, metrics)
+            metrics["cached"] = False
+        write_metrics(metrics, metrics_file)
+    except Exception as e:
+        print(f"Scenario failed: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+import heapq
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Bump when the layout of the saved arrays changes
+HIERARCHY_FORMAT_VERSION = 2
+
+# Nodes settled by a witness search before it gives up (and adds the shortcut)
+WITNESS_SETTLE_LIMIT = 60
+
+# Arrays written by ContractionHierarchy.save
+HIERARCHY_ARRAYS = (
+    "rank", "up_offsets", "up_arcs", "down_offsets", "down_arcs",
+    "arc_source", "arc_target", "arc_weight", "arc_edge", "arc_first", "arc_second",
+)
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over the edge graph of a NetworkModel
+
+    The nodes are network edges and the arcs their connections, each
+    weighted by the edge it leads onto (the graph the Router searches).
+    Nodes are contracted one by one (least important first, by edge
+    difference), adding shortcut arcs wherever a shortest path ran through
+    the contracted node. A query is then a bidirectional Dijkstra that
+    only moves upwards in the hierarchy, which settles a few hundred
+    nodes even on large networks. Shortcuts remember the two arcs they
+    replace, so routes are unpacked back into network edges.
+
+    The arrays are saved as .npy files and can be memory-mapped, so
+    several processes can share one hierarchy.
+    """
+    def __init__(self, arrays, metric="time"):
+        """
+        Args:
+            arrays (dict): Arrays named in HIERARCHY_ARRAYS
+            metric (str): Edge weight the hierarchy was built for
+        """
+        self.metric = metric
+        self.arrays = arrays
+        for name in HIERARCHY_ARRAYS:
+            setattr(self, name, arrays[name])
+        self._lists = None
+
+    @classmethod
+    def build(cls, model, weights, metric="time"):
+        """
+        Contract the edge graph of a network
+
+        Args:
+            model (NetworkModel): The network
+            weights (numpy.ndarray): Weight of every edge row
+            metric (str): Name of the weight, stored with the hierarchy
+
+        Returns:
+            ContractionHierarchy: The hierarchy
+        """
+        node_count = model.edge_count
+        weights = np.asarray(weights, dtype=np.float64).tolist()
+        next_offsets = model.next_offsets.tolist()
+        next_edges = model.next_edges.tolist()
+
+        arc_source, arc_target, arc_weight = [], [], []
+        arc_edge, arc_first, arc_second = [], [], []
+
+        def add_arc(source, target, weight, edge=-1, first=-1, second=-1):
+            arc_source.append(source)
+            arc_target.append(target)
+            arc_weight.append(weight)
+            arc_edge.append(edge)
+            arc_first.append(first)
+            arc_second.append(second)
+            return len(arc_source) - 1
+
+        # Remaining graph: out_adj[u][w] = (weight, arc); an original arc
+        # u -> w costs the weight of edge w and remembers it as arc_edge
+        out_adj = [dict() for _ in range(node_count)]
+        in_adj = [dict() for _ in range(node_count)]
+        for source in range(node_count):
+            for i in range(next_offsets[source], next_offsets[source + 1]):
+                target = next_edges[i]
+                if target == source or target in out_adj[source]:
+                    continue
+                arc = add_arc(source, target, weights[target], edge=target)
+                out_adj[source][target] = (weights[target], arc)
+                in_adj[target][source] = (weights[target], arc)
+
+        def witness_costs(source, avoid, max_cost, targets):
+            """Costs of short paths from source that do not pass avoid (final once all targets are settled)"""
+            costs = {source: 0.0}
+            heap = [(0.0, source)]
+            remaining = set(targets)
+            settled = 0
+            while heap and remaining and settled < WITNESS_SETTLE_LIMIT:
+                cost, node = heapq.heappop(heap)
+                if cost > costs.get(node, math.inf):
+                    continue
+                if cost > max_cost:
+                    break
+                remaining.discard(node)
+                settled += 1
+                for neighbour, (weight, _) in out_adj[node].items():
+                    if neighbour == avoid:
+                        continue
+                    new_cost = cost + weight
+                    if new_cost < costs.get(neighbour, math.inf):
+                        costs[neighbour] = new_cost
+                        heapq.heappush(heap, (new_cost, neighbour))
+            return costs
+
+        def shortcuts(node):
+            """Shortcuts needed to contract node, as (source, target, weight, first, second)"""
+            needed = []
+            outgoing = out_adj[node]
+            if not outgoing:
+                return needed
+            max_out = max(weight for weight, _ in outgoing.values())
+            for source, (in_weight, in_arc) in in_adj[node].items():
+                costs = witness_costs(source, node, in_weight + max_out, outgoing)
+                for target, (out_weight, out_arc) in outgoing.items():
+                    if target == source:
+                        continue
+                    via_cost = in_weight + out_weight
+                    if costs.get(target, math.inf) > via_cost:
+                        needed.append((source, target, via_cost, in_arc, out_arc))
+            return needed
+
+        contracted_neighbours = [0] * node_count
+
+        def priority(node, needed):
+            degree = len(in_adj[node]) + len(out_adj[node])
+            return len(needed) - degree + contracted_neighbours[node]
+
+        heap = [(priority(node, shortcuts(node)), node) for node in range(node_count)]
+        heapq.heapify(heap)
+
+        rank = [0] * node_count
+        up = [None] * node_count
+        down = [None] * node_count
+        next_rank = 0
+
+        while heap:
+            _, node = heapq.heappop(heap)
+
+            # Lazy update: contract only if still (about) the least important
+            needed = shortcuts(node)
+            current = priority(node, needed)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, node))
+                continue
+
+            for source, target, weight, first, second in needed:
+                existing = out_adj[source].get(target)
+                if existing is None or weight < existing[0]:
+                    arc = add_arc(source, target, weight, first=first, second=second)
+                    out_adj[source][target] = (weight, arc)
+                    in_adj[target][source] = (weight, arc)
+
+            # All remaining neighbours are contracted later, i.e. rank higher
+            up[node] = [arc for _, arc in out_adj[node].values()]
+            down[node] = [arc for _, arc in in_adj[node].values()]
+
+            for source in in_adj[node]:
+                del out_adj[source][node]
+                contracted_neighbours[source] += 1
+            for target in out_adj[node]:
+                del in_adj[target][node]
+                contracted_neighbours[target] += 1
+            out_adj[node] = {}
+            in_adj[node] = {}
+
+            rank[node] = next_rank
+            next_rank += 1
+
+        up_offsets, up_arcs = _flatten(up)
+        down_offsets, down_arcs = _flatten(down)
+        arrays = {
+            "rank": np.array(rank, dtype=np.int64),
+            "up_offsets": up_offsets,
+            "up_arcs": up_arcs,
+            "down_offsets": down_offsets,
+            "down_arcs": down_arcs,
+            "arc_source": np.array(arc_source, dtype=np.int64),
+            "arc_target": np.array(arc_target, dtype=np.int64),
+            "arc_weight": np.array(arc_weight, dtype=np.float64),
+            "arc_edge": np.array(arc_edge, dtype=np.int64),
+            "arc_first": np.array(arc_first, dtype=np.int64),
+            "arc_second": np.array(arc_second, dtype=np.int64),
+        }
+        return cls(arrays, metric)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a saved hierarchy
+
+        Args:
+            directory (str): Directory written by save
+            mmap (bool): Memory-map the arrays instead of reading them
+
+        Returns:
+            ContractionHierarchy: The hierarchy, or None if the directory is missing or outdated
+        """
+        try:
+            with open(os.path.join(directory, "meta.json"), 'r') as f:
+                meta = json.load(f)
+            if meta.get("version") != HIERARCHY_FORMAT_VERSION:
+                return None
+            arrays = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                for name in HIERARCHY_ARRAYS
+            }
+        except (OSError, ValueError):
+            return None
+        return cls(arrays, meta.get("metric", "time"))
+
+    def save(self, directory):
+        """
+        Write the hierarchy as one .npy file per array
+
+        The files are written to a temporary directory that is then renamed
+        to directory, so load never sees a partly written hierarchy. If
+        another process saved a valid hierarchy there first, it is kept.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(directory) + ".tmp")
+        try:
+            for name in HIERARCHY_ARRAYS:
+                np.save(os.path.join(temp_dir, f"{name}.npy"), np.asarray(self.arrays[name]))
+            with open(os.path.join(temp_dir, "meta.json"), 'w') as f:
+                json.dump({"version": HIERARCHY_FORMAT_VERSION, "metric": self.metric}, f)
+
+            try:
+                os.replace(temp_dir, directory)
+            except OSError:
+                # The directory exists: keep a valid one, replace an outdated one
+                if ContractionHierarchy.load(directory) is not None:
+                    return
+                shutil.rmtree(directory, ignore_errors=True)
+                os.replace(temp_dir, directory)
+        finally:
+            if os.path.isdir(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def query(self, source, target):
+        """
+        Find the best path between two edges
+
+        Args:
+            source (int): Edge row to start from
+            target (int): Edge row to reach
+
+        Returns:
+            list: Edge rows from source to target, or None if target is unreachable
+        """
+        if source == target:
+            return [source]
+
+        lists = self._searchLists()
+        arc_weight = lists["arc_weight"]
+        # (arcs the search follows, arcs from higher nodes into a node that
+        # prove it is reached more cheaply from above), each as offsets,
+        # arcs and the endpoint of an arc away from the node
+        up = (lists["up_offsets"], lists["up_arcs"], lists["arc_target"])
+        down = (lists["down_offsets"], lists["down_arcs"], lists["arc_source"])
+        searches = ((up, down), (down, up))
+
+        best = ({source: 0.0}, {target: 0.0})
+        parent = ({}, {})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        shortest = math.inf
+        meeting = None
+
+        # Both searches only go upwards, so each runs until its smallest
+        # key can no longer improve the best connection found
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                heap = heaps[side]
+                if not heap:
+                    continue
+                cost, node = heapq.heappop(heap)
+                if cost > best[side].get(node, math.inf):
+                    continue
+                if cost >= shortest:
+                    heap.clear()
+                    continue
+
+                other_cost = best[1 - side].get(node)
+                if other_cost is not None and cost + other_cost < shortest:
+                    shortest = cost + other_cost
+                    meeting = node
+
+                (offsets, arcs, endpoint), (stall_offsets, stall_arcs, stall_endpoint) = searches[side]
+
+                # Stall on demand: a node reached more cheaply through a higher
+                # node is not on a shortest up-path, so it is not expanded
+                if any(best[side].get(stall_endpoint[stall_arcs[i]], math.inf) + arc_weight[stall_arcs[i]] < cost
+                       for i in range(stall_offsets[node], stall_offsets[node + 1])):
+                    continue
+
+                for i in range(offsets[node], offsets[node + 1]):
+                    arc = arcs[i]
+                    neighbour = endpoint[arc]
+                    new_cost = cost + arc_weight[arc]
+                    if new_cost < best[side].get(neighbour, math.inf):
+                        best[side][neighbour] = new_cost
+                        parent[side][neighbour] = arc
+                        heapq.heappush(heap, (new_cost, neighbour))
+
+        if meeting is None:
+            return None
+
+        # Arcs from source up to the meeting node, then down to target
+        path_arcs = []
+        node = meeting
+        while node != source:
+            arc = parent[0][node]
+            path_arcs.append(arc)
+            node = lists["arc_source"][arc]
+        path_arcs.reverse()
+
+        node = meeting
+        while node != target:
+            arc = parent[1][node]
+            path_arcs.append(arc)
+            node = lists["arc_target"][arc]
+
+        return [source] + self._unpack(path_arcs)
+
+    def _unpack(self, arcs):
+        """Expand shortcut arcs into the network edges they lead onto"""
+        lists = self._searchLists()
+        arc_edge, arc_first, arc_second = lists["arc_edge"], lists["arc_first"], lists["arc_second"]
+
+        edges = []
+        stack = list(reversed(arcs))
+        while stack:
+            arc = stack.pop()
+            if arc_edge[arc] >= 0:
+                edges.append(arc_edge[arc])
+            else:
+                stack.append(arc_second[arc])
+                stack.append(arc_first[arc])
+        return edges
+
+    def _searchLists(self):
+        """Plain list copies of the arrays (indexing lists is much faster in the search loop)"""
+        if self._lists is None:
+            self._lists = {name: np.asarray(self.arrays[name]).tolist() for name in HIERARCHY_ARRAYS}
+        return self._lists
+
+
+def _flatten(groups):
+    """Turn per-node arc lists into CSR offsets and values"""
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(group) for group in groups])
+    values = np.array([arc for group in groups for arc in group], dtype=np.int64)
+    return offsets, values
+
+
+def load_or_build_hierarchy(model, weights, metric="time", cache=None):
+    """
+    Get the contraction hierarchy of a network, building it if needed
+
+    With a NetworkCache, hierarchies are stored in the cache directory
+    next to the parsed network and keyed by the network's content hash,
+    vehicle class and metric. They count towards the cache's size limit
+    and are evicted with its least recently used entries.
+
+    Args:
+        model (NetworkModel): The network
+        weights (numpy.ndarray): Weight of every edge row
+        metric (str): Name of the weight
+        cache (NetworkCache): Network cache to persist the hierarchy in (optional)
+
+    Returns:
+        ContractionHierarchy: The hierarchy
+    """
+    directory = None
+    if cache and model.network_file:
+        directory = cache.hierarchyDir(model.network_file, model.vclass, metric)
+        hierarchy = ContractionHierarchy.load(directory)
+        if hierarchy is not None:
+            cache.touch(directory)
+            return hierarchy
+
+    hierarchy = ContractionHierarchy.build(model, weights, metric)
+
+    if directory:
+        try:
+            hierarchy.save(directory)
+            cache.evict()
+        except OSError as e:
+            print(f"Could not save contraction hierarchy {directory}: {e}")
+
+    return hierarchy
@@ -0,0 +1,295 @@
+import math
+
+import numpy as np
+
+from xml_stream import XMLStreamWriter
+
+# Vehicle type written to generated route files
+DEFAULT_VTYPE = {
+    "id": "car",
+    "accel": "2.6",
+    "decel": "4.5",
+    "sigma": "0.5",
+    "length": "5.0",
+    "maxSpeed": "50.0",
+}
+
+# Rush hour demand is concentrated in this part of the simulation window
+RUSH_HOUR_WINDOW = (0.3, 0.7)
+
+# Number of piecewise constant flows approximating a normal distribution
+NORMAL_FLOW_BINS = 12
+
+# Highest per-second insertion probability of a single flow; Bernoulli
+# insertions only look like Poisson arrivals while this stays small
+MAX_FLOW_PROBABILITY = 0.5
+
+# Vehicles rendered per join when writing route files
+VEHICLE_CHUNK_SIZE = 50000
+
+# Demand modes: one element per vehicle, or <flow> elements whose size does
+# not depend on the number of vehicles
+DEMAND_MODES = ("vehicles", "flows")
+
+
+def normalize_distribution(distribution):
+    """Map a distribution name or combo box label ("Rush Hour") to its key ("rush_hour")"""
+    return distribution.strip().lower().replace(" ", "_")
+
+
+def departure_times(vehicle_count, start_time, end_time, distribution="uniform", rng=None):
+    """
+    Draw the departure times of all vehicles at once
+
+    Args:
+        vehicle_count (int): Number of vehicles
+        start_time (float): Start of the demand window in seconds
+        end_time (float): End of the demand window in seconds
+        distribution (str): 'uniform', 'poisson', 'normal' or 'rush_hour'
+        rng (numpy.random.Generator): Random generator (optional)
+
+    Returns:
+        numpy.ndarray: Sorted departure times, as SUMO expects them
+    """
+    rng = rng or np.random.default_rng()
+    distribution = normalize_distribution(distribution)
+    span = end_time - start_time
+    steps = np.arange(vehicle_count, dtype=np.float64)
+
+    if distribution == "poisson":
+        # Arrivals of a Poisson process with a known count are uniformly
+        # distributed over the window
+        departs = rng.uniform(start_time, end_time, vehicle_count)
+    elif distribution == "normal":
+        departs = rng.normal(loc=start_time + span / 2, scale=span / 6, size=vehicle_count)
+    elif distribution == "rush_hour":
+        rush_start = start_time + span * RUSH_HOUR_WINDOW[0]
+        rush_end = start_time + span * RUSH_HOUR_WINDOW[1]
+        departs = rush_start + steps * ((rush_end - rush_start) / max(vehicle_count, 1))
+    else:
+        # Uniform, also used for unknown distributions
+        departs = start_time + steps * (span / max(vehicle_count, 1))
+
+    # Keep departures inside the simulated time
+    departs = np.clip(departs, start_time, max(start_time, end_time - 1))
+    departs.sort()
+    return departs
+
+
+def vehicle_elements(departs, route_ids, type_id="car", depart_pos="random", indent="    ", first_index=0):
+    """
+    Render <vehicle> elements for the given departure times
+
+    Args:
+        departs (numpy.ndarray): Sorted departure times
+        route_ids (list): Route of each vehicle
+        type_id (str): Vehicle type
+        depart_pos (str): departPos attribute
+        indent (str): Indentation of each element
+        first_index (int): Number in the ID of the first vehicle
+
+    Returns:
+        str: One element per line, built with a single join
+    """
+    middle = f'" type="{type_id}" route="'
+    tail = f'" departPos="{depart_pos}"/>\n'
+    return "".join([
+        f'{indent}<vehicle id="veh{i}{middle}{route_id}" depart="{depart:.2f}{tail}'
+        for i, (depart, route_id) in enumerate(zip(departs.tolist(), route_ids), first_index)
+    ])
+
+
+def flow_definitions(vehicle_count, start_time, end_time, distribution="uniform"):
+    """
+    Describe a demand as flows instead of individual vehicles
+
+    Uniform and rush hour demand become one flow with a fixed number of
+    evenly spaced vehicles, Poisson demand becomes a flow with a per-second
+    insertion rate (which can exceed 1 until split_flows divides it), and normal demand is approximated by piecewise
+    constant flows whose counts follow the distribution.
+
+    Args:
+        vehicle_count (int): Number of vehicles
+        start_time (float): Start of the demand window in seconds
+        end_time (float): End of the demand window in seconds
+        distribution (str): 'uniform', 'poisson', 'normal' or 'rush_hour'
+
+    Returns:
+        list: (begin, end, attribute, value) tuples sorted by begin, where
+            attribute is 'number' or 'probability'
+    """
+    distribution = normalize_distribution(distribution)
+    span = max(end_time - start_time, 1)
+
+    if distribution == "poisson":
+        # One flow with the total rate; split_flows keeps the per-flow
+        # probability below MAX_FLOW_PROBABILITY once it is spread over routes
+        return [(start_time, end_time, "probability", vehicle_count / span)]
+
+    if distribution == "normal":
+        bounds = np.linspace(start_time, end_time, NORMAL_FLOW_BINS + 1)
+        z = (bounds - (start_time + span / 2)) / (span / 6)
+        cdf = 0.5 * (1 + np.vectorize(math.erf)(z / math.sqrt(2)))
+        # Vehicles outside the window are clipped into the first and last bins
+        cdf[0], cdf[-1] = 0.0, 1.0
+        counts = _round_counts(np.diff(cdf) * vehicle_count, vehicle_count)
+        return [
+            (begin, end, "number", count)
+            for begin, end, count in zip(bounds[:-1].tolist(), bounds[1:].tolist(), counts.tolist())
+            if count > 0
+        ]
+
+    if distribution == "rush_hour":
+        begin = start_time + span * RUSH_HOUR_WINDOW[0]
+        end = start_time + span * RUSH_HOUR_WINDOW[1]
+        return [(begin, end, "number", vehicle_count)]
+
+    return [(start_time, end_time, "number", vehicle_count)]
+
+
+def _round_counts(expected, total):
+    """Round expected counts to integers that add up to total (largest remainder)"""
+    counts = np.floor(expected).astype(np.int64)
+    remainder = total - counts.sum()
+    if remainder > 0:
+        counts[np.argsort(counts - expected)[:remainder]] += 1
+    return counts
+
+
+def split_flows(flows, route_ids, shares):
+    """
+    Spread flow definitions over several routes
+
+    Probability flows are split over routes first, then each route's
+    flow is divided into as many parallel flows as its own rate needs
+    (SUMO inserts at most one vehicle per second and flow). The number
+    of flows thus stays near one per route whatever the demand size.
+
+    Args:
+        flows (list): Definitions from flow_definitions
+        route_ids (list): Route IDs
+        shares (numpy.ndarray): Fraction of the demand on each route
+
+    Returns:
+        list: (route_id, begin, end, attribute, value) tuples sorted by begin
+    """
+    routed = []
+    for begin, end, attribute, value in flows:
+        if attribute == "number":
+            values = _round_counts(shares * value, value).tolist()
+            routed.extend(
+                (route_id, begin, end, attribute, route_value)
+                for route_id, route_value in zip(route_ids, values)
+                if route_value > 0
+            )
+            continue
+
+        for route_id, rate in zip(route_ids, (shares * value).tolist()):
+            if rate <= 0:
+                continue
+            parallel = max(1, int(np.ceil(rate / MAX_FLOW_PROBABILITY)))
+            routed.extend([(route_id, begin, end, attribute, rate / parallel)] * parallel)
+    return routed
+
+
+def flow_attributes(flows, type_id="car", depart_pos="random"):
+    """
+    Get the attributes of the <flow> elements for the definitions from split_flows
+
+    Returns:
+        list: One attribute dict per flow
+    """
+    attributes = []
+    for i, (route_id, begin, end, attribute, value) in enumerate(flows):
+        attributes.append({
+            "id": f"flow{i}",
+            "type": type_id,
+            "route": route_id,
+            "begin": f"{begin:.2f}",
+            "end": f"{end:.2f}",
+            attribute: f"{value:.6f}" if attribute == "probability" else str(value),
+            "departPos": depart_pos,
+        })
+    return attributes
+
+
+def write_route_file(output_file, routes, departs=None, vehicle_routes=None, vtype=None, flows=None):
+    """
+    Write a route file
+
+    The file is streamed, and vehicles are rendered in chunks of
+    VEHICLE_CHUNK_SIZE, so memory use stays flat for any demand size.
+    Paths ending in .gz are gzip compressed.
+
+    Args:
+        output_file (str): Path to save the route file
+        routes (dict): Route IDs mapped to the edge IDs they follow
+        departs (numpy.ndarray): Sorted departure times, one per vehicle
+        vehicle_routes (numpy.ndarray): Index into routes of each vehicle
+            (all vehicles take the first route if omitted)
+        vtype (dict): Vehicle type attributes (defaults to DEFAULT_VTYPE)
+        flows (list): Flow definitions from split_flows, written instead
+            of individual vehicles (optional)
+
+    Returns:
+        str: Path to the created route file
+    """
+    vtype = vtype or DEFAULT_VTYPE
+    route_ids = list(routes)
+
+    with XMLStreamWriter(output_file) as writer:
+        writer.start("routes")
+        writer.element("vType", vtype)
+        for route_id, edges in routes.items():
+            writer.element("route", {"id": route_id, "edges": " ".join(edges)})
+
+        if flows is not None:
+            for attributes in flow_attributes(flows, vtype["id"]):
+                writer.element("flow", attributes)
+        else:
+            if vehicle_routes is None:
+                vehicle_routes = np.zeros(len(departs), dtype=np.int64)
+            for first in range(0, len(departs), VEHICLE_CHUNK_SIZE):
+                chunk = slice(first, first + VEHICLE_CHUNK_SIZE)
+                writer.raw(vehicle_elements(
+                    departs[chunk], [route_ids[i] for i in vehicle_routes[chunk].tolist()],
+                    vtype["id"], indent=writer.level(), first_index=first
+                ))
+
+        writer.end()
+
+    return output_file
+
+
+def generate_route_file(output_file, routes, vehicle_count, start_time, end_time,
+                        distribution="uniform", mode="vehicles", shares=None, rng=None):
+    """
+    Generate the demand for a route file in the given mode and write it
+
+    Args:
+        output_file (str): Path to save the route file
+        routes (dict): Route IDs mapped to the edge IDs they follow
+        vehicle_count (int): Number of vehicles
+        start_time (float): Start of the demand window in seconds
+        end_time (float): End of the demand window in seconds
+        distribution (str): 'uniform', 'poisson', 'normal' or 'rush_hour'
+        mode (str): 'vehicles' or 'flows' (see DEMAND_MODES)
+        shares (numpy.ndarray): Fraction of the vehicles on each route
+            (spread evenly if omitted)
+        rng (numpy.random.Generator): Random generator (optional)
+
+    Returns:
+        str: Path to the created route file
+    """
+    rng = rng or np.random.default_rng()
+    if shares is None:
+        shares = np.full(len(routes), 1.0 / len(routes))
+
+    if mode.strip().lower() == "flows":
+        flows = flow_definitions(vehicle_count, start_time, end_time, distribution)
+        flows = split_flows(flows, list(routes), shares)
+        return write_route_file(output_file, routes, flows=flows)
+
+    departs = departure_times(vehicle_count, start_time, end_time, distribution, rng)
+    vehicle_routes = rng.choice(len(routes), size=vehicle_count, p=shares)
+    return write_route_file(output_file, routes, departs, vehicle_routes)
@@ -6,13 +6,17 @@ from PyQt6.QtGui import QIcon, QFont, QColor, QPalette, QGuiApplication
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QSplitter, QMessageBox, QFileDialog,
                             QTabWidget, QToolBar, QStatusBar, QLabel,
-                            QDialog,QGraphicsView, QLineEdit, QFormLayout, QPushButton, QComboBox, QDoubleSpinBox)
-from PyQt6.QtGui import QAction
+                            QDialog,QGraphicsView, QLineEdit, QFormLayout, QPushButton, QComboBox, QDoubleSpinBox,
+                            QProgressBar)
+from PyQt6.QtGui import QAction, QKeySequence
 
 # Import our custom modules
 from network_editor import AdvancedNetworkEditor
 from vehicle_simulator import SimulationControlPanel, SimulationVisualization, TraciSimulationController, IntegratedSimulationVisualization
 from sumo_utils import SumoUtils
+from network_cache import NetworkCache, NetworkBuildCache
+from network_model import NetworkModel
+from sumo_jobs import NetconvertJob
 
 class MainWindow(QMainWindow):
     """Main application window with sci-fi theme"""
@@ -35,6 +39,13 @@ class MainWindow(QMainWindow):
             )
             # We'll continue anyway, but some functionality may be limited
         
+        # Parsed networks are cached on disk so reopening them is fast
+        self.network_cache = NetworkCache()
+        
+        # netconvert builds are reused while the exported network is unchanged
+        self.build_cache = NetworkBuildCache()
+        self.save_job = None  # Running NetconvertJob, if any
+        
         # Set up the central widget and layout
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -252,6 +263,16 @@ class MainWindow(QMainWindow):
         self.statusBar.addPermanentWidget(self.status_coords)
         self.statusBar.addPermanentWidget(self.status_simulation)
         
+        # Progress of background network builds (hidden while idle)
+        self.status_progress = QProgressBar()
+        self.status_progress.setMaximumWidth(150)
+        self.status_progress.hide()
+        self.status_cancel_btn = QPushButton("Cancel")
+        self.status_cancel_btn.clicked.connect(self.cancelSave)
+        self.status_cancel_btn.hide()
+        self.statusBar.addPermanentWidget(self.status_progress)
+        self.statusBar.addPermanentWidget(self.status_cancel_btn)
+        
         # Set initial message
         self.statusBar.showMessage("Ready")
     
@@ -316,11 +337,31 @@ class MainWindow(QMainWindow):
         edit_menu = menubar.addMenu("Edit")
         
         # Edit actions
+        undo_action = self.network_editor.undo_stack.createUndoAction(self, "Undo")
+        undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+        edit_menu.addAction(undo_action)
+        
+        redo_action = self.network_editor.undo_stack.createRedoAction(self, "Redo")
+        redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+        edit_menu.addAction(redo_action)
+        
+        edit_menu.addSeparator()
+        
         draw_action = QAction("Draw Mode", self)
         draw_action.setCheckable(True)
         draw_action.triggered.connect(self.toggleDrawMode)
         edit_menu.addAction(draw_action)
         
+        self.select_mode_action = QAction("Select Mode", self)
+        self.select_mode_action.setCheckable(True)
+        self.select_mode_action.setToolTip("Drag to select a rectangle, Alt+drag for a lasso")
+        self.select_mode_action.triggered.connect(self.toggleSelectMode)
+        edit_menu.addAction(self.select_mode_action)
+        
+        bulk_edit_action = QAction("Edit Selected Roads...", self)
+        bulk_edit_action.triggered.connect(self.network_editor.editSelectedEdges)
+        edit_menu.addAction(bulk_edit_action)
+        
         edit_menu.addSeparator()
         
         clear_action = QAction("Clear Network", self)
@@ -357,6 +398,12 @@ class MainWindow(QMainWindow):
         
         view_menu.addSeparator()
         
+        labels_action = QAction("Show Labels", self)
+        labels_action.setCheckable(True)
+        labels_action.setChecked(True)
+        labels_action.triggered.connect(self.network_editor.setLabelsVisible)
+        view_menu.addAction(labels_action)
+        
         # Help menu
         help_menu = menubar.addMenu("Help")
         
@@ -571,22 +618,23 @@ class MainWindow(QMainWindow):
             self,
             "Open Network",
             "",
-            "SUMO Network Files (*.net.xml);;All Files (*)"
+            "SUMO Network Files (*.net.xml *.net.xml.gz);;All Files (*)"
         )
         
         if file_path:
             try:
-                # Extract network data
-                nodes_data, edges_data = self.sumo_utils.extract_network_data(file_path)
+                # Parse the network once; the model is shared with the
+                # simulation panel and the visualization
+                model = NetworkModel.load(file_path, cache=self.network_cache)
                 
                 # Load into network editor
-                self.network_editor.importFromSumo(nodes_data, edges_data)
+                self.network_editor.importFromSumo(model.nodeTuples(), model.edgeTuples())
                 
                 # Update current network file
                 self.current_network_file = file_path
                 
                 # Set the network file for simulation
-                self.simulation_panel.setNetworkFile(file_path)
+                self.simulation_panel.setNetworkFile(file_path, model)
                 
                 # Update status
                 self.status_network.setText(f"Network: {os.path.basename(file_path)}")
@@ -625,30 +673,93 @@ class MainWindow(QMainWindow):
             self.saveNetworkToFile(file_path)
     
     def saveNetworkToFile(self, file_path):
-        """Save network to the specified file"""
+        """Save network to the specified file (netconvert runs in the background)"""
+        # A newer save replaces one that is still running
+        if self.save_job:
+            self.save_job.cancel()
+        
         try:
             # Get network data from editor
             nodes_data, edges_data = self.network_editor.exportToSumo()
             
-            # Use SumoUtils to save the network
-            self.sumo_utils.network_to_xml(nodes_data, edges_data, file_path)
-            
-            # Update current network file
-            self.current_network_file = file_path
-            
-            # Set the network file for simulation
-            self.simulation_panel.setNetworkFile(file_path)
-            
-            # Update status
-            self.status_network.setText(f"Network: {os.path.basename(file_path)}")
-            self.statusBar.showMessage(f"Saved network to {file_path}", 3000)
-        
+            # Use SumoUtils to plan the build, then run netconvert asynchronously
+            self.save_job = NetconvertJob(
+                self.sumo_utils, nodes_data, edges_data, file_path, cache=self.build_cache, parent=self
+            )
         except Exception as e:
+            self.save_job = None
             QMessageBox.critical(
                 self,
                 "Error Saving Network",
                 f"Failed to save network: {str(e)}"
             )
+            return
+        
+        job = self.save_job
+        job.progress.connect(self.onSaveProgress)
+        job.finished.connect(lambda path: self.onNetworkSaved(job, path))
+        job.failed.connect(lambda message: self.onNetworkSaveFailed(job, message))
+        job.cancelled.connect(lambda: self.onNetworkSaveCancelled(job))
+        
+        self.status_progress.setRange(0, 100)
+        self.status_progress.setValue(0)
+        self.status_progress.show()
+        self.status_cancel_btn.show()
+        self.statusBar.showMessage(f"Building network {os.path.basename(file_path)}...")
+        job.start()
+    
+    def onSaveProgress(self, percent, step):
+        """Show netconvert progress in the status bar"""
+        if percent < 0:
+            self.status_progress.setRange(0, 0)  # Busy indicator
+        else:
+            self.status_progress.setRange(0, 100)
+            self.status_progress.setValue(percent)
+        if step:
+            self.statusBar.showMessage(f"netconvert: {step}")
+    
+    def onNetworkSaved(self, job, file_path):
+        """Handle a finished network build"""
+        self.endSaveJob(job)
+        
+        # Update current network file
+        self.current_network_file = file_path
+        
+        # Set the network file for simulation
+        self.simulation_panel.setNetworkFile(file_path)
+        
+        # Update status
+        self.status_network.setText(f"Network: {os.path.basename(file_path)}")
+        self.statusBar.showMessage(f"Saved network to {file_path}", 3000)
+    
+    def onNetworkSaveFailed(self, job, message):
+        """Handle a failed network build"""
+        self.endSaveJob(job)
+        QMessageBox.critical(
+            self,
+            "Error Saving Network",
+            f"Failed to save network: {message}"
+        )
+    
+    def onNetworkSaveCancelled(self, job):
+        """Handle a cancelled network build"""
+        if self.endSaveJob(job):
+            self.statusBar.showMessage("Network save cancelled", 3000)
+    
+    def cancelSave(self):
+        """Cancel the running network build"""
+        if self.save_job:
+            self.save_job.cancel()
+    
+    def endSaveJob(self, job):
+        """Forget a finished save job; returns False if a newer one is already running"""
+        job.deleteLater()
+        if job is not self.save_job:
+            return False
+        self.save_job = None
+        self.status_progress.hide()
+        self.status_cancel_btn.hide()
+        return True
     
     def importSumoNetwork(self):
         """Import a SUMO network file"""
@@ -667,22 +778,38 @@ class MainWindow(QMainWindow):
         reply = QMessageBox.question(
             self,
             "Clear Network",
-            "Are you sure you want to clear the network? This cannot be undone.",
+            "Are you sure you want to clear the network? You can restore it with Edit > Undo.",
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
             QMessageBox.StandardButton.No
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            # Clear the network editor
-            self.network_editor.clear()
+            # Delete everything as a single undoable step
+            self.network_editor.deleteItems(self.network_editor.nodes + self.network_editor.edges)
             
             # Update status
             self.statusBar.showMessage("Network cleared", 3000)
     
+    def toggleSelectMode(self, checked):
+        """Toggle rectangle/lasso selection mode in the network editor"""
+        if checked:
+            # Selection and drawing are mutually exclusive
+            if self.draw_mode_active:
+                self.toggleDrawMode()
+            self.network_editor.enterSelectionMode()
+            self.statusBar.showMessage("Selection mode: drag to select, Alt+drag for a lasso")
+        else:
+            self.network_editor.exitSelectionMode()
+            self.statusBar.showMessage("Selection mode deactivated")
+    
     def toggleDrawMode(self):
         """Toggle drawing mode in the network editor"""
         self.draw_mode_active = not self.draw_mode_active
         
+        # Drawing mode replaces selection mode
+        if self.draw_mode_active:
+            self.select_mode_action.setChecked(False)
+        
         # Add a safety check to ensure network_editor exists
         if hasattr(self, 'network_editor'):
             if self.draw_mode_active:
@@ -843,11 +970,13 @@ class MainWindow(QMainWindow):
         # Store config file
         self.current_config_file = config_file
         
-        # Export network data for visualization
-        nodes_data, edges_data = self.network_editor.exportToSumo()
-        
-        # Pass network data to visualization component
-        self.simulation_viz.setNetworkData(edges_data, nodes_data)
+        # Show the network the simulation runs on, falling back to the
+        # editor contents if it could not be parsed
+        if self.simulation_panel.network_model is not None:
+            self.simulation_viz.setNetworkModel(self.simulation_panel.network_model)
+        else:
+            nodes_data, edges_data = self.network_editor.exportToSumo()
+            self.simulation_viz.setNetworkData(edges_data, nodes_data)
         
         # Connect simulation update signal
         if hasattr(self.simulation_panel, 'simulation_timer'):
@@ -0,0 +1,468 @@
+import hashlib
+import json
+import os
+import shutil
+from collections import namedtuple
+
+import numpy as np
+
+from sumo_utils import iter_network, JunctionRecord, EdgeRecord
+
+# Root directory for all on-disk caches (can be overridden with SUMO_DASHBOARD_CACHE)
+DEFAULT_CACHE_DIR = os.environ.get("SUMO_DASHBOARD_CACHE") or os.path.join(
+    os.path.expanduser("~"), ".cache", "sumo_scifi_dashboard"
+)
+
+# Bump when the layout of the cached arrays changes
+CACHE_FORMAT_VERSION = 2
+
+# Difference between an exported network and a previous build of it
+NetworkPatch = namedtuple("NetworkPatch", "base_file nodes removed_nodes edges removed_edges")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Compute the content hash of a file without reading it into memory at once
+
+    Args:
+        path (str): Path to the file
+        chunk_size (int): Number of bytes to hash per read
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def evict_files(directory, max_bytes, suffixes):
+    """
+    Delete the least recently used cache files until the directory fits in max_bytes
+
+    Files are ordered by modification time, which the caches bump whenever
+    an entry is used. Matching directories are entries too; they count
+    with the size of the files in them and are removed as a whole.
+
+    Args:
+        directory (str): Cache directory
+        max_bytes (int): Size limit for the matching files
+        suffixes (tuple): File name suffixes that belong to the cache
+    """
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffixes):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+            size = _directory_size(path) if os.path.isdir(path) else stat.st_size
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _directory_size(path):
+    """Total size of the files directly in a directory"""
+    with os.scandir(path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+
+def pack_records(junctions, edges, connections=()):
+    """
+    Convert junction, edge and connection records into flat arrays
+
+    Edge shapes are stored as one point array plus per-edge offsets into it.
+
+    Args:
+        junctions (list): JunctionRecord tuples
+        edges (list): EdgeRecord tuples
+        connections (list): ConnectionRecord tuples
+
+    Returns:
+        dict: Array name -> numpy array
+    """
+    shape_offsets = np.zeros(len(edges) + 1, dtype=np.int64)
+    shape_offsets[1:] = np.cumsum([len(edge.shape) for edge in edges])
+    shape_points = np.array(
+        [point for edge in edges for point in edge.shape], dtype=np.float64
+    ).reshape(-1, 2)
+
+    return {
+        "junction_ids": np.array([j.id for j in junctions], dtype=str),
+        "junction_xy": np.array([(j.x, j.y) for j in junctions], dtype=np.float64).reshape(-1, 2),
+        "junction_types": np.array([j.type for j in junctions], dtype=str),
+        "edge_ids": np.array([e.id for e in edges], dtype=str),
+        "edge_from": np.array([e.from_node or "" for e in edges], dtype=str),
+        "edge_to": np.array([e.to_node or "" for e in edges], dtype=str),
+        "edge_lanes": np.array([e.lanes for e in edges], dtype=np.int32),
+        "edge_speed": np.array([e.speed for e in edges], dtype=np.float64),
+        "edge_length": np.array([e.length for e in edges], dtype=np.float64),
+        "edge_function": np.array([e.function for e in edges], dtype=str),
+        "shape_offsets": shape_offsets,
+        "shape_points": shape_points,
+        "connection_from": np.array([c.from_edge for c in connections], dtype=str),
+        "connection_to": np.array([c.to_edge for c in connections], dtype=str),
+    }
+
+
+def unpack_records(arrays):
+    """Rebuild junction and edge records from the arrays written by pack_records"""
+    junctions = [
+        JunctionRecord(junction_id, x, y, junction_type)
+        for junction_id, (x, y), junction_type in zip(
+            arrays["junction_ids"].tolist(),
+            arrays["junction_xy"].tolist(),
+            arrays["junction_types"].tolist()
+        )
+    ]
+
+    offsets = arrays["shape_offsets"].tolist()
+    points = [tuple(point) for point in arrays["shape_points"].tolist()]
+    edges = [
+        EdgeRecord(edge_id, from_node or None, to_node or None, lanes, speed, length,
+                   function, tuple(points[offsets[i]:offsets[i + 1]]))
+        for i, (edge_id, from_node, to_node, lanes, speed, length, function) in enumerate(zip(
+            arrays["edge_ids"].tolist(),
+            arrays["edge_from"].tolist(),
+            arrays["edge_to"].tolist(),
+            arrays["edge_lanes"].tolist(),
+            arrays["edge_speed"].tolist(),
+            arrays["edge_length"].tolist(),
+            arrays["edge_function"].tolist()
+        ))
+    ]
+    return junctions, edges
+
+
+class NetworkCache:
+    """
+    On-disk cache of parsed SUMO networks
+
+    Parsed junctions, edges (including lanes and shapes) and connections
+    are stored as flat NumPy arrays in an uncompressed .npz file named
+    after the content hash of the network file. A small index maps
+    (path, size, mtime) to that hash, so reopening an unchanged file needs
+    neither hashing nor parsing. The cache is kept under max_bytes by
+    evicting the least recently used entries; index entries go with the
+    last cached network or hierarchy of their hash.
+    """
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "networks")
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(self.cache_dir, "index.json")
+
+    def load(self, network_file, vclass="passenger"):
+        """
+        Get the parsed junctions and edges of a network, parsing it only on a cache miss
+
+        Args:
+            network_file (str): Path to the .net.xml or .net.xml.gz file
+            vclass (str): Vehicle class filter passed to iter_network
+
+        Returns:
+            tuple: (junctions, edges) lists of JunctionRecord and EdgeRecord
+        """
+        return unpack_records(self.loadArrays(network_file, vclass))
+
+    def loadArrays(self, network_file, vclass="passenger"):
+        """
+        Get a parsed network in the flat array layout of pack_records
+
+        Args:
+            network_file (str): Path to the .net.xml or .net.xml.gz file
+            vclass (str): Vehicle class filter passed to iter_network
+
+        Returns:
+            dict: Array name -> numpy array
+        """
+        cache_file = self.cacheFile(network_file, vclass)
+
+        if os.path.exists(cache_file):
+            try:
+                with np.load(cache_file, allow_pickle=False) as npz:
+                    arrays = {name: npz[name] for name in npz.files}
+                # Mark as recently used for eviction
+                os.utime(cache_file)
+                return arrays
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Discarding unreadable network cache {cache_file}: {e}")
+                self._remove(cache_file)
+
+        junctions = []
+        edges = []
+        connections = []
+        for record in iter_network(network_file, vclass):
+            if isinstance(record, JunctionRecord):
+                junctions.append(record)
+            elif isinstance(record, EdgeRecord):
+                edges.append(record)
+            else:
+                connections.append(record)
+
+        arrays = pack_records(junctions, edges, connections)
+        self._store(cache_file, arrays)
+        return arrays
+
+    def contentHash(self, network_file):
+        """Get the content hash of a network file, reusing it while size and mtime are unchanged"""
+        path = os.path.abspath(network_file)
+        stat = os.stat(path)
+        index = self._readIndex()
+
+        entry = index.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["digest"]
+
+        digest = file_digest(path)
+        index[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest}
+        self._writeIndex(index)
+        return digest
+
+    def cacheFile(self, network_file, vclass="passenger"):
+        """Get the path of the cache entry for a network file and vehicle class"""
+        digest = self.contentHash(network_file)
+        return os.path.join(
+            self.cache_dir, f"{digest}-{vclass or 'all'}-v{CACHE_FORMAT_VERSION}.npz"
+        )
+
+    def hierarchyDir(self, network_file, vclass="passenger", metric="time"):
+        """Get the directory for the contraction hierarchy of a network (see contraction_hierarchy)"""
+        digest = self.contentHash(network_file)
+        return os.path.join(self.cache_dir, f"{digest}-{vclass or 'all'}-{metric}-ch")
+
+    def touch(self, path):
+        """Mark a cache entry (e.g. a hierarchy directory) as recently used"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Remove the least recently used networks and hierarchies beyond max_bytes"""
+        if os.path.isdir(self.cache_dir):
+            evict_files(self.cache_dir, self.max_bytes, (".npz", "-ch"))
+            self._pruneIndex()
+
+    def clear(self):
+        """Remove all cached networks and contraction hierarchies"""
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                # Hierarchies and the temporary directories they are written to
+                if name.endswith("-ch") or "-ch.tmp" in name:
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            evict_files(self.cache_dir, 0, (".npz", ".json"))
+
+    def _store(self, cache_file, arrays):
+        """Write parsed arrays to the cache (failures only cost a re-parse later)"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = cache_file + ".tmp"
+            with open(temp_file, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp_file, cache_file)
+            self.evict()
+        except OSError as e:
+            print(f"Could not write network cache {cache_file}: {e}")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _pruneIndex(self):
+        """Drop index entries whose content hash has no cached network or hierarchy left"""
+        try:
+            digests = {
+                name.split("-", 1)[0] for name in os.listdir(self.cache_dir)
+                if name.endswith((".npz", "-ch"))
+            }
+        except OSError:
+            return
+
+        index = self._readIndex()
+        kept = {path: entry for path, entry in index.items() if entry.get("digest") in digests}
+        if len(kept) < len(index):
+            self._writeIndex(kept)
+
+    def _readIndex(self):
+        try:
+            with open(self.index_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _writeIndex(self, index):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = self.index_file + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_file, self.index_file)
+        except OSError as e:
+            print(f"Could not write network cache index: {e}")
+
+
+class NetworkBuildCache:
+    """
+    Content-addressed cache of networks built by netconvert
+
+    A build is keyed by a hash of the exported node and edge tuples and
+    the netconvert command line, so saving or simulating an unchanged
+    network reuses the previous .net.xml instead of running netconvert
+    again. The cache is kept under max_bytes by evicting the least
+    recently used builds.
+    """
+    def __init__(self, cache_dir=None, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "builds")
+        self.max_bytes = max_bytes
+
+        # (key, command, nodes by ID, edges by ID) of the last successful build
+        self.last_build = None
+
+    def buildKey(self, nodes, edges, command):
+        """
+        Hash the inputs of a netconvert build
+
+        Args:
+            nodes (list): (id, x, y) tuples
+            edges (list): (id, from_node, to_node, lanes, speed) tuples
+            command (list): netconvert binary followed by the conversion options
+
+        Returns:
+            str: Hex digest identifying the build
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps(
+            [CACHE_FORMAT_VERSION, list(command), sorted(map(list, nodes)), sorted(map(list, edges))],
+            default=str
+        ).encode())
+
+        # Rebuild when netconvert itself is updated
+        try:
+            stat = os.stat(command[0])
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except (OSError, IndexError):
+            pass
+
+        return digest.hexdigest()
+
+    def buildFile(self, key):
+        """Get the path of the cached build for a key"""
+        return os.path.join(self.cache_dir, f"{key}.net.xml")
+
+    def lookup(self, key):
+        """
+        Get a cached build
+
+        Args:
+            key (str): Build key from buildKey
+
+        Returns:
+            str: Path to the cached .net.xml, or None on a miss
+        """
+        build_file = self.buildFile(key)
+        if not os.path.exists(build_file):
+            return None
+
+        try:
+            # Mark as recently used for eviction
+            os.utime(build_file)
+        except OSError:
+            return None
+        return build_file
+
+    def store(self, key, built_file):
+        """
+        Add a finished build to the cache
+
+        Args:
+            key (str): Build key from buildKey
+            built_file (str): The .net.xml written by netconvert
+
+        Returns:
+            str: Path to the cached copy, or None if it could not be written
+        """
+        build_file = self.buildFile(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = build_file + ".tmp"
+            shutil.copyfile(built_file, temp_file)
+            os.replace(temp_file, build_file)
+            evict_files(self.cache_dir, self.max_bytes, (".net.xml",))
+        except OSError as e:
+            print(f"Could not write network build cache {build_file}: {e}")
+            return None
+        return build_file if os.path.exists(build_file) else None
+
+    def recordBuild(self, key, nodes, edges, command):
+        """Remember a successful build as the base for incremental rebuilds"""
+        self.last_build = (
+            key,
+            list(command),
+            {node[0]: tuple(node) for node in nodes},
+            {edge[0]: tuple(edge) for edge in edges}
+        )
+
+    def changesSince(self, nodes, edges, command):
+        """
+        Diff a network against the last successful build
+
+        Args:
+            nodes (list): (id, x, y) tuples
+            edges (list): (id, from_node, to_node, lanes, speed) tuples
+            command (list): netconvert binary followed by the conversion options
+
+        Returns:
+            NetworkPatch: The changes and the base build to apply them to,
+                or None if there is no usable base build
+        """
+        if not self.last_build:
+            return None
+
+        key, base_command, base_nodes, base_edges = self.last_build
+        base_file = self.lookup(key)
+        if not base_file or base_command != list(command):
+            return None
+
+        node_map = {node[0]: tuple(node) for node in nodes}
+        edge_map = {edge[0]: tuple(edge) for edge in edges}
+
+        changed_nodes = [node for node_id, node in node_map.items() if base_nodes.get(node_id) != node]
+        moved = {node[0] for node in changed_nodes}
+
+        # Edges at moved junctions are redefined too, so netconvert
+        # recomputes their geometry
+        changed_edges = [
+            edge for edge_id, edge in edge_map.items()
+            if base_edges.get(edge_id) != edge or edge[1] in moved or edge[2] in moved
+        ]
+
+        return NetworkPatch(
+            base_file,
+            changed_nodes,
+            [node_id for node_id in base_nodes if node_id not in node_map],
+            changed_edges,
+            [edge_id for edge_id in base_edges if edge_id not in edge_map]
+        )
+
+    def clear(self):
+        """Remove all cached builds"""
+        if os.path.isdir(self.cache_dir):
+            evict_files(self.cache_dir, 0, (".net.xml", ".tmp"))
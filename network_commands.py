@@ -0,0 +1,150 @@
+from PyQt6.QtGui import QUndoCommand
+
+# The editor helpers used by these commands (_insertNode, _removeEdge, ...)
+# record what changed, so commands never emit network_changed themselves
+
+# Command IDs used by QUndoStack to decide which commands may be merged
+MOVE_NODES_COMMAND_ID = 1001
+
+
+class AddNodeCommand(QUndoCommand):
+    """
+    Adds a single node to the network
+    """
+    def __init__(self, editor, node_id, x, y):
+        super().__init__(f"Add Node {node_id}")
+        self.editor = editor
+        self.node_id = node_id
+        self.x = x
+        self.y = y
+
+    def redo(self):
+        self.editor._insertNode(self.node_id, self.x, self.y)
+
+    def undo(self):
+        node = self.editor.findNode(self.node_id)
+        if node:
+            self.editor._removeNode(node)
+
+
+class AddEdgeCommand(QUndoCommand):
+    """
+    Adds a single edge between two existing nodes
+    """
+    def __init__(self, editor, edge_id, source_id, target_id, lanes, speed):
+        super().__init__(f"Add Edge {edge_id}")
+        self.editor = editor
+        self.record = (edge_id, source_id, target_id, lanes, speed)
+
+    def redo(self):
+        self.editor._insertEdge(*self.record)
+
+    def undo(self):
+        edge = self.editor.findEdge(self.record[0])
+        if edge:
+            self.editor._removeEdge(edge)
+
+
+class DeleteElementsCommand(QUndoCommand):
+    """
+    Deletes a set of nodes and edges
+
+    Only plain (id, x, y) and (id, from, to, lanes, speed) records are kept,
+    the same tuples used by exportToSumo, so deleting a large part of the
+    network does not keep the removed graphics items alive in the history.
+    """
+    def __init__(self, editor, node_records, edge_records):
+        count = len(node_records) + len(edge_records)
+        super().__init__(f"Delete {count} Element(s)")
+        self.editor = editor
+        self.node_records = tuple(node_records)
+        self.edge_records = tuple(edge_records)
+
+    def redo(self):
+        # Edges go first so nodes are already disconnected when removed
+        for record in self.edge_records:
+            edge = self.editor.findEdge(record[0])
+            if edge:
+                self.editor._removeEdge(edge)
+        for record in self.node_records:
+            node = self.editor.findNode(record[0])
+            if node:
+                self.editor._removeNode(node)
+
+    def undo(self):
+        for node_id, x, y in self.node_records:
+            self.editor._insertNode(node_id, x, y)
+        for record in self.edge_records:
+            self.editor._insertEdge(*record)
+
+
+class MoveNodesCommand(QUndoCommand):
+    """
+    Moves one or more nodes
+
+    Consecutive moves of the same set of nodes (e.g. several drags of a
+    selection) are merged into a single history entry.
+    """
+    def __init__(self, editor, moves):
+        """
+        Args:
+            editor (AdvancedNetworkEditor): Editor owning the nodes
+            moves (dict): Maps node IDs to ((old_x, old_y), (new_x, new_y))
+        """
+        if len(moves) == 1:
+            super().__init__(f"Move Node {next(iter(moves))}")
+        else:
+            super().__init__(f"Move {len(moves)} Nodes")
+        self.editor = editor
+        self.moves = dict(moves)
+
+    def id(self):
+        return MOVE_NODES_COMMAND_ID
+
+    def mergeWith(self, other):
+        if other.moves.keys() != self.moves.keys():
+            return False
+
+        # Keep our original positions and take the latest target positions
+        for node_id, (_, new_pos) in other.moves.items():
+            self.moves[node_id] = (self.moves[node_id][0], new_pos)
+        return True
+
+    def redo(self):
+        self._apply(1)
+
+    def undo(self):
+        self._apply(0)
+
+    def _apply(self, index):
+        for node_id, positions in self.moves.items():
+            node = self.editor.findNode(node_id)
+            if node:
+                x, y = positions[index]
+                self.editor._setNodePosition(node, x, y)
+
+
+class EditEdgesCommand(QUndoCommand):
+    """
+    Changes the lanes and speed of one or more edges
+
+    Stored as a compact diff of (edge_id, old_lanes, old_speed, new_lanes,
+    new_speed) records rather than as a snapshot of the edges.
+    """
+    def __init__(self, editor, changes):
+        if len(changes) == 1:
+            super().__init__(f"Edit Edge {changes[0][0]}")
+        else:
+            super().__init__(f"Edit {len(changes)} Edges")
+        self.editor = editor
+        self.changes = tuple(changes)
+
+    def redo(self):
+        self.editor._setEdgeProperties(
+            (edge_id, lanes, speed) for edge_id, _, _, lanes, speed in self.changes
+        )
+
+    def undo(self):
+        self.editor._setEdgeProperties(
+            (edge_id, lanes, speed) for edge_id, lanes, speed, _, _ in self.changes
+        )
@@ -1,9 +1,118 @@
 from PyQt6.QtWidgets import (QGraphicsView, QGraphicsScene, QGraphicsItem, 
                            QGraphicsLineItem, QGraphicsEllipseItem, QMenu,
                            QDialog, QVBoxLayout, QFormLayout, QSpinBox, 
-                           QDoubleSpinBox, QDialogButtonBox, QLabel)
-from PyQt6.QtCore import Qt, QPointF, QRectF, QLineF, pyqtSignal
-from PyQt6.QtGui import QPen, QBrush, QColor, QPainterPath, QFont, QPolygonF, QPainter
+                           QDoubleSpinBox, QDialogButtonBox, QLabel, QCheckBox)
+from PyQt6.QtCore import Qt, QPointF, QLineF, QTimer, pyqtSignal
+from PyQt6.QtGui import (QPen, QBrush, QColor, QPainterPath, QFont, QPolygonF, QPainter,
+                         QUndoStack, QStaticText)
+
+from network_commands import (AddNodeCommand, AddEdgeCommand, DeleteElementsCommand,
+                              MoveNodesCommand, EditEdgesCommand)
+
+
+def _sceneEditor(item):
+    """Get the AdvancedNetworkEditor that owns the scene of an item"""
+    scene = item.scene()
+    return scene.parent() if scene else None
+
+
+class IdAllocator:
+    """
+    Hands out monotonically increasing IDs of the form "<prefix>_<n>"
+    
+    The counter never goes backwards, so IDs freed by a delete are not
+    handed out again, and it is bumped past any matching ID it observes
+    (e.g. from an imported network).
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.next_index = 0
+    
+    def observe(self, item_id):
+        """Make sure an existing ID is never handed out again"""
+        head, sep, tail = str(item_id).rpartition("_")
+        if sep and head == self.prefix and tail.isdigit():
+            self.next_index = max(self.next_index, int(tail) + 1)
+    
+    def allocate(self, taken=()):
+        """Get the next free ID, skipping any that are in taken"""
+        while True:
+            item_id = f"{self.prefix}_{self.next_index}"
+            self.next_index += 1
+            if item_id not in taken:
+                return item_id
+    
+    def reset(self):
+        """Start counting from zero again"""
+        self.next_index = 0
+
+
+class NetworkChangeSet:
+    """
+    IDs of the nodes and edges added, removed or modified since the last
+    network_changed signal
+    
+    Changes that cancel out are folded together: an element added and then
+    removed again before the signal fires does not appear at all, and one
+    removed and added again is reported as modified.
+    """
+    def __init__(self, cleared=False):
+        self.cleared = cleared  # True if the whole network was reset first
+        self.added_nodes = set()
+        self.removed_nodes = set()
+        self.modified_nodes = set()
+        self.added_edges = set()
+        self.removed_edges = set()
+        self.modified_edges = set()
+    
+    def isEmpty(self):
+        """Check whether nothing has changed"""
+        return not (self.cleared or self.added_nodes or self.removed_nodes or
+                    self.modified_nodes or self.added_edges or self.removed_edges or
+                    self.modified_edges)
+    
+    def addNode(self, node_id):
+        self._add(node_id, self.added_nodes, self.removed_nodes, self.modified_nodes)
+    
+    def removeNode(self, node_id):
+        self._remove(node_id, self.added_nodes, self.removed_nodes, self.modified_nodes)
+    
+    def modifyNode(self, node_id):
+        if node_id not in self.added_nodes:
+            self.modified_nodes.add(node_id)
+    
+    def addEdge(self, edge_id):
+        self._add(edge_id, self.added_edges, self.removed_edges, self.modified_edges)
+    
+    def removeEdge(self, edge_id):
+        self._remove(edge_id, self.added_edges, self.removed_edges, self.modified_edges)
+    
+    def modifyEdge(self, edge_id):
+        if edge_id not in self.added_edges:
+            self.modified_edges.add(edge_id)
+    
+    @staticmethod
+    def _add(item_id, added, removed, modified):
+        if item_id in removed:
+            removed.discard(item_id)
+            modified.add(item_id)
+        else:
+            added.add(item_id)
+    
+    @staticmethod
+    def _remove(item_id, added, removed, modified):
+        if item_id in added:
+            added.discard(item_id)
+        else:
+            modified.discard(item_id)
+            removed.add(item_id)
+    
+    def __repr__(self):
+        return (f"NetworkChangeSet(nodes +{len(self.added_nodes)} -{len(self.removed_nodes)} "
+                f"~{len(self.modified_nodes)}, edges +{len(self.added_edges)} "
+                f"-{len(self.removed_edges)} ~{len(self.modified_edges)}"
+                f"{', cleared' if self.cleared else ''})")
+
 
 class Node(QGraphicsEllipseItem):
     """
@@ -15,17 +124,20 @@ class Node(QGraphicsEllipseItem):
         self.x = x
         self.y = y
         
+        # Position the node was created at; moves are stored as an offset (pos)
+        self.origin = QPointF(x, y)
+        
         # Set sci-fi style
         self.setPen(QPen(QColor("#00FFFF"), 2))
         self.setBrush(QBrush(QColor(0, 255, 255, 100)))
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable, True)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
         
         # Store path for glow effect to be added after the node is added to the scene
         self.glow_path = QPainterPath()
         self.glow_path.addEllipse(x - 12, y - 12, 24, 24)
         self.glow = None
-        self.label = None
         
         # Connected edges
         self.edges = []
@@ -46,23 +158,26 @@ class Node(QGraphicsEllipseItem):
     def itemChange(self, change, value):
         """Handle movement and selection changes"""
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            # Update center position (value is the new offset from the origin)
+            self.x = self.origin.x() + value.x()
+            self.y = self.origin.y() + value.y()
+            
             # Update connected edges
             for edge in self.edges:
                 edge.updatePosition()
             
-            # Update center position
-            self.x = self.x() + 8
-            self.y = self.y() + 8
-            
             # Update glow position if it exists
             if self.glow:
                 glow_path = QPainterPath()
                 glow_path.addEllipse(self.x - 12, self.y - 12, 24, 24)
                 self.glow.setPath(glow_path)
             
-            # Update label position if it exists
-            if self.label:
-                self.label.setPos(self.x + 10, self.y - 10)
+            # Labels are painted by the editor overlay, so repaint it
+            editor = _sceneEditor(self)
+            if editor:
+                editor.viewport().update()
+                editor._pending_changes.modifyNode(self.node_id)
+                editor._scheduleChangeSignal()
             
         elif change == QGraphicsItem.GraphicsItemChange.ItemSelectedHasChanged:
             # Highlight when selected
@@ -87,22 +202,8 @@ class Node(QGraphicsEllipseItem):
         action = menu.exec(event.screenPos())
         
         if action == delete_action:
-            # Remove edges first
-            for edge in self.edges.copy():  # Copy because we'll modify during iteration
-                self.scene().removeItem(edge)
-                if edge.source_node:
-                    edge.source_node.removeEdge(edge)
-                if edge.target_node:
-                    edge.target_node.removeEdge(edge)
-            
-            # Remove node elements if they exist
-            if self.glow and self.glow in self.scene().items():
-                self.scene().removeItem(self.glow)
-            if self.label and self.label in self.scene().items():
-                self.scene().removeItem(self.label)
-            
-            # Remove the node itself
-            self.scene().removeItem(self)
+            # Delete through the editor so the change can be undone
+            _sceneEditor(self).deleteItems([self])
         
         elif action == edit_action:
             # Show properties dialog
@@ -149,7 +250,6 @@ class Edge(QGraphicsLineItem):
         self.edge_id = edge_id or f"edge_{id(self)}"
         self.lanes = lanes
         self.speed = speed  # m/s (default ~50 km/h)
-        self.label = None
         self.lane_indicators = []
         
         # Connect to nodes
@@ -170,16 +270,13 @@ class Edge(QGraphicsLineItem):
         """Update edge position based on connected nodes"""
         if self.source_node and self.target_node:
             self.setLine(QLineF(self.source_node.center(), self.target_node.center()))
-            if hasattr(self, 'label') and self.label:
-                self.updateLabelPosition()
             if hasattr(self, 'lane_indicators') and self.scene():
                 self.updateLaneIndicators()
     
-    def updateLabelPosition(self):
-        """Update label position to middle of the edge"""
-        if self.label and self.source_node and self.target_node:
-            center = self.line().center()
-            self.label.setPos(center.x() + 5, center.y() - 15)
+    def labelPosition(self):
+        """Get the position of the ID label, next to the middle of the edge"""
+        center = self.line().center()
+        return QPointF(center.x() + 5, center.y() - 15)
     
     def updateStyle(self):
         """Update visual style based on edge properties"""
@@ -205,7 +302,7 @@ class Edge(QGraphicsLineItem):
             
         # Remove old indicators
         for indicator in self.lane_indicators:
-            if indicator in self.scene().items():
+            if indicator.scene():
                 self.scene().removeItem(indicator)
         self.lane_indicators.clear()
         
@@ -278,26 +375,21 @@ class Edge(QGraphicsLineItem):
         delete_action = menu.addAction("Delete Edge")
         edit_action = menu.addAction("Edit Properties")
         
+        # Offer a bulk edit when this edge is part of a multi-selection
+        editor = _sceneEditor(self)
+        selected_edges = editor.selectedEdges() if self.isSelected() else []
+        bulk_action = None
+        if len(selected_edges) > 1:
+            bulk_action = menu.addAction(f"Edit Selected Edges ({len(selected_edges)})")
+        
         action = menu.exec(event.screenPos())
         
         if action == delete_action:
-            # Disconnect from nodes
-            if self.source_node:
-                self.source_node.removeEdge(self)
-            if self.target_node:
-                self.target_node.removeEdge(self)
-            
-            # Remove lane indicators
-            for indicator in self.lane_indicators:
-                if indicator in self.scene().items():
-                    self.scene().removeItem(indicator)
-            
-            # Remove label if it exists
-            if self.label and self.label in self.scene().items():
-                self.scene().removeItem(self.label)
-            
-            # Remove self
-            self.scene().removeItem(self)
+            # Delete through the editor so the change can be undone
+            editor.deleteItems([self])
+        
+        elif bulk_action and action == bulk_action:
+            editor.editSelectedEdges()
         
         elif action == edit_action:
             # Show properties dialog
@@ -332,19 +424,63 @@ class Edge(QGraphicsLineItem):
             main_layout.addWidget(buttons)
             
             if dialog.exec() == QDialog.DialogCode.Accepted:
-                self.lanes = lanes_spin.value()
-                self.speed = speed_spin.value()
-                self.updateStyle()
-                self.updateLaneIndicators()
+                _sceneEditor(self).setEdgeProperties(self, lanes_spin.value(), speed_spin.value())
+
+
+class BulkEdgeEditDialog(QDialog):
+    """
+    Dialog for changing the lanes and/or speed limit of many edges at once
+    """
+    def __init__(self, edge_count, lanes=1, speed=13.89, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Edit Selected Edges")
+        layout = QFormLayout()
+        
+        layout.addRow(QLabel(f"Selected edges: {edge_count}"))
+        
+        # Number of lanes (only applied when checked)
+        self.set_lanes = QCheckBox("Set lanes")
+        self.lanes_spin = QSpinBox()
+        self.lanes_spin.setRange(1, 6)
+        self.lanes_spin.setValue(lanes)
+        self.lanes_spin.setEnabled(False)
+        self.set_lanes.toggled.connect(self.lanes_spin.setEnabled)
+        layout.addRow(self.set_lanes, self.lanes_spin)
+        
+        # Speed limit (only applied when checked)
+        self.set_speed = QCheckBox("Set speed limit")
+        self.speed_spin = QDoubleSpinBox()
+        self.speed_spin.setRange(5, 50)  # 5-50 m/s (18-180 km/h)
+        self.speed_spin.setValue(speed)
+        self.speed_spin.setSuffix(" m/s")
+        self.speed_spin.setEnabled(False)
+        self.set_speed.toggled.connect(self.speed_spin.setEnabled)
+        layout.addRow(self.set_speed, self.speed_spin)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | 
+                                  QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        
+        main_layout = QVBoxLayout(self)
+        main_layout.addLayout(layout)
+        main_layout.addWidget(buttons)
+    
+    def values(self):
+        """Get the (lanes, speed) to apply; None means leave unchanged"""
+        lanes = self.lanes_spin.value() if self.set_lanes.isChecked() else None
+        speed = self.speed_spin.value() if self.set_speed.isChecked() else None
+        return lanes, speed
 
 
 class AdvancedNetworkEditor(QGraphicsView):
     """
     Enhanced network editor for SUMO with sci-fi styling and advanced features
     """
-    network_changed = pyqtSignal()  # Signal when network is modified
+    # Emitted (debounced) when the network is modified, with a NetworkChangeSet
+    network_changed = pyqtSignal(object)
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, history_depth=200, change_delay=50):
         super().__init__(parent)
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
@@ -361,10 +497,37 @@ class AdvancedNetworkEditor(QGraphicsView):
         
         # Initialize drawing attributes
         self.drawing_mode = False
+        self.selection_mode = False
+        self._lasso_path = None
+        self._lasso_item = None
         self.temp_start_node = None
         self.temp_line = None
-        self.nodes = []
-        self.edges = []
+        
+        # ID -> item maps for constant time lookups, plus ID generators
+        self.node_index = {}
+        self.edge_index = {}
+        self.node_ids = IdAllocator("node")
+        self.edge_ids = IdAllocator("edge")
+        
+        # Undo/redo history; every mutation goes through a command on this stack
+        self.undo_stack = QUndoStack(self)
+        self.undo_stack.setUndoLimit(history_depth)
+        self._drag_origins = {}
+        
+        # Node and edge IDs are painted by a single overlay (see drawForeground)
+        # instead of one text item per element
+        self.show_labels = True
+        self.label_zoom_threshold = 0.75  # Minimum view scale at which labels are drawn
+        self.label_font = QFont("Arial", 8)
+        self._label_cache = {}  # Label text -> QStaticText
+        
+        # Changes are collected and reported in one network_changed signal
+        # at most change_delay ms after the first of them
+        self._pending_changes = NetworkChangeSet()
+        self._change_timer = QTimer(self)
+        self._change_timer.setSingleShot(True)
+        self._change_timer.setInterval(change_delay)
+        self._change_timer.timeout.connect(self.flushChanges)
         
         # Set up viewport
         self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
@@ -374,6 +537,16 @@ class AdvancedNetworkEditor(QGraphicsView):
         # Add sci-fi overlay elements
         self.addOverlayElements()
     
+    @property
+    def nodes(self):
+        """All nodes in creation order"""
+        return list(self.node_index.values())
+    
+    @property
+    def edges(self):
+        """All edges in creation order"""
+        return list(self.edge_index.values())
+    
     def drawGrid(self):
         """Draw a grid in the background"""
         grid_size = 50
@@ -472,8 +645,52 @@ class AdvancedNetworkEditor(QGraphicsView):
         compass_marker.closeSubpath()
         self.scene.addPath(compass_marker, QPen(QColor("#00FFFF"), 1), QBrush(QColor("#00FFFF")))
     
+    def setLabelsVisible(self, visible):
+        """Show or hide the node and edge ID labels"""
+        self.show_labels = visible
+        self.viewport().update()
+    
+    def drawForeground(self, painter, rect):
+        """Paint the ID labels of the nodes and edges inside the exposed area"""
+        super().drawForeground(painter, rect)
+        
+        # Labels are unreadable when zoomed out, so skip them altogether
+        if not self.show_labels or self.transform().m11() < self.label_zoom_threshold:
+            return
+        
+        painter.save()
+        painter.setFont(self.label_font)
+        node_pen = QPen(QColor("#00FFFF"))
+        edge_pen = QPen(QColor("#00FFAA"))
+        
+        # Grow the query area so labels of items just outside it are still drawn.
+        # The scene's spatial index keeps this proportional to what is visible.
+        area = rect.adjusted(-100, -40, 40, 40)
+        for item in self.scene.items(area, Qt.ItemSelectionMode.IntersectsItemBoundingRect):
+            if isinstance(item, Node):
+                painter.setPen(node_pen)
+                painter.drawStaticText(QPointF(item.x + 10, item.y - 10),
+                                       self._labelText(item.node_id))
+            elif isinstance(item, Edge):
+                painter.setPen(edge_pen)
+                painter.drawStaticText(item.labelPosition(), self._labelText(item.edge_id))
+        
+        painter.restore()
+    
+    def _labelText(self, text):
+        """Get a cached, pre-laid-out static text for a label"""
+        static_text = self._label_cache.get(text)
+        if static_text is None:
+            static_text = QStaticText(text)
+            static_text.setPerformanceHint(QStaticText.PerformanceHint.AggressiveCaching)
+            static_text.prepare(font=self.label_font)
+            self._label_cache[text] = static_text
+        return static_text
+    
     def enterDrawingMode(self):
         """Enter road drawing mode"""
+        if self.selection_mode:
+            self.exitSelectionMode()
         self.drawing_mode = True
         self.setDragMode(QGraphicsView.DragMode.NoDrag)
         self.setCursor(Qt.CursorShape.CrossCursor)
@@ -502,10 +719,65 @@ class AdvancedNetworkEditor(QGraphicsView):
         if hasattr(self, 'mode_indicator'):
             self.mode_indicator.setVisible(False)
     
+    def enterSelectionMode(self):
+        """Enter rectangle/lasso selection mode"""
+        if self.drawing_mode:
+            self.exitDrawingMode()
+        self.selection_mode = True
+        # Rubber band selection is resolved through the scene's spatial index
+        self.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
+        self.setRubberBandSelectionMode(Qt.ItemSelectionMode.IntersectsItemShape)
+        self.setCursor(Qt.CursorShape.ArrowCursor)
+    
+    def exitSelectionMode(self):
+        """Exit selection mode"""
+        self.selection_mode = False
+        self._cancelLasso()
+        self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
+        self.setCursor(Qt.CursorShape.ArrowCursor)
+    
+    def _cancelLasso(self):
+        """Remove the lasso outline, if any"""
+        if self._lasso_item:
+            self.scene.removeItem(self._lasso_item)
+        self._lasso_item = None
+        self._lasso_path = None
+    
+    def selectedEdges(self):
+        """Get all currently selected edges"""
+        return [item for item in self.scene.selectedItems() if isinstance(item, Edge)]
+    
+    def editSelectedEdges(self):
+        """Show the bulk edit dialog for the selected edges"""
+        edges = self.selectedEdges()
+        if not edges:
+            return
+        
+        dialog = BulkEdgeEditDialog(len(edges), edges[0].lanes, edges[0].speed, self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            lanes, speed = dialog.values()
+            self.setEdgesProperties(edges, lanes, speed)
+    
     def mousePressEvent(self, event):
         """Handle mouse press events"""
+        if (self.selection_mode and event.button() == Qt.MouseButton.LeftButton
+                and event.modifiers() & Qt.KeyboardModifier.AltModifier):
+            # Alt + drag draws a freehand lasso instead of a rectangle
+            self._cancelLasso()
+            self._lasso_path = QPainterPath(self.mapToScene(event.pos()))
+            self._lasso_item = self.scene.addPath(
+                self._lasso_path, QPen(QColor("#FF00FF"), 1, Qt.PenStyle.DashLine)
+            )
+            return
+        
         if not self.drawing_mode:
             super().mousePressEvent(event)
+            
+            # Remember where the selected nodes were so a drag can be undone
+            self._drag_origins = {
+                item.node_id: (item.x, item.y)
+                for item in self.scene.selectedItems() if isinstance(item, Node)
+            }
             return
         
         if event.button() == Qt.MouseButton.LeftButton:
@@ -540,7 +812,8 @@ class AdvancedNetworkEditor(QGraphicsView):
                     self.scene.removeItem(self.temp_line)
                     self.temp_line = None
             else:
-                # Create a new node
+                # Create a new node, and the road leading to it, as one undo step
+                self.undo_stack.beginMacro("Add Road")
                 node = self.createNode(pos.x(), pos.y())
                 
                 if not self.temp_start_node:
@@ -555,6 +828,7 @@ class AdvancedNetworkEditor(QGraphicsView):
                     self.temp_start_node.setPen(QPen(QColor("#00FFFF"), 2))
                     self.temp_start_node = node
                     node.setPen(QPen(QColor("#FF00FF"), 3))
+                self.undo_stack.endMacro()
                 
                 # Remove temp line
                 if self.temp_line:
@@ -571,8 +845,43 @@ class AdvancedNetworkEditor(QGraphicsView):
                 self.scene.removeItem(self.temp_line)
                 self.temp_line = None
     
+    def mouseReleaseEvent(self, event):
+        """Handle mouse release events"""
+        if self._lasso_path is not None:
+            path = QPainterPath(self._lasso_path)
+            path.closeSubpath()
+            self._cancelLasso()
+            
+            # Ctrl extends the current selection, like the rubber band does
+            if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+                operation = Qt.ItemSelectionOperation.AddToSelection
+            else:
+                operation = Qt.ItemSelectionOperation.ReplaceSelection
+            self.scene.setSelectionArea(path, operation,
+                                        Qt.ItemSelectionMode.IntersectsItemShape)
+            return
+        
+        super().mouseReleaseEvent(event)
+        
+        # Record node drags as a (mergeable) move command
+        if self._drag_origins:
+            moves = {}
+            for node_id, old_pos in self._drag_origins.items():
+                node = self.findNode(node_id)
+                if node and (node.x, node.y) != old_pos:
+                    moves[node_id] = (old_pos, (node.x, node.y))
+            self._drag_origins = {}
+            
+            if moves:
+                self.undo_stack.push(MoveNodesCommand(self, moves))
+    
     def mouseMoveEvent(self, event):
         """Handle mouse move events"""
+        if self._lasso_path is not None:
+            self._lasso_path.lineTo(self.mapToScene(event.pos()))
+            self._lasso_item.setPath(self._lasso_path)
+            return
+        
         if self.drawing_mode and self.temp_start_node:
             # Get position in scene coordinates
             pos = self.mapToScene(event.pos())
@@ -603,62 +912,7 @@ class AdvancedNetworkEditor(QGraphicsView):
             
         elif event.key() == Qt.Key.Key_Delete:
             # Delete selected items
-            for item in self.scene.selectedItems():
-                if isinstance(item, Node):
-                    # Remove connected edges first
-                    for edge in item.edges.copy():
-                        if edge.source_node:
-                            edge.source_node.removeEdge(edge)
-                        if edge.target_node:
-                            edge.target_node.removeEdge(edge)
-                        
-                        # Remove lane indicators
-                        for indicator in edge.lane_indicators:
-                            if indicator in self.scene.items():
-                                self.scene.removeItem(indicator)
-                        
-                        # Remove edge label
-                        if hasattr(edge, 'label') and edge.label in self.scene.items():
-                            self.scene.removeItem(edge.label)
-                        
-                        # Remove edge
-                        if edge in self.scene.items():
-                            self.scene.removeItem(edge)
-                    
-                    # Remove node elements
-                    if hasattr(item, 'glow') and item.glow in self.scene.items():
-                        self.scene.removeItem(item.glow)
-                    if hasattr(item, 'label') and item.label in self.scene.items():
-                        self.scene.removeItem(item.label)
-                    
-                    # Remove node
-                    self.scene.removeItem(item)
-                    if item in self.nodes:
-                        self.nodes.remove(item)
-                
-                elif isinstance(item, Edge):
-                    # Disconnect from nodes
-                    if item.source_node:
-                        item.source_node.removeEdge(item)
-                    if item.target_node:
-                        item.target_node.removeEdge(item)
-                    
-                    # Remove lane indicators
-                    for indicator in item.lane_indicators:
-                        if indicator in self.scene.items():
-                            self.scene.removeItem(indicator)
-                    
-                    # Remove edge label
-                    if hasattr(item, 'label') and item.label in self.scene.items():
-                        self.scene.removeItem(item.label)
-                    
-                    # Remove edge
-                    self.scene.removeItem(item)
-                    if item in self.edges:
-                        self.edges.remove(item)
-            
-            # Emit network changed signal
-            self.network_changed.emit()
+            self.deleteItems(self.scene.selectedItems())
         
         # Allow zooming with + and -
         elif event.key() == Qt.Key.Key_Plus or event.key() == Qt.Key.Key_Equal:
@@ -686,63 +940,229 @@ class AdvancedNetworkEditor(QGraphicsView):
                 return item
         
         # If not found directly, search in a small radius
-        for node in self.nodes:
+        for node in self.node_index.values():
             dist = ((node.x - pos.x()) ** 2 + (node.y - pos.y()) ** 2) ** 0.5
             if dist < threshold:
                 return node
         
         return None
     
+    def findNode(self, node_id):
+        """Find a node by its ID"""
+        return self.node_index.get(node_id)
+    
+    def findEdge(self, edge_id):
+        """Find an edge by its ID"""
+        return self.edge_index.get(edge_id)
+    
     def createNode(self, x, y, node_id=None):
         """Create a new node at the specified position"""
         # Generate node ID if not provided
         if not node_id:
-            node_id = f"node_{len(self.nodes)}"
+            node_id = self.node_ids.allocate(self.node_index)
+        elif node_id in self.node_index:
+            raise ValueError(f"Duplicate node ID: {node_id}")
+        
+        self.undo_stack.push(AddNodeCommand(self, node_id, x, y))
+        return self.findNode(node_id)
+    
+    def createEdge(self, source_node, target_node, edge_id=None, lanes=1, speed=13.89):
+        """Create a new edge between two nodes"""
+        # Generate edge ID if not provided
+        if not edge_id:
+            edge_id = self.edge_ids.allocate(self.edge_index)
+        elif edge_id in self.edge_index:
+            raise ValueError(f"Duplicate edge ID: {edge_id}")
+        
+        self.undo_stack.push(AddEdgeCommand(self, edge_id, source_node.node_id,
+                                            target_node.node_id, lanes, speed))
+        return self.findEdge(edge_id)
+    
+    def deleteItems(self, items):
+        """Delete the given nodes and edges, including edges attached to deleted nodes"""
+        nodes = [item for item in items if isinstance(item, Node)]
+        edges = dict.fromkeys(item for item in items if isinstance(item, Edge))
+        for node in nodes:
+            edges.update(dict.fromkeys(node.edges))
+        
+        if not nodes and not edges:
+            return
+        
+        node_records = [(node.node_id, node.x, node.y) for node in nodes]
+        edge_records = [
+            (edge.edge_id, edge.source_node.node_id, edge.target_node.node_id,
+             edge.lanes, edge.speed)
+            for edge in edges
+        ]
+        self.undo_stack.push(DeleteElementsCommand(self, node_records, edge_records))
+    
+    def moveNode(self, node, x, y):
+        """Move a node to a new position"""
+        self.undo_stack.push(MoveNodesCommand(self, {node.node_id: ((node.x, node.y), (x, y))}))
+    
+    def setEdgeProperties(self, edge, lanes, speed):
+        """Change the number of lanes and speed limit of an edge"""
+        self.setEdgesProperties([edge], lanes, speed)
+    
+    def setEdgesProperties(self, edges, lanes=None, speed=None):
+        """
+        Change the lanes and/or speed limit of many edges as one batched update
+        
+        Args:
+            edges (list): Edges to change
+            lanes (int): New number of lanes, or None to keep each edge's value
+            speed (float): New speed limit in m/s, or None to keep each edge's value
+        """
+        changes = []
+        for edge in edges:
+            new_lanes = edge.lanes if lanes is None else lanes
+            new_speed = edge.speed if speed is None else speed
+            if (edge.lanes, edge.speed) != (new_lanes, new_speed):
+                changes.append((edge.edge_id, edge.lanes, edge.speed, new_lanes, new_speed))
+        
+        if changes:
+            self.undo_stack.push(EditEdgesCommand(self, changes))
+    
+    def flushChanges(self):
+        """Emit network_changed now for any changes collected so far"""
+        self._change_timer.stop()
+        if self._pending_changes.isEmpty():
+            return
+        
+        changes = self._pending_changes
+        self._pending_changes = NetworkChangeSet()
+        self.network_changed.emit(changes)
+    
+    def _scheduleChangeSignal(self):
+        """Make sure network_changed fires shortly for the pending changes"""
+        # Not restarted on every change, so a long burst still reports regularly
+        if not self._change_timer.isActive():
+            self._change_timer.start()
+    
+    def setHistoryDepth(self, depth):
+        """Set the maximum number of undo steps (clears the current history)"""
+        # QUndoStack only accepts a new limit while it is empty
+        self.undo_stack.clear()
+        self.undo_stack.setUndoLimit(depth)
+    
+    def _insertNode(self, node_id, x, y):
+        """Add a node item to the scene without recording history"""
+        if node_id in self.node_index:
+            raise ValueError(f"Duplicate node ID: {node_id}")
         
-        # Create the node
         node = Node(x, y, node_id)
         self.scene.addItem(node)
-        self.nodes.append(node)
+        self.node_index[node_id] = node
+        self.node_ids.observe(node_id)
+        self._pending_changes.addNode(node_id)
+        self._scheduleChangeSignal()
         
-        # Now that the node is added to the scene, add the glow effect and label
+        # Now that the node is added to the scene, add the glow effect
         node.glow = self.scene.addPath(node.glow_path, 
                                       QPen(QColor(0, 255, 255, 0)), 
                                       QBrush(QColor(0, 255, 255, 50)))
         
-        # Add label with ID
-        node.label = self.scene.addText(node.node_id, QFont("Arial", 8))
-        node.label.setDefaultTextColor(QColor("#00FFFF"))
-        node.label.setPos(x + 10, y - 10)
-        
-        # Emit network changed signal
-        self.network_changed.emit()
+        # Repaint the label overlay
+        self.viewport().update()
         
         return node
     
-    def createEdge(self, source_node, target_node, edge_id=None, lanes=1, speed=13.89):
-        """Create a new edge between two nodes"""
-        # Generate edge ID if not provided
-        if not edge_id:
-            edge_id = f"edge_{len(self.edges)}"
+    def _insertEdge(self, edge_id, source_id, target_id, lanes, speed):
+        """Add an edge item to the scene without recording history"""
+        if edge_id in self.edge_index:
+            raise ValueError(f"Duplicate edge ID: {edge_id}")
         
-        # Create the edge
-        edge = Edge(source_node, target_node, edge_id, lanes, speed)
+        edge = Edge(self.node_index[source_id], self.node_index[target_id], edge_id, lanes, speed)
         self.scene.addItem(edge)
-        self.edges.append(edge)
-        
-        # Now that the edge is added to the scene, add the label
-        edge.label = self.scene.addText(edge.edge_id, QFont("Arial", 8))
-        edge.label.setDefaultTextColor(QColor("#00FFAA"))
-        edge.updateLabelPosition()
+        self.edge_index[edge_id] = edge
+        self.edge_ids.observe(edge_id)
+        self._pending_changes.addEdge(edge_id)
+        self._scheduleChangeSignal()
         
         # Create lane indicators
         edge.updateLaneIndicators()
         
-        # Emit network changed signal
-        self.network_changed.emit()
+        # Repaint the label overlay
+        self.viewport().update()
         
         return edge
     
+    def _removeEdge(self, edge):
+        """Remove an edge item and its decorations from the scene"""
+        # Disconnect from nodes
+        if edge.source_node:
+            edge.source_node.removeEdge(edge)
+        if edge.target_node:
+            edge.target_node.removeEdge(edge)
+        
+        # Remove lane indicators
+        for indicator in edge.lane_indicators:
+            if indicator.scene():
+                self.scene.removeItem(indicator)
+        edge.lane_indicators.clear()
+        
+        # Remove edge
+        if edge.scene():
+            self.scene.removeItem(edge)
+        if self.edge_index.get(edge.edge_id) is edge:
+            del self.edge_index[edge.edge_id]
+            self._pending_changes.removeEdge(edge.edge_id)
+            self._scheduleChangeSignal()
+        
+        # Repaint the label overlay
+        self.viewport().update()
+    
+    def _removeNode(self, node):
+        """Remove a node item, its decorations and any attached edges from the scene"""
+        for edge in node.edges.copy():  # Copy because we'll modify during iteration
+            self._removeEdge(edge)
+        
+        if self.temp_start_node is node:
+            self.temp_start_node = None
+        
+        # Remove node elements
+        if node.glow and node.glow.scene():
+            self.scene.removeItem(node.glow)
+        
+        # Remove node
+        if node.scene():
+            self.scene.removeItem(node)
+        if self.node_index.get(node.node_id) is node:
+            del self.node_index[node.node_id]
+            self._pending_changes.removeNode(node.node_id)
+            self._scheduleChangeSignal()
+        
+        # Repaint the label overlay
+        self.viewport().update()
+    
+    def _setNodePosition(self, node, x, y):
+        """Move a node without recording history"""
+        # itemChange takes care of the connected edges, glow and label overlay
+        node.setPos(x - node.origin.x(), y - node.origin.y())
+    
+    def _setEdgeProperties(self, properties):
+        """
+        Change edge properties without recording history
+        
+        Args:
+            properties (iterable): (edge_id, lanes, speed) tuples
+        """
+        # Restyle everything in one pass and repaint once at the end
+        self.viewport().setUpdatesEnabled(False)
+        try:
+            for edge_id, lanes, speed in properties:
+                edge = self.edge_index.get(edge_id)
+                if edge:
+                    edge.lanes = lanes
+                    edge.speed = speed
+                    edge.updateStyle()
+                    edge.updateLaneIndicators()
+                    self._pending_changes.modifyEdge(edge_id)
+        finally:
+            self.viewport().setUpdatesEnabled(True)
+        self.viewport().update()
+        self._scheduleChangeSignal()
+    
     def clear(self):
         """Clear the entire network"""
         # Remove all items
@@ -753,13 +1173,23 @@ class AdvancedNetworkEditor(QGraphicsView):
         self.addOverlayElements()
         
         # Reset data
-        self.nodes = []
-        self.edges = []
+        self.node_index = {}
+        self.edge_index = {}
+        self.node_ids.reset()
+        self.edge_ids.reset()
         self.temp_start_node = None
         self.temp_line = None
+        self._drag_origins = {}
+        self._lasso_path = None
+        self._lasso_item = None
+        self._label_cache.clear()
         
-        # Emit network changed signal
-        self.network_changed.emit()
+        # The history refers to elements that no longer exist
+        self.undo_stack.clear()
+        
+        # Report a reset; anything pending refers to the old network
+        self._pending_changes = NetworkChangeSet(cleared=True)
+        self._scheduleChangeSignal()
     
     def exportToSumo(self):
         """Export the network to SUMO XML format"""
@@ -767,7 +1197,7 @@ class AdvancedNetworkEditor(QGraphicsView):
         edges_data = []
         
         # Convert nodes
-        for node in self.nodes:
+        for node in self.node_index.values():
             nodes_data.append((
                 node.node_id,
                 node.x,
@@ -775,7 +1205,7 @@ class AdvancedNetworkEditor(QGraphicsView):
             ))
         
         # Convert edges
-        for edge in self.edges:
+        for edge in self.edge_index.values():
             if edge.source_node and edge.target_node:
                 edges_data.append((
                     edge.edge_id,
@@ -792,19 +1222,15 @@ class AdvancedNetworkEditor(QGraphicsView):
         # Clear existing network
         self.clear()
         
-        # Create nodes first
-        node_map = {}  # Map node IDs to Node objects
+        # Create nodes first (imported elements are not recorded in the history).
+        # Inserting also seeds the ID allocators past every imported ID.
         for node_id, x, y in nodes_data:
-            node = self.createNode(x, y, node_id)
-            node_map[node_id] = node
+            self._insertNode(node_id, x, y)
         
         # Create edges
         for edge_id, from_node, to_node, lanes, speed in edges_data:
-            if from_node in node_map and to_node in node_map:
-                self.createEdge(
-                    node_map[from_node],
-                    node_map[to_node],
-                    edge_id,
-                    lanes,
-                    speed
-                )
\ No newline at end of file
+            if from_node in self.node_index and to_node in self.node_index:
+                self._insertEdge(edge_id, from_node, to_node, lanes, speed)
+        
+        # Report the whole import as one change set right away
+        self.flushChanges()
@@ -0,0 +1,234 @@
+import numpy as np
+
+from network_cache import pack_records
+from sumo_utils import iter_network, JunctionRecord, EdgeRecord
+
+
+class NetworkModel:
+    """
+    In-memory, array-backed view of a parsed SUMO network
+
+    Junctions and edges are kept as column arrays (the layout written by
+    network_cache.pack_records) plus ID -> row dictionaries, junction
+    adjacency and the edge graph given by the connections in CSR form and
+    the network bounds. A model is built once
+    per loaded network and shared by reference between the simulation
+    panel, the route generator and the visualization.
+    """
+    def __init__(self, arrays, network_file=None, vclass=None):
+        """
+        Args:
+            arrays (dict): Column arrays as returned by pack_records or NetworkCache.loadArrays
+            network_file (str): Path of the network the arrays were parsed from (optional)
+            vclass (str): Vehicle class the edges were filtered for (optional)
+        """
+        self.network_file = network_file
+        self.vclass = vclass
+
+        # Junction table
+        self.junction_ids = arrays["junction_ids"].tolist()
+        self.junction_index = {junction_id: i for i, junction_id in enumerate(self.junction_ids)}
+        self.junction_xy = arrays["junction_xy"].reshape(-1, 2)
+        self.junction_types = arrays["junction_types"]
+
+        # Edge table; endpoints are stored as junction rows (-1 if unknown)
+        self.edge_ids = arrays["edge_ids"].tolist()
+        self.edge_index = {edge_id: i for i, edge_id in enumerate(self.edge_ids)}
+        self.edge_from = np.array(
+            [self.junction_index.get(j, -1) for j in arrays["edge_from"].tolist()], dtype=np.int64
+        )
+        self.edge_to = np.array(
+            [self.junction_index.get(j, -1) for j in arrays["edge_to"].tolist()], dtype=np.int64
+        )
+        self.edge_lanes = arrays["edge_lanes"]
+        self.edge_speed = arrays["edge_speed"]
+        self.edge_function = arrays["edge_function"]
+        self.shape_offsets = arrays["shape_offsets"]
+        self.shape_points = arrays["shape_points"].reshape(-1, 2)
+        self.edge_length = self._edgeLengths(arrays["edge_length"])
+
+        # Junction adjacency (CSR): edges leaving/entering junction j are
+        # out_edges[out_offsets[j]:out_offsets[j + 1]] and the same for in_edges
+        self.out_offsets, self.out_edges = self._adjacency(self.edge_from)
+        self.in_offsets, self.in_edges = self._adjacency(self.edge_to)
+
+        # Edge graph (CSR): the edges a vehicle may continue onto from edge e
+        # are next_edges[next_offsets[e]:next_offsets[e + 1]], the edges it
+        # may come from are prev_edges[prev_offsets[e]:prev_offsets[e + 1]]
+        follow_from, follow_to = self._connections(arrays)
+        self.next_offsets, self.next_edges = self._edgeAdjacency(follow_from, follow_to)
+        self.prev_offsets, self.prev_edges = self._edgeAdjacency(follow_to, follow_from)
+
+        self.bounds = self._bounds()
+
+    @classmethod
+    def load(cls, network_file, cache=None, vclass="passenger"):
+        """
+        Parse a network file into a model
+
+        Args:
+            network_file (str): Path to the .net.xml or .net.xml.gz file
+            cache (NetworkCache): Parsed network cache to read from (optional)
+            vclass (str): Vehicle class filter passed to iter_network
+
+        Returns:
+            NetworkModel: The loaded model
+        """
+        if cache:
+            return cls(cache.loadArrays(network_file, vclass), network_file, vclass)
+
+        junctions = []
+        edges = []
+        connections = []
+        for record in iter_network(network_file, vclass):
+            if isinstance(record, JunctionRecord):
+                junctions.append(record)
+            elif isinstance(record, EdgeRecord):
+                edges.append(record)
+            else:
+                connections.append(record)
+        return cls(pack_records(junctions, edges, connections), network_file, vclass)
+
+    @classmethod
+    def fromTuples(cls, nodes, edges):
+        """
+        Build a model from editor data
+
+        Args:
+            nodes (list): (id, x, y) tuples as returned by exportToSumo
+            edges (list): (id, from_node, to_node, lanes, speed) tuples
+
+        Returns:
+            NetworkModel: The model (edge lengths are straight-line distances,
+                and every edge connects to all edges leaving its end junction)
+        """
+        junctions = [JunctionRecord(node_id, x, y, "priority") for node_id, x, y in nodes]
+        edge_records = [
+            EdgeRecord(edge_id, from_node, to_node, lanes, speed, 0.0, "normal", ())
+            for edge_id, from_node, to_node, lanes, speed in edges
+        ]
+        return cls(pack_records(junctions, edge_records))
+
+    @property
+    def junction_count(self):
+        return len(self.junction_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_ids)
+
+    def edgeShape(self, edge):
+        """
+        Get the polyline of an edge
+
+        Edges without a shape in the network file fall back to the
+        straight line between their junctions.
+
+        Args:
+            edge (int): Edge row
+
+        Returns:
+            numpy.ndarray: (n, 2) array of points (may be empty if the junctions are unknown)
+        """
+        start, end = self.shape_offsets[edge], self.shape_offsets[edge + 1]
+        if end - start >= 2:
+            return self.shape_points[start:end]
+
+        source, target = self.edge_from[edge], self.edge_to[edge]
+        if source < 0 or target < 0:
+            return np.empty((0, 2))
+        return self.junction_xy[[source, target]]
+
+    def outgoing(self, junction):
+        """Get the rows of the edges leaving a junction row"""
+        return self.out_edges[self.out_offsets[junction]:self.out_offsets[junction + 1]]
+
+    def incoming(self, junction):
+        """Get the rows of the edges entering a junction row"""
+        return self.in_edges[self.in_offsets[junction]:self.in_offsets[junction + 1]]
+
+    def successors(self, edge):
+        """Get the rows of the edges a vehicle may continue onto from an edge row"""
+        return self.next_edges[self.next_offsets[edge]:self.next_offsets[edge + 1]]
+
+    def predecessors(self, edge):
+        """Get the rows of the edges a vehicle may reach an edge row from"""
+        return self.prev_edges[self.prev_offsets[edge]:self.prev_offsets[edge + 1]]
+
+    def nodeTuples(self):
+        """Get the junctions as (id, x, y) tuples, the format used by the network editor"""
+        return [
+            (junction_id, x, y)
+            for junction_id, (x, y) in zip(self.junction_ids, self.junction_xy.tolist())
+        ]
+
+    def edgeTuples(self):
+        """Get the edges as (id, from_node, to_node, lanes, speed) tuples, the format used by the network editor"""
+        junction_ids = self.junction_ids + [None]
+        return [
+            (edge_id, junction_ids[source], junction_ids[target], lanes, speed)
+            for edge_id, source, target, lanes, speed in zip(
+                self.edge_ids,
+                self.edge_from.tolist(),
+                self.edge_to.tolist(),
+                self.edge_lanes.tolist(),
+                self.edge_speed.tolist()
+            )
+        ]
+
+    def _edgeLengths(self, lengths):
+        """Fill in missing lengths with the length of the edge geometry"""
+        lengths = np.array(lengths, dtype=np.float64)
+        for edge in np.flatnonzero(lengths <= 0):
+            points = self.edgeShape(edge)
+            if len(points) >= 2:
+                lengths[edge] = np.hypot(*np.diff(points, axis=0).T).sum()
+        return lengths
+
+    def _adjacency(self, endpoints):
+        """Group edge rows by junction row (edges with unknown endpoints are left out)"""
+        valid = np.flatnonzero(endpoints >= 0)
+        order = valid[np.argsort(endpoints[valid], kind="stable")]
+        counts = np.bincount(endpoints[valid], minlength=self.junction_count)
+        offsets = np.zeros(self.junction_count + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        return offsets, order
+
+    def _connections(self, arrays):
+        """
+        Get the (from, to) edge rows of the connections
+
+        Without any connections (editor data, hand-written networks) every
+        edge leaving the junction an edge ends at counts as connected to it.
+        """
+        connection_from = arrays.get("connection_from")
+        if connection_from is not None and len(connection_from):
+            rows = np.array([
+                (self.edge_index.get(from_edge, -1), self.edge_index.get(to_edge, -1))
+                for from_edge, to_edge in zip(connection_from.tolist(), arrays["connection_to"].tolist())
+            ], dtype=np.int64)
+            rows = rows[(rows >= 0).all(axis=1)]
+            return rows[:, 0], rows[:, 1]
+
+        edges = np.flatnonzero(self.edge_to >= 0)
+        starts = self.out_offsets[self.edge_to[edges]]
+        counts = self.out_offsets[self.edge_to[edges] + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return np.repeat(edges, counts), self.out_edges[positions]
+
+    def _edgeAdjacency(self, sources, targets):
+        """Group connected edge rows by the edge row they are reached from"""
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(sources, minlength=self.edge_count)
+        offsets = np.zeros(self.edge_count + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        return offsets, targets[order].astype(np.int64)
+
+    def _bounds(self):
+        """Get (min_x, min_y, max_x, max_y) over junctions and edge shapes"""
+        points = np.concatenate([self.junction_xy, self.shape_points])
+        if not len(points):
+            return (0.0, 0.0, 0.0, 0.0)
+        min_x, min_y = points.min(axis=0).tolist()
+        max_x, max_y = points.max(axis=0).tolist()
+        return (min_x, min_y, max_x, max_y)
@@ -0,0 +1,421 @@
+import csv
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+import numpy as np
+
+from demand import write_route_file
+from routing import route_all
+
+# Demand between zones in coordinate (COO) form: one entry per non-zero
+# cell. Zone IDs are TAZ IDs, or edge IDs for turn counts; origins and
+# destinations index into zones. Cells without a time interval of their
+# own have NaN begins/ends and use the simulation window.
+ODMatrix = namedtuple("ODMatrix", "zones origins destinations counts begins ends")
+
+# Accepted CSV column names, in order of preference
+ORIGIN_COLUMNS = ("origin", "from", "o", "fromtaz", "source")
+DESTINATION_COLUMNS = ("destination", "to", "d", "totaz", "sink")
+COUNT_COLUMNS = ("count", "trips", "amount", "flow", "value", "number")
+
+
+def build_matrix(origin_ids, destination_ids, counts, begins=None, ends=None):
+    """
+    Build an ODMatrix from per-cell columns, dropping empty cells
+
+    Args:
+        origin_ids (list): Origin zone ID of each cell
+        destination_ids (list): Destination zone ID of each cell
+        counts (list): Number of trips of each cell
+        begins (list): Start of each cell's interval in seconds (optional)
+        ends (list): End of each cell's interval in seconds (optional)
+
+    Returns:
+        ODMatrix: The matrix
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    cell_count = len(counts)
+    begins = np.full(cell_count, np.nan) if begins is None else np.asarray(begins, dtype=np.float64)
+    ends = np.full(cell_count, np.nan) if ends is None else np.asarray(ends, dtype=np.float64)
+
+    ids = np.concatenate([np.asarray(origin_ids, dtype=str), np.asarray(destination_ids, dtype=str)])
+    zones, rows = np.unique(ids, return_inverse=True)
+    origins, destinations = rows[:cell_count], rows[cell_count:]
+
+    keep = counts > 0
+    return ODMatrix(
+        zones.tolist(), origins[keep].astype(np.int64), destinations[keep].astype(np.int64),
+        counts[keep], begins[keep], ends[keep]
+    )
+
+
+def read_od_csv(csv_file):
+    """
+    Read an OD matrix (or turn counts) from a CSV file
+
+    Rows are "origin,destination,count[,begin,end]". A header row naming
+    the columns (e.g. from/to/count) is optional; the delimiter may be a
+    comma, semicolon or tab.
+
+    Returns:
+        ODMatrix: The matrix
+    """
+    with open(csv_file, 'r', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = [row for row in csv.reader(f, dialect) if row and not row[0].startswith("#")]
+
+    if not rows:
+        raise ValueError(f"No demand found in {csv_file}")
+
+    columns = [0, 1, 2, 3, 4]
+    header = [name.strip().lower() for name in rows[0]]
+    if not _is_number(rows[0][2] if len(rows[0]) > 2 else ""):
+        columns = [
+            _find_column(header, ORIGIN_COLUMNS, csv_file),
+            _find_column(header, DESTINATION_COLUMNS, csv_file),
+            _find_column(header, COUNT_COLUMNS, csv_file),
+            header.index("begin") if "begin" in header else None,
+            header.index("end") if "end" in header else None,
+        ]
+        rows = rows[1:]
+
+    table = list(zip(*rows))
+    if len(table) < 3:
+        raise ValueError(f"Expected origin, destination and count columns in {csv_file}")
+
+    def column(index):
+        if index is None or index >= len(table):
+            return None
+        return np.array(table[index], dtype=np.float64)
+
+    return build_matrix(
+        [value.strip() for value in table[columns[0]]],
+        [value.strip() for value in table[columns[1]]],
+        column(columns[2]), column(columns[3]), column(columns[4])
+    )
+
+
+def read_od_oformat(matrix_file):
+    """
+    Read an OD matrix in VISUM/SUMO O-format
+
+    The file starts with a "$O" header line, followed by the time interval
+    (hours.minutes), a scaling factor and "origin destination count"
+    triples. Lines starting with '*' are comments.
+
+    Returns:
+        ODMatrix: The matrix
+    """
+    with open(matrix_file, 'r') as f:
+        lines = [line for line in (line.strip() for line in f) if line and not line.startswith("*")]
+
+    if not lines or not lines[0].startswith("$O"):
+        raise ValueError(f"Not an O-format matrix: {matrix_file}")
+
+    tokens = " ".join(lines[1:]).split()
+    if len(tokens) < 3:
+        raise ValueError(f"Missing time interval or factor in {matrix_file}")
+
+    begin, end = _oformat_time(tokens[0]), _oformat_time(tokens[1])
+    factor = float(tokens[2])
+
+    cells = np.array(tokens[3:], dtype=str)
+    if len(cells) % 3:
+        raise ValueError(f"Incomplete origin-destination entry in {matrix_file}")
+    cells = cells.reshape(-1, 3)
+
+    cell_count = len(cells)
+    return build_matrix(
+        cells[:, 0], cells[:, 1], cells[:, 2].astype(np.float64) * factor,
+        np.full(cell_count, begin, dtype=np.float64), np.full(cell_count, end, dtype=np.float64)
+    )
+
+
+def read_turn_counts(count_file, attribute="count"):
+    """
+    Read turn counts from SUMO edgeRelation data (or a from,to,count CSV)
+
+    Turn counts are returned as a matrix whose zones are edge IDs, so each
+    counted turn becomes trips from its incoming to its outgoing edge.
+
+    Args:
+        count_file (str): <data><interval><edgeRelation from to count/> file
+        attribute (str): edgeRelation attribute holding the count
+
+    Returns:
+        ODMatrix: The matrix
+    """
+    if not _is_xml(count_file):
+        return read_od_csv(count_file)
+
+    origin_ids, destination_ids, counts, begins, ends = [], [], [], [], []
+    begin = end = np.nan
+    for event, elem in ET.iterparse(count_file, events=("start", "end")):
+        if event == "start":
+            if elem.tag == "interval":
+                begin = float(elem.get("begin", "nan"))
+                end = float(elem.get("end", "nan"))
+            continue
+        if elem.tag == "edgeRelation" and elem.get(attribute) is not None:
+            origin_ids.append(elem.get("from"))
+            destination_ids.append(elem.get("to"))
+            counts.append(float(elem.get(attribute)))
+            begins.append(begin)
+            ends.append(end)
+        elif elem.tag == "interval":
+            elem.clear()
+
+    if not counts:
+        raise ValueError(f"No edgeRelation counts found in {count_file}")
+    return build_matrix(origin_ids, destination_ids, counts, begins, ends)
+
+
+def read_taz(taz_file):
+    """
+    Read traffic assignment zones
+
+    Args:
+        taz_file (str): File with <taz id edges="..."> elements (or
+            <tazSource>/<tazSink> children)
+
+    Returns:
+        dict: Zone IDs mapped to lists of edge IDs
+    """
+    zones = {}
+    for _, elem in ET.iterparse(taz_file):
+        if elem.tag != "taz":
+            continue
+        edges = elem.get("edges", "").split()
+        for child in elem:
+            if child.tag in ("tazSource", "tazSink") and child.get("id") not in edges:
+                edges.append(child.get("id"))
+        zones[elem.get("id")] = edges
+        elem.clear()
+    return zones
+
+
+def load_demand(demand_file):
+    """
+    Read an OD matrix or turn counts, detecting the format from the contents
+
+    Returns:
+        ODMatrix: The matrix
+    """
+    if _is_xml(demand_file):
+        return read_turn_counts(demand_file)
+
+    line = ""
+    with open(demand_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("*"):
+                break
+    if line.startswith("$"):
+        return read_od_oformat(demand_file)
+    return read_od_csv(demand_file)
+
+
+def zone_edge_table(model, zones, taz=None):
+    """
+    Map zones to the network edges trips may start and end on
+
+    A zone uses the edges listed for it in taz; zones that are not in taz
+    but are edge IDs of the network (turn counts) use that edge.
+
+    Args:
+        model (NetworkModel): The network
+        zones (list): Zone IDs of an ODMatrix
+        taz (dict): Zone IDs mapped to edge IDs, from read_taz (optional)
+
+    Returns:
+        tuple: (offsets, edges) CSR arrays; the edge rows of zone i are
+            edges[offsets[i]:offsets[i + 1]]
+    """
+    taz = taz or {}
+    edge_index = model.edge_index
+    groups = []
+    for zone in zones:
+        edge_ids = taz.get(zone, (zone,))
+        groups.append([edge_index[edge_id] for edge_id in edge_ids if edge_id in edge_index])
+
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(group) for group in groups])
+    edges = np.array([edge for group in groups for edge in group], dtype=np.int64)
+    return offsets, edges
+
+
+def cell_intervals(matrix, begin=0, end=3600):
+    """
+    Place the cell intervals of a matrix in the simulation window
+
+    Matrix intervals are clock times (an O-format 7.00 8.00 is
+    25200-28800), so they are shifted by the start of the earliest one:
+    it begins at begin, and later intervals keep their offset to it.
+    Cells without an interval get [begin, end].
+
+    Returns:
+        tuple: (begins, ends) arrays, one entry per cell
+    """
+    timed = ~np.isnan(matrix.begins)
+    shift = begin - matrix.begins[timed].min() if timed.any() else 0.0
+    begins = np.where(timed, matrix.begins + shift, begin)
+    ends = np.where(np.isnan(matrix.ends), end, matrix.ends + shift)
+    return begins, ends
+
+
+def sample_trips(matrix, zone_offsets, zone_edges, begin=0, end=3600, scale=1.0, rng=None):
+    """
+    Expand an OD matrix into individual trips
+
+    Cell counts are scaled and rounded stochastically (so fractional
+    counts are kept on average), every trip gets a uniform departure in
+    its cell's interval and a random edge of its origin and destination
+    zones. All steps work on whole arrays.
+
+    Cell intervals are placed in the simulation window by cell_intervals.
+
+    Args:
+        matrix (ODMatrix): The demand
+        zone_offsets (numpy.ndarray): Offsets from zone_edge_table
+        zone_edges (numpy.ndarray): Edges from zone_edge_table
+        begin (float): Start of the interval for cells without one
+        end (float): End of the interval for cells without one
+        scale (float): Factor applied to all counts
+        rng (numpy.random.Generator): Random generator (optional)
+
+    Returns:
+        tuple: (departs, origins, destinations, cells) arrays sorted by
+            departure, and the number of trips dropped because a zone has
+            no edges in the network
+    """
+    rng = rng or np.random.default_rng()
+
+    expected = matrix.counts * scale
+    counts = np.floor(expected).astype(np.int64)
+    counts += rng.random(len(expected)) < expected - counts
+    cells = np.repeat(np.arange(len(counts)), counts)
+
+    begins, ends = cell_intervals(matrix, begin, end)
+    departs = begins[cells] + rng.random(len(cells)) * (ends - begins)[cells]
+
+    origins = _pick_edges(matrix.origins[cells], zone_offsets, zone_edges, rng)
+    destinations = _pick_edges(matrix.destinations[cells], zone_offsets, zone_edges, rng)
+
+    valid = (origins >= 0) & (destinations >= 0)
+    order = np.argsort(departs[valid], kind="stable")
+    return (
+        departs[valid][order], origins[valid][order], destinations[valid][order],
+        cells[valid][order], int(len(cells) - valid.sum())
+    )
+
+
+def od_route_file(output_file, matrix, router, taz=None, begin=0, end=3600, mode="vehicles",
+                  scale=1.0, rng=None, workers=1):
+    """
+    Turn an OD matrix (or turn counts) into a route file
+
+    Trips are sampled with sample_trips, each distinct origin-destination
+    edge pair is routed once, and the trips are written as vehicles on
+    those routes (or, in flows mode, as one flow per route and cell).
+    Timed cells are shifted so the earliest interval starts at begin
+    (see cell_intervals); demand past end is left for SUMO to drop.
+
+    Args:
+        output_file (str): Path to save the route file (.gz for gzip)
+        matrix (ODMatrix): The demand
+        router (Router): Router for the network
+        taz (dict): Zone IDs mapped to edge IDs, from read_taz (optional)
+        begin (float): Start of the interval for cells without one
+        end (float): End of the interval for cells without one
+        mode (str): 'vehicles' or 'flows' (see demand.DEMAND_MODES)
+        scale (float): Factor applied to all counts
+        rng (numpy.random.Generator): Random generator (optional)
+        workers (int): Number of processes routing the pairs (see routing.route_all)
+
+    Returns:
+        tuple: (output_file, number of trips written, number of trips
+            dropped because a zone had no edges or no route was found)
+    """
+    model = router.model
+    zone_offsets, zone_edges = zone_edge_table(model, matrix.zones, taz)
+    departs, origins, destinations, cells, dropped = sample_trips(
+        matrix, zone_offsets, zone_edges, begin, end, scale, rng
+    )
+
+    # Route every distinct pair once
+    pair_keys, trip_pairs = np.unique(origins * model.edge_count + destinations, return_inverse=True)
+    edge_ids = model.edge_ids
+    routes = {}
+    pair_routes = np.full(len(pair_keys), -1, dtype=np.int64)
+    pair_origins, pair_destinations = np.divmod(pair_keys, model.edge_count)
+    for pair, path in enumerate(route_all(router, pair_origins, pair_destinations, workers)):
+        if path is not None:
+            pair_routes[pair] = len(routes)
+            routes[f"route{len(routes)}"] = [edge_ids[edge] for edge in path]
+
+    vehicle_routes = pair_routes[trip_pairs]
+    routed = vehicle_routes >= 0
+    dropped += int(len(routed) - routed.sum())
+    if not routes:
+        raise RuntimeError("None of the imported trips could be routed in this network")
+
+    departs, vehicle_routes, cells = departs[routed], vehicle_routes[routed], cells[routed]
+
+    if mode.strip().lower() == "flows":
+        route_ids = list(routes)
+        begins, ends = cell_intervals(matrix, begin, end)
+        flow_keys, flow_counts = np.unique(
+            vehicle_routes * len(matrix.counts) + cells, return_counts=True
+        )
+        flow_routes, flow_cells = np.divmod(flow_keys, len(matrix.counts))
+        flows = [
+            (route_ids[route], begins[cell], ends[cell], "number", count)
+            for route, cell, count in zip(flow_routes.tolist(), flow_cells.tolist(), flow_counts.tolist())
+        ]
+        flows.sort(key=lambda flow: flow[1])
+        write_route_file(output_file, routes, flows=flows)
+    else:
+        write_route_file(output_file, routes, departs, vehicle_routes)
+
+    return output_file, len(departs), dropped
+
+
+def _pick_edges(zones, zone_offsets, zone_edges, rng):
+    """Pick a random edge of each zone (-1 for zones without edges)"""
+    starts = zone_offsets[zones]
+    sizes = zone_offsets[zones + 1] - starts
+    if len(zone_edges) == 0:
+        return np.full(len(zones), -1, dtype=np.int64)
+    picks = starts + (rng.random(len(zones)) * sizes).astype(np.int64)
+    return np.where(sizes > 0, zone_edges[np.minimum(picks, len(zone_edges) - 1)], -1)
+
+
+def _find_column(header, names, csv_file):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    raise ValueError(f"No '{names[0]}' column in {csv_file}")
+
+
+def _oformat_time(value):
+    """Convert an O-format time (hours.minutes) to seconds"""
+    hours, _, minutes = value.partition(".")
+    return int(hours) * 3600 + int((minutes + "00")[:2]) * 60
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_xml(path):
+    with open(path, 'r') as f:
+        return f.read(256).lstrip().startswith("<")
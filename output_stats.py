@@ -0,0 +1,338 @@
+import os
+import xml.etree.ElementTree as ET
+from bisect import bisect_right, insort
+
+from scenario import SUMMARY_FILE, TRIPINFO_FILE
+
+# Bytes read from an output file at a time
+READ_SIZE = 1 << 16
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimate with the P² algorithm (Jain & Chlamtac, 1985)
+
+    The first EXACT_LIMIT values are kept sorted and give the exact
+    quantile, since the five P² markers are poor estimates on small
+    samples. After that the markers are placed on the sorted values and
+    follow the quantile, so memory and time per value stay constant
+    however many values are seen.
+    """
+    EXACT_LIMIT = 100
+
+    def __init__(self, p):
+        if not 0 < p < 1:
+            raise ValueError(f"Quantile must be between 0 and 1, got {p}")
+        self.p = p
+        self.count = 0
+        self.buffer = []  # Sorted values until the markers take over
+        self.heights = None
+        self.positions = None
+        self.desired = None
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        """Add a value"""
+        self.count += 1
+        if self.heights is None:
+            insort(self.buffer, x)
+            if len(self.buffer) > self.EXACT_LIMIT:
+                self._placeMarkers()
+            return
+
+        # Cell the value falls into, widening the outer markers if needed
+        q = self.heights
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect_right(q, x) - 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _placeMarkers(self):
+        """Start the P² markers at their desired ranks in the buffered values"""
+        values = self.buffer
+        count = len(values)
+        self.desired = [1 + (count - 1) * increment for increment in self.increments]
+
+        # Marker positions are distinct ranks (1-based) in the sorted values
+        n = [int(round(desired)) for desired in self.desired]
+        for i in range(1, 5):
+            n[i] = max(n[i], n[i - 1] + 1)
+        for i in range(3, -1, -1):
+            n[i] = min(n[i], n[i + 1] - 1)
+
+        self.positions = n
+        self.heights = [values[rank - 1] for rank in n]
+        self.buffer = []
+
+    def _parabolic(self, i, d):
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        """
+        Get the current estimate
+
+        Returns:
+            float: The quantile (exact, interpolated between ranks, up to
+                EXACT_LIMIT values), or None without values
+        """
+        if self.heights is not None:
+            return self.heights[2]
+        if not self.buffer:
+            return None
+
+        rank = self.p * (len(self.buffer) - 1)
+        lower = int(rank)
+        upper = min(lower + 1, len(self.buffer) - 1)
+        return self.buffer[lower] + (rank - lower) * (self.buffer[upper] - self.buffer[lower])
+
+
+class RunningStats:
+    """Count, mean, minimum and maximum of a stream of values"""
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        """Add a value"""
+        self.count += 1
+        if self.count == 1:
+            self.mean = self.min = self.max = x
+            return
+        self.mean += (x - self.mean) / self.count
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+
+class XMLTail:
+    """
+    Follows an XML file while another process is still writing it
+
+    Each read() parses the bytes appended since the last one and yields
+    the records completed in between. Records are the direct children of
+    the root element; they are dropped once yielded, so memory stays
+    bounded however long the file gets.
+    """
+    def __init__(self, path, tags):
+        """
+        Args:
+            path (str): File to follow (it does not need to exist yet)
+            tags (tuple): Tags of the records to yield
+        """
+        self.path = path
+        self.tags = tuple(tags)
+        self.offset = 0
+        self.failed = False
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self._depth = 0
+
+    def read(self):
+        """
+        Parse what was written since the last call
+
+        Yields:
+            tuple: (tag, attributes) of each completed record
+        """
+        if self.failed or not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                data = f.read(READ_SIZE)
+                if not data:
+                    break
+                self.offset += len(data)
+                try:
+                    self._parser.feed(data)
+                    yield from self._records()
+                except ET.ParseError as e:
+                    print(f"Stopped following {self.path}: {e}")
+                    self.failed = True
+                    return
+
+    def _records(self):
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                self._depth += 1
+                if self._root is None:
+                    self._root = elem
+                continue
+
+            self._depth -= 1
+            if self._depth == 1:
+                if elem.tag in self.tags:
+                    yield elem.tag, dict(elem.attrib)
+                # Drop finished records from the tree
+                self._root.clear()
+
+
+class TripStats:
+    """
+    Running aggregates of SUMO tripinfo records
+
+    Travel time and time loss (the delay against free flow) are
+    summarized by streaming quantiles, throughput by the arrivals per
+    simulated hour.
+    """
+    QUANTILES = (0.5, 0.9, 0.95)
+
+    def __init__(self):
+        self.travel_time = RunningStats()
+        self.time_loss = RunningStats()
+        self.waiting_time = RunningStats()
+        self.route_length = RunningStats()
+        self.travel_time_quantiles = [P2Quantile(p) for p in self.QUANTILES]
+        self.time_loss_quantiles = [P2Quantile(p) for p in self.QUANTILES]
+        self.last_arrival = 0.0
+
+    def add(self, trip):
+        """Add a tripinfo record (its attributes)"""
+        duration = float(trip.get("duration", 0))
+        time_loss = float(trip.get("timeLoss", 0))
+        self.travel_time.add(duration)
+        self.time_loss.add(time_loss)
+        self.waiting_time.add(float(trip.get("waitingTime", 0)))
+        self.route_length.add(float(trip.get("routeLength", 0)))
+        for quantile in self.travel_time_quantiles:
+            quantile.add(duration)
+        for quantile in self.time_loss_quantiles:
+            quantile.add(time_loss)
+        self.last_arrival = max(self.last_arrival, float(trip.get("arrival", 0)))
+
+    def kpis(self):
+        """
+        Get the current aggregates
+
+        Returns:
+            dict: Number of finished trips, mean travel time, waiting time,
+                time loss and route length, travel time and time loss
+                quantiles (e.g. p90_travel_time) and throughput in trips per
+                simulated hour
+        """
+        count = self.travel_time.count
+        kpis = {
+            "trips_finished": count,
+            "mean_travel_time": self.travel_time.mean,
+            "mean_waiting_time": self.waiting_time.mean,
+            "mean_time_loss": self.time_loss.mean,
+            "mean_route_length": self.route_length.mean,
+            "throughput": count * 3600 / self.last_arrival if self.last_arrival > 0 else None,
+        }
+        for p, travel_time, time_loss in zip(self.QUANTILES, self.travel_time_quantiles,
+                                             self.time_loss_quantiles):
+            kpis[f"p{int(p * 100)}_travel_time"] = travel_time.value()
+            kpis[f"p{int(p * 100)}_time_loss"] = time_loss.value()
+        return kpis
+
+
+class SummaryStats:
+    """Latest network state and peaks from SUMO summary records"""
+    def __init__(self):
+        self.step = {}
+        self.peak_running = 0
+        self.peak_halting = 0
+
+    def add(self, step):
+        """Add a summary step record (its attributes)"""
+        self.step = step
+        self.peak_running = max(self.peak_running, int(step.get("running", 0)))
+        self.peak_halting = max(self.peak_halting, int(step.get("halting", 0)))
+
+    def kpis(self):
+        """
+        Get the current aggregates
+
+        Returns:
+            dict: Time, running, halting, waiting to be inserted and arrived
+                vehicles, teleports and mean speed of the latest step, and
+                the peaks of running and halting vehicles
+        """
+        step = self.step
+        mean_speed = float(step.get("meanSpeed", -1))
+        return {
+            "time": float(step.get("time", 0)),
+            "running": int(step.get("running", 0)),
+            "halting": int(step.get("halting", 0)),
+            "insertion_backlog": int(step.get("waiting", 0)),
+            "arrived": int(step.get("arrived", 0)),
+            "teleports": int(step.get("teleports", 0)),
+            # SUMO writes -1 while no vehicle is running
+            "mean_speed": mean_speed if mean_speed >= 0 else None,
+            "peak_running": self.peak_running,
+            "peak_halting": self.peak_halting,
+        }
+
+
+class OutputMonitor:
+    """
+    Live KPIs from the summary and tripinfo outputs of a running simulation
+
+    Call poll() periodically while SUMO runs, and once more after it
+    exits to pick up the end of the files.
+    """
+    def __init__(self, directory, summary_file=SUMMARY_FILE, tripinfo_file=TRIPINFO_FILE):
+        self.summary_tail = XMLTail(os.path.join(directory, summary_file), ("step",))
+        self.tripinfo_tail = XMLTail(os.path.join(directory, tripinfo_file), ("tripinfo",))
+        self.summary = SummaryStats()
+        self.trips = TripStats()
+
+    def poll(self):
+        """
+        Read the new output records
+
+        Returns:
+            dict: Current KPIs (see SummaryStats.kpis and TripStats.kpis)
+        """
+        for _, step in self.summary_tail.read():
+            self.summary.add(step)
+        for _, trip in self.tripinfo_tail.read():
+            self.trips.add(trip)
+        return self.kpis()
+
+    def kpis(self):
+        """Get the KPIs without reading the outputs"""
+        kpis = self.summary.kpis()
+        kpis.update(self.trips.kpis())
+        return kpis
+
+
+def read_trip_stats(tripinfo_file):
+    """
+    Aggregate a finished (or partly written) tripinfo output
+
+    Returns:
+        TripStats: The aggregates of all trips in the file
+    """
+    stats = TripStats()
+    for _, trip in XMLTail(tripinfo_file, ("tripinfo",)).read():
+        stats.add(trip)
+    return stats
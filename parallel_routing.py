@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+
+from network_model import NetworkModel
+from routing import Router
+
+# Pair chunks handed out per worker, so faster workers pick up more of them
+CHUNKS_PER_WORKER = 4
+
+# Router of the current worker process, set up once by _init_worker
+_worker_router = None
+
+
+def _init_worker(network_file, vclass, network_cache, metric, algorithm):
+    """Load the network (and routing index) once per worker process"""
+    global _worker_router
+    model = NetworkModel.load(network_file, cache=network_cache, vclass=vclass)
+    _worker_router = Router(model, metric, algorithm, network_cache=network_cache)
+
+
+def _route_pairs(origins, destinations):
+    """Route pairs of edge rows with the worker's router"""
+    router = _worker_router
+    return [router.route(origin, destination) for origin, destination in zip(origins, destinations)]
+
+
+def _origin_chunks(origins, workers):
+    """Group pairs by origin, then cut them into roughly equal chunks of indices"""
+    order = np.argsort(origins, kind="stable")
+    return [chunk for chunk in np.array_split(order, workers * CHUNKS_PER_WORKER) if len(chunk)]
+
+
+def worker_pool(model, metric="time", algorithm="astar", network_cache=None, workers=None):
+    """
+    Start worker processes that each load the network and a router once
+
+    The pool can be passed to several route_pairs calls, so the workers
+    are started (and load the network) only once for all of them. Shut it
+    down when done, e.g. by using it as a context manager.
+
+    Returns:
+        ProcessPoolExecutor: The pool
+    """
+    workers = workers or os.cpu_count() or 1
+    # Build the routing index up front so the workers only load it
+    if algorithm == "ch":
+        Router(model, metric, algorithm, network_cache=network_cache).contractionHierarchy()
+
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(model.network_file, model.vclass, network_cache, metric, algorithm)
+    )
+
+
+def route_pairs(model, origins, destinations, metric="time", algorithm="astar",
+                network_cache=None, workers=None, pool=None):
+    """
+    Route origin-destination pairs in a process pool
+
+    Pairs are grouped by origin into chunks, so each worker's route cache
+    is reused, and the paths come back in the order of the pairs, so the
+    result is the same as routing them one after the other.
+
+    Args:
+        model (NetworkModel): Network loaded from a file (network_file is required)
+        origins (numpy.ndarray): Origin edge row of each pair
+        destinations (numpy.ndarray): Destination edge row of each pair
+        metric (str): Routing metric, 'time' or 'length'
+        algorithm (str): Routing algorithm (see Router.ALGORITHMS)
+        network_cache (NetworkCache): Cache the workers load the network from
+        workers (int): Number of worker processes (defaults to the CPU count)
+        pool (ProcessPoolExecutor): Pool from worker_pool to route in (optional,
+            otherwise one is started and shut down for this call)
+
+    Returns:
+        list: Path of each pair (tuple of edge rows), or None where unreachable
+    """
+    if not model.network_file:
+        raise ValueError("Parallel routing needs a network loaded from a file")
+
+    origins = np.asarray(origins)
+    destinations = np.asarray(destinations)
+    workers = workers or os.cpu_count() or 1
+    paths = [None] * len(origins)
+
+    with nullcontext(pool) if pool is not None else worker_pool(model, metric, algorithm, network_cache, workers) as pool:
+        futures = [
+            (chunk, pool.submit(_route_pairs, origins[chunk].tolist(), destinations[chunk].tolist()))
+            for chunk in _origin_chunks(origins, workers)
+        ]
+        for chunk, future in futures:
+            for i, path in zip(chunk.tolist(), future.result()):
+                paths[i] = path
+
+    return paths
+
@@ -0,0 +1,397 @@
+import heapq
+import math
+from collections import OrderedDict
+from contextlib import nullcontext
+
+import numpy as np
+
+from contraction_hierarchy import load_or_build_hierarchy
+
+# Route types offered in the simulation panel, mapped to (metric, OD weighting)
+ROUTE_TYPES = {
+    "random": ("time", "uniform"),
+    "shortest_path": ("length", "uniform"),
+    "fastest_path": ("time", "uniform"),
+    "custom": ("time", "capacity"),
+}
+
+# Number of distinct OD pairs a generated demand draws its trips from
+OD_POOL_SIZE = 2000
+
+# Fewer OD pairs than this are routed in this process, since starting worker
+# processes (each loading the network) would take longer than the routing
+PARALLEL_ROUTING_MIN_PAIRS = 1000
+
+
+class Router:
+    """
+    Shortest path search over the edge graph of a NetworkModel
+
+    The search moves from an edge only onto the edges its connections lead
+    to, so routes keep to the turns (and lanes) the network allows for the
+    model's vehicle class. Entering an edge costs its travel time at the
+    speed limit ("time") or its length ("length"). Routes go from an origin
+    edge to a destination edge and are returned as tuples of edge rows.
+    Computed routes are kept in an LRU cache, so demands that reuse OD
+    pairs route each pair only once.
+    """
+    ALGORITHMS = ("dijkstra", "astar", "bidirectional", "ch")
+
+    def __init__(self, model, metric="time", algorithm="astar", cache_size=100000, network_cache=None):
+        """
+        Args:
+            model (NetworkModel): Network to route on
+            metric (str): 'time' or 'length'
+            algorithm (str): 'dijkstra', 'astar', 'bidirectional', or 'ch' to
+                query a contraction hierarchy (built on first use)
+            cache_size (int): Maximum number of routes kept in the LRU cache
+            network_cache (NetworkCache): Where the contraction hierarchy is
+                persisted (optional)
+        """
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"Unknown routing algorithm: {algorithm}")
+
+        self.model = model
+        self.metric = metric
+        self.algorithm = algorithm
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+        speed = np.maximum(model.edge_speed, 0.1)
+        length = np.maximum(model.edge_length, 0.1)
+        weights = length / speed if metric == "time" else length
+        self.weights = weights.tolist()
+        self.edge_weights = weights
+        self.network_cache = network_cache
+        self.hierarchy = None
+
+        # Plain lists are much faster than NumPy scalars in the search loops
+        self.edge_from = model.edge_from.tolist()
+        self.edge_to = model.edge_to.tolist()
+        self.next_offsets = model.next_offsets.tolist()
+        self.next_edges = model.next_edges.tolist()
+        self.prev_offsets = model.prev_offsets.tolist()
+        self.prev_edges = model.prev_edges.tolist()
+        self.junction_xy = model.junction_xy.tolist()
+
+        # A* needs a lower bound on the cost per unit of straight-line
+        # distance that holds for every edge (lane lengths are measured
+        # between junction borders, so they can be shorter than the
+        # distance between junction centres)
+        self.heuristic_scale = 0.0
+        valid = (model.edge_from >= 0) & (model.edge_to >= 0)
+        if valid.any():
+            delta = model.junction_xy[model.edge_to[valid]] - model.junction_xy[model.edge_from[valid]]
+            distance = np.hypot(delta[:, 0], delta[:, 1])
+            moving = distance > 0
+            if moving.any():
+                self.heuristic_scale = float((weights[valid][moving] / distance[moving]).min())
+
+    def route(self, origin, destination):
+        """
+        Find the best route between two edges
+
+        Args:
+            origin (int): Row of the edge the trip starts on
+            destination (int): Row of the edge the trip ends on
+
+        Returns:
+            tuple: Edge rows from origin to destination, or None if unreachable
+        """
+        key = (origin, destination)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        path = self._route(origin, destination)
+
+        self._cache[key] = path
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return path
+
+    def routeIds(self, origin, destination):
+        """Same as route, but with edge IDs"""
+        path = self.route(origin, destination)
+        if path is None:
+            return None
+        return [self.model.edge_ids[edge] for edge in path]
+
+    def cost(self, path):
+        """Get the total weight of a route"""
+        return sum(self.weights[edge] for edge in path)
+
+    def clearCache(self):
+        self._cache.clear()
+
+    def contractionHierarchy(self):
+        """Get the contraction hierarchy for this network and metric, loading or building it once"""
+        if self.hierarchy is None:
+            self.hierarchy = load_or_build_hierarchy(
+                self.model, self.edge_weights, self.metric, self.network_cache
+            )
+        return self.hierarchy
+
+    def _route(self, origin, destination):
+        if origin == destination:
+            return (origin,)
+
+        if self.algorithm == "dijkstra":
+            path = self._dijkstra(origin, destination)
+        elif self.algorithm == "astar":
+            path = self._astar(origin, destination)
+        elif self.algorithm == "ch":
+            path = self.contractionHierarchy().query(origin, destination)
+        else:
+            path = self._bidirectional(origin, destination)
+
+        return tuple(path) if path is not None else None
+
+    def _dijkstra(self, origin, destination):
+        return self._astar(origin, destination, use_heuristic=False)
+
+    def _astar(self, origin, destination, use_heuristic=True):
+        """Search from edge origin to edge destination; returns the edge rows from one to the other"""
+        weights = self.weights
+        next_offsets, next_edges = self.next_offsets, self.next_edges
+        target = self.edge_from[destination]
+
+        if use_heuristic and self.heuristic_scale > 0 and target >= 0:
+            # Straight-line bound from the end of an edge to the start of the destination
+            tx, ty = self.junction_xy[target]
+            scale = self.heuristic_scale
+            xy, edge_to = self.junction_xy, self.edge_to
+
+            def heuristic(edge):
+                junction = edge_to[edge]
+                if edge == destination or junction < 0:
+                    return 0.0
+                x, y = xy[junction]
+                return scale * math.hypot(tx - x, ty - y)
+        else:
+            def heuristic(edge):
+                return 0.0
+
+        best = {origin: 0.0}
+        via = {}
+        heap = [(heuristic(origin), 0.0, origin)]
+        settled = set()
+
+        while heap:
+            _, cost, edge = heapq.heappop(heap)
+            if edge in settled:
+                continue
+            if edge == destination:
+                return self._unwind(via, origin, destination)
+            settled.add(edge)
+
+            for i in range(next_offsets[edge], next_offsets[edge + 1]):
+                neighbour = next_edges[i]
+                new_cost = cost + weights[neighbour]
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    via[neighbour] = edge
+                    heapq.heappush(heap, (new_cost + heuristic(neighbour), new_cost, neighbour))
+
+        return None
+
+    def _bidirectional(self, origin, destination):
+        """Bidirectional Dijkstra between two edges; returns the edge rows from one to the other"""
+        weights = self.weights
+        searches = (
+            # (adjacency offsets, adjacency edges, whether an arc costs the weight of its
+            # neighbour (forwards) or of the edge it is reached from (backwards))
+            (self.next_offsets, self.next_edges, True),
+            (self.prev_offsets, self.prev_edges, False),
+        )
+        best = ({origin: 0.0}, {destination: 0.0})
+        via = ({}, {})
+        heaps = ([(0.0, origin)], [(0.0, destination)])
+        settled = (set(), set())
+
+        shortest = math.inf
+        meeting = None
+
+        while heaps[0] and heaps[1]:
+            # Stop once no shorter connection can be found
+            if heaps[0][0][0] + heaps[1][0][0] >= shortest:
+                break
+
+            # Expand the smaller frontier
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            other = 1 - side
+            cost, edge = heapq.heappop(heaps[side])
+            if edge in settled[side]:
+                continue
+            settled[side].add(edge)
+
+            offsets, adjacent, forward = searches[side]
+            for i in range(offsets[edge], offsets[edge + 1]):
+                neighbour = adjacent[i]
+                new_cost = cost + weights[neighbour if forward else edge]
+                if new_cost < best[side].get(neighbour, math.inf):
+                    best[side][neighbour] = new_cost
+                    via[side][neighbour] = edge
+                    heapq.heappush(heaps[side], (new_cost, neighbour))
+
+                    total = new_cost + best[other].get(neighbour, math.inf)
+                    if total < shortest:
+                        shortest = total
+                        meeting = neighbour
+
+        if meeting is None:
+            return None
+
+        forward = self._unwind(via[0], origin, meeting)
+        backward = self._unwind(via[1], destination, meeting)
+        return forward + backward[::-1][1:]
+
+    def _unwind(self, via, start, end):
+        """Follow the edges stored in via back from end to start; returns the rows from start to end"""
+        path = [end]
+        edge = end
+        while edge != start:
+            edge = via[edge]
+            path.append(edge)
+        path.reverse()
+        return path
+
+
+def normalize_route_type(route_type):
+    """Map a combo box label ("Shortest Path") to its key in ROUTE_TYPES"""
+    return route_type.strip().lower().replace(" ", "_")
+
+
+def od_weights(model, weighting="uniform"):
+    """
+    Get the probability of each edge being picked as trip origin or destination
+
+    Args:
+        model (NetworkModel): The network
+        weighting (str): 'uniform', or 'capacity' to weight edges by lanes times length
+
+    Returns:
+        numpy.ndarray: Probabilities (zero for edges with unknown junctions)
+    """
+    weights = ((model.edge_from >= 0) & (model.edge_to >= 0)).astype(np.float64)
+    if weighting == "capacity":
+        weights *= model.edge_lanes * np.maximum(model.edge_length, 1.0)
+
+    total = weights.sum()
+    if total <= 0:
+        raise ValueError("The network has no edges to route on")
+    return weights / total
+
+
+def sample_od_pairs(model, count, rng=None, weights=None):
+    """
+    Draw origin and destination edges
+
+    Args:
+        model (NetworkModel): The network
+        count (int): Number of pairs
+        rng (numpy.random.Generator): Random generator (optional)
+        weights (numpy.ndarray): Edge probabilities from od_weights (optional)
+
+    Returns:
+        tuple: (origins, destinations) arrays of edge rows
+    """
+    rng = rng or np.random.default_rng()
+    if weights is None:
+        weights = od_weights(model)
+    origins = rng.choice(model.edge_count, size=count, p=weights)
+    destinations = rng.choice(model.edge_count, size=count, p=weights)
+    return origins, destinations
+
+
+def routing_pool(router, pair_count, workers=1):
+    """
+    Start a process pool for routing pair_count pairs, if it pays off
+
+    Returns:
+        A context manager giving a pool from parallel_routing.worker_pool, or
+        None if the pairs are better routed in this process (one worker, a
+        network not loaded from a file, or fewer than PARALLEL_ROUTING_MIN_PAIRS pairs)
+    """
+    if workers <= 1 or pair_count < PARALLEL_ROUTING_MIN_PAIRS or not router.model.network_file:
+        return nullcontext()
+
+    # Imported here since parallel_routing builds its routers from this module
+    from parallel_routing import worker_pool
+    return worker_pool(router.model, router.metric, router.algorithm, router.network_cache, workers)
+
+
+def route_all(router, origins, destinations, workers=1, pool=None):
+    """
+    Route origin-destination pairs, in a process pool with several workers
+
+    Args:
+        router (Router): Router for the network
+        origins (numpy.ndarray): Origin edge row of each pair
+        destinations (numpy.ndarray): Destination edge row of each pair
+        workers (int): Number of routing processes (see routing_pool for when
+            a process pool is used)
+        pool (ProcessPoolExecutor): Pool from routing_pool to reuse across
+            calls (optional, otherwise one is started for this call if needed)
+
+    Returns:
+        list: Path of each pair (tuple of edge rows), or None where unreachable
+    """
+    pair_count = len(origins)
+    with nullcontext(pool) if pool is not None else routing_pool(router, pair_count, workers) as pool:
+        if pool is not None and pair_count >= PARALLEL_ROUTING_MIN_PAIRS:
+            from parallel_routing import route_pairs
+            return route_pairs(router.model, origins, destinations, router.metric,
+                               router.algorithm, router.network_cache, workers, pool)
+        return [router.route(origin, destination)
+                for origin, destination in zip(np.asarray(origins).tolist(), np.asarray(destinations).tolist())]
+
+
+def route_demand(router, vehicle_count, rng=None, weighting="uniform", pool_size=OD_POOL_SIZE,
+                 workers=1):
+    """
+    Route a random demand over a shared set of OD pairs
+
+    A pool of OD pairs is drawn and routed once each; unreachable pairs are
+    dropped. Trips are later spread over the routes in proportion to how
+    often each route occurs in the pool. With several workers a large pool
+    is routed in a process pool (see routing_pool), started once for all
+    attempts, with the same result.
+
+    Args:
+        router (Router): Router for the network
+        vehicle_count (int): Number of trips
+        rng (numpy.random.Generator): Random generator (optional)
+        weighting (str): OD weighting passed to od_weights
+        pool_size (int): Maximum number of distinct OD pairs
+        workers (int): Number of routing processes (needs a network loaded from a file)
+
+    Returns:
+        tuple: (routes, shares) where routes maps route IDs to edge ID lists
+            and shares holds the fraction of trips on each route
+    """
+    rng = rng or np.random.default_rng()
+    model = router.model
+    weights = od_weights(model, weighting)
+
+    pair_count = min(max(vehicle_count, 1), pool_size)
+    counts = {}
+    with routing_pool(router, pair_count, workers) as process_pool:
+        # Retry a few times in case most sampled pairs are disconnected
+        for _ in range(3):
+            origins, destinations = sample_od_pairs(model, pair_count, rng, weights)
+            for path in route_all(router, origins, destinations, workers, process_pool):
+                if path is not None:
+                    counts[path] = counts.get(path, 0) + 1
+            if counts:
+                break
+
+    if not counts:
+        raise RuntimeError("No connected origin-destination pairs found in the network")
+
+    edge_ids = model.edge_ids
+    routes = {
+        f"route{i}": [edge_ids[edge] for edge in path] for i, path in enumerate(counts)
+    }
+    shares = np.array(list(counts.values()), dtype=np.float64)
+    return routes, shares / shares.sum()
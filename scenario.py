@@ -0,0 +1,385 @@
+import hashlib
+import json
+import os
+import shutil
+from collections import namedtuple
+
+import numpy as np
+
+from demand import generate_route_file, normalize_distribution
+from network_cache import DEFAULT_CACHE_DIR, evict_files, file_digest
+from od_demand import load_demand, read_taz, od_route_file
+from routing import ROUTE_TYPES, Router, normalize_route_type, route_demand
+from xml_stream import XMLStreamWriter
+
+# Bump when the meaning of scenario parameters or cached results changes
+SCENARIO_FORMAT_VERSION = 1
+
+# Seed used when a scenario does not choose one
+DEFAULT_SEED = 42
+
+# Simulation outputs written next to the configuration when data is collected
+SUMMARY_FILE = "summary.xml"
+TRIPINFO_FILE = "tripinfo.xml"
+
+# Everything that determines a simulation run. Two scenarios with the same
+# fingerprint (see scenario_fingerprint) produce the same demand and, with
+# SUMO seeded from seed, the same results.
+Scenario = namedtuple(
+    "Scenario",
+    "network_file vehicle_count duration distribution demand_mode route_type "
+    "routing_index step_length seed demand_file taz_file",
+    defaults=(100, 600, "uniform", "vehicles", "random", False, 0.1, DEFAULT_SEED, None, None)
+)
+
+
+def normalize_scenario(scenario):
+    """Bring combo box labels ("Rush Hour") in a scenario to their keys ("rush_hour")"""
+    return scenario._replace(
+        distribution=normalize_distribution(scenario.distribution),
+        demand_mode=scenario.demand_mode.strip().lower(),
+        route_type=normalize_route_type(scenario.route_type),
+        routing_index=bool(scenario.routing_index),
+        seed=int(scenario.seed),
+    )
+
+
+def scenario_fingerprint(scenario, network_cache=None):
+    """
+    Hash everything that determines the outcome of a scenario
+
+    Files enter the hash by content, so a scenario keeps its fingerprint
+    when its network or demand files are moved, and gets a new one when
+    they are edited.
+
+    Args:
+        scenario (Scenario): The scenario
+        network_cache (NetworkCache): Reuses the network's content hash (optional)
+
+    Returns:
+        str: Hex digest identifying the scenario
+    """
+    scenario = normalize_scenario(scenario)
+    parameters = scenario._asdict()
+
+    if network_cache:
+        parameters["network_file"] = network_cache.contentHash(scenario.network_file)
+    else:
+        parameters["network_file"] = file_digest(scenario.network_file)
+    for name in ("demand_file", "taz_file"):
+        if parameters[name]:
+            parameters[name] = file_digest(parameters[name])
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps([SCENARIO_FORMAT_VERSION, parameters], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def scenario_router(scenario, model, network_cache=None, router=None):
+    """
+    Get a router for the scenario's route type and routing index setting
+
+    Args:
+        scenario (Scenario): The scenario
+        model (NetworkModel): Network of the scenario
+        network_cache (NetworkCache): Where the routing index is kept (optional)
+        router (Router): Previous router, reused (with its route cache) if it still fits
+
+    Returns:
+        Router: The router
+    """
+    metric, _ = ROUTE_TYPES[normalize_route_type(scenario.route_type)]
+    algorithm = "ch" if scenario.routing_index else "astar"
+
+    if (router is None or router.model is not model
+            or router.metric != metric or router.algorithm != algorithm):
+        router = Router(model, metric, algorithm, network_cache=network_cache)
+    return router
+
+
+def write_scenario_routes(scenario, route_file, router, demand_matrix=None, taz=None, workers=1):
+    """
+    Generate the demand of a scenario
+
+    All random draws come from a generator seeded with the scenario's
+    seed, so the same scenario always gets the same route file, whatever
+    the number of routing workers.
+
+    Args:
+        scenario (Scenario): The scenario
+        route_file (str): Path to save the route file
+        router (Router): Router for the scenario's network (see scenario_router)
+        demand_matrix (ODMatrix): Already loaded scenario.demand_file (optional)
+        taz (dict): Already loaded scenario.taz_file (optional)
+        workers (int): Number of routing processes (see routing.route_all)
+
+    Returns:
+        str: Path to the created route file
+    """
+    rng = np.random.default_rng(scenario.seed)
+
+    if scenario.demand_file:
+        if demand_matrix is None:
+            demand_matrix = load_demand(scenario.demand_file)
+        if taz is None and scenario.taz_file:
+            taz = read_taz(scenario.taz_file)
+
+        _, trips, dropped = od_route_file(
+            route_file, demand_matrix, router, taz, 0, scenario.duration,
+            scenario.demand_mode, rng=rng, workers=workers
+        )
+        if dropped:
+            print(f"Dropped {dropped} of {trips + dropped} imported trips without edges or route")
+        return route_file
+
+    _, weighting = ROUTE_TYPES[normalize_route_type(scenario.route_type)]
+    routes, shares = route_demand(router, scenario.vehicle_count, rng, weighting, workers=workers)
+    return generate_route_file(
+        route_file, routes, scenario.vehicle_count, 0, scenario.duration,
+        scenario.distribution, scenario.demand_mode, shares, rng
+    )
+
+
+def write_scenario_config(scenario, directory, route_file, collect_data=True):
+    """
+    Write the SUMO configuration of a scenario
+
+    The network file is copied into directory (unless it is already
+    there), so the configuration can refer to it by name.
+
+    Args:
+        scenario (Scenario): The scenario
+        directory (str): Directory for the configuration and the outputs
+        route_file (str): Route file in directory (see write_scenario_routes)
+        collect_data (bool): Write summary and tripinfo outputs
+
+    Returns:
+        str: Path to the created configuration file
+    """
+    config_file = os.path.join(directory, "sim.sumocfg")
+
+    with XMLStreamWriter(config_file) as writer:
+        writer.start("configuration")
+
+        writer.start("input")
+        writer.element("net-file", {"value": os.path.basename(scenario.network_file)})
+        writer.element("route-files", {"value": os.path.basename(route_file)})
+        writer.end()
+
+        writer.start("defaults")
+        writer.start("randomize")
+        writer.element("vehicle.depart-pos", {"value": "random"})
+        writer.element("vehicle.departspeed", {"value": "random"})
+        writer.end()
+        writer.end()
+
+        # Random departures are repeatable with a fixed seed
+        writer.start("random_number")
+        writer.element("seed", {"value": str(scenario.seed)})
+        writer.end()
+
+        writer.start("time")
+        writer.element("begin", {"value": "0"})
+        writer.element("end", {"value": str(scenario.duration)})
+        writer.element("step-length", {"value": str(scenario.step_length)})
+        writer.end()
+
+        if collect_data:
+            writer.start("output")
+            writer.element("summary-output", {"value": os.path.join(directory, SUMMARY_FILE)})
+            writer.element("tripinfo-output", {"value": os.path.join(directory, TRIPINFO_FILE)})
+            writer.end()
+
+        writer.start("report")
+        writer.element("verbose", {"value": "false"})
+        writer.element("no-step-log", {"value": "true"})
+        writer.end()
+
+        writer.end()
+
+    # Copy network file to the directory if it's not already there
+    if not os.path.exists(os.path.join(directory, os.path.basename(scenario.network_file))):
+        shutil.copy(scenario.network_file, directory)
+
+    return config_file
+
+
+def _touch(path):
+    """Mark a cache entry as recently used; returns its path, or None if it is missing"""
+    if not os.path.exists(path):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+class ScenarioCache:
+    """
+    Cache of generated demand and run results, keyed by scenario fingerprint
+
+    Identical scenarios reuse the route file generated for the first one,
+    and results stored for a finished run are returned instead of
+    simulating again. The least recently used entries are evicted once
+    the cache grows past max_bytes.
+    """
+    def __init__(self, cache_dir=None, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "scenarios")
+        self.max_bytes = max_bytes
+
+    def routeFile(self, fingerprint):
+        """Get the path of the cached route file for a scenario"""
+        return os.path.join(self.cache_dir, f"{fingerprint}.rou.xml")
+
+    def resultFile(self, fingerprint):
+        """Get the path of the cached results for a scenario"""
+        return os.path.join(self.cache_dir, f"{fingerprint}.result.json")
+
+    def lookupRoutes(self, fingerprint):
+        """
+        Get the cached route file of a scenario
+
+        Returns:
+            str: Path to the route file, or None on a miss
+        """
+        return _touch(self.routeFile(fingerprint))
+
+    def storeRoutes(self, fingerprint, route_file):
+        """
+        Add a generated route file to the cache
+
+        Returns:
+            str: Path to the cached copy, or None if it could not be written
+        """
+        cached_file = self.routeFile(fingerprint)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = cached_file + ".tmp"
+            shutil.copyfile(route_file, temp_file)
+            os.replace(temp_file, cached_file)
+            self._evict()
+        except OSError as e:
+            print(f"Could not write scenario cache {cached_file}: {e}")
+            return None
+        return cached_file if os.path.exists(cached_file) else None
+
+    def lookupResult(self, fingerprint):
+        """
+        Get the stored results of a scenario
+
+        Returns:
+            dict: The results, or None if the scenario has not been run
+        """
+        result_file = _touch(self.resultFile(fingerprint))
+        if not result_file:
+            return None
+        try:
+            with open(result_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def storeResult(self, fingerprint, result):
+        """
+        Store the results of a finished run
+
+        Args:
+            fingerprint (str): Scenario fingerprint
+            result (dict): JSON serializable results
+        """
+        result_file = self.resultFile(fingerprint)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = result_file + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(result, f)
+            os.replace(temp_file, result_file)
+            self._evict()
+        except OSError as e:
+            print(f"Could not write scenario results {result_file}: {e}")
+
+    def clear(self):
+        """Remove all cached scenarios"""
+        if os.path.isdir(self.cache_dir):
+            evict_files(self.cache_dir, 0, (".rou.xml", ".result.json", ".tmp"))
+
+    def _evict(self):
+        evict_files(self.cache_dir, self.max_bytes, (".rou.xml", ".result.json"))
+
+
+class CheckpointCache:
+    """
+    Cache of saved simulation states, keyed by scenario fingerprint and time
+
+    A run that only cares about a late period of a scenario restores the
+    state saved at its start instead of simulating the warm-up again, and
+    what-if variants can all branch from one state. The least recently
+    used states are evicted once the cache grows past max_bytes.
+    """
+    SUFFIX = ".state.xml.gz"
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024 * 1024 * 1024):
+        self.cache_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "checkpoints")
+        self.max_bytes = max_bytes
+
+    def stateFile(self, fingerprint, time):
+        """Get the path of the cached state of a scenario at a simulation time"""
+        return os.path.join(self.cache_dir, f"{fingerprint}-{float(time):g}{self.SUFFIX}")
+
+    def lookup(self, fingerprint, time):
+        """
+        Get the state of a scenario saved at a simulation time
+
+        Returns:
+            str: Path to the state file, or None on a miss
+        """
+        return _touch(self.stateFile(fingerprint, time))
+
+    def times(self, fingerprint):
+        """
+        Get the simulation times a scenario has cached states for
+
+        Returns:
+            list: Times in seconds, ascending
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        prefix = f"{fingerprint}-"
+        times = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith(self.SUFFIX):
+                try:
+                    times.append(float(name[len(prefix):-len(self.SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(times)
+
+    def store(self, fingerprint, time, state_file):
+        """
+        Add a saved state to the cache
+
+        Args:
+            fingerprint (str): Fingerprint of the scenario the state was saved in
+            time (float): Simulation time the state was saved at
+            state_file (str): State written by TraciSimulationController.saveState
+
+        Returns:
+            str: Path to the cached copy, or None if it could not be written
+        """
+        cached_file = self.stateFile(fingerprint, time)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_file = cached_file + ".tmp"
+            shutil.copyfile(state_file, temp_file)
+            os.replace(temp_file, cached_file)
+            evict_files(self.cache_dir, self.max_bytes, (self.SUFFIX,))
+        except OSError as e:
+            print(f"Could not write checkpoint cache {cached_file}: {e}")
+            return None
+        return cached_file if os.path.exists(cached_file) else None
+
+    def clear(self):
+        """Remove all cached states"""
+        if os.path.isdir(self.cache_dir):
+            evict_files(self.cache_dir, 0, (self.SUFFIX, ".tmp"))
@@ -0,0 +1,190 @@
+import re
+import tempfile
+
+from PyQt6.QtCore import QObject, QProcess, pyqtSignal
+
+# Progress lines printed by SUMO tools, e.g. "Parsing edges from 'x.edg.xml'... done."
+# or "Computing turning directions ... done (12ms)."
+STEP_DONE_PATTERN = re.compile(r"^(.*?)\s*\.\.\.\s*done\b")
+PERCENT_PATTERN = re.compile(r"(\d{1,3}(?:\.\d+)?)%")
+
+
+class SumoToolJob(QObject):
+    """
+    Runs a SUMO command line tool in the background with QProcess
+
+    Several commands can be given; they are tried in order until one
+    succeeds, so a fast path can fall back to a slower one. Output is
+    parsed for progress and the result is delivered through signals, so
+    the GUI thread never waits on the tool.
+    """
+    progress = pyqtSignal(int, str)  # Percent done (-1 if unknown), last step reported
+    finished = pyqtSignal(str)  # Path to the produced artifact
+    failed = pyqtSignal(str)  # Error message
+    cancelled = pyqtSignal()
+
+    def __init__(self, commands, artifact, expected_steps=0, parent=None):
+        """
+        Args:
+            commands (list): Command lines (program followed by arguments) to try in
+                order, or callables returning one when it is reached
+            artifact (str): File written by the tool
+            expected_steps (int): Number of "... done" steps a run reports, used to
+                estimate progress when the tool prints no percentages (0 if unknown)
+            parent (QObject): Parent object
+        """
+        super().__init__(parent)
+        self.commands = list(commands)
+        self.artifact = artifact
+        self.expected_steps = expected_steps
+        self.steps_done = 0
+        self.output_tail = []
+        self.is_cancelled = False
+
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.ProcessChannelMode.MergedChannels)
+        self.process.readyReadStandardOutput.connect(self._readOutput)
+        self.process.finished.connect(self._processFinished)
+        self.process.errorOccurred.connect(self._processError)
+
+    def start(self):
+        """Start the job (it completes right away if there is nothing to run)"""
+        if not self.commands:
+            self._succeed()
+            return
+        self._startNext()
+
+    def cancel(self):
+        """Stop the running tool; emits cancelled instead of finished or failed"""
+        if self.is_cancelled:
+            return
+        self.is_cancelled = True
+        self.commands = []
+        if self.process.state() != QProcess.ProcessState.NotRunning:
+            self.process.kill()
+            self.process.waitForFinished(1000)
+        self.cleanup()
+        self.cancelled.emit()
+
+    def isRunning(self):
+        return self.process.state() != QProcess.ProcessState.NotRunning
+
+    def complete(self):
+        """Hook for subclasses to post-process the artifact; returns the path to deliver"""
+        return self.artifact
+
+    def cleanup(self):
+        """Hook for subclasses to release temporary files once the job is over"""
+        pass
+
+    def _startNext(self):
+        command = self.commands.pop(0)
+        if callable(command):
+            try:
+                command = command()
+            except Exception as e:
+                self.commands = []
+                self._fail(f"Could not prepare the command: {e}")
+                return
+        self.steps_done = 0
+        self.output_tail = []
+        self.progress.emit(0, "")
+        self.process.start(command[0], command[1:])
+
+    def _readOutput(self):
+        text = bytes(self.process.readAllStandardOutput()).decode(errors="replace")
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+
+            # Keep the last lines for error messages
+            self.output_tail = (self.output_tail + [line])[-20:]
+
+            percent = PERCENT_PATTERN.search(line)
+            step = STEP_DONE_PATTERN.match(line)
+            if percent:
+                self.progress.emit(min(int(float(percent.group(1))), 100), line)
+            elif step:
+                self.steps_done += 1
+                if self.expected_steps:
+                    self.progress.emit(min(99, 100 * self.steps_done // self.expected_steps), step.group(1))
+                else:
+                    self.progress.emit(-1, step.group(1))
+
+    def _processFinished(self, exit_code, exit_status):
+        if self.is_cancelled:
+            return
+
+        if exit_status == QProcess.ExitStatus.NormalExit and exit_code == 0:
+            self._succeed()
+        elif self.commands:
+            print(f"{self.process.program()} failed (exit code {exit_code}), trying fallback")
+            self._startNext()
+        else:
+            self._fail(f"{self.process.program()} exited with code {exit_code}")
+
+    def _processError(self, error):
+        # Crashes are reported through finished as well
+        if error == QProcess.ProcessError.FailedToStart and not self.is_cancelled:
+            self.commands = []
+            self._fail(f"Could not start {self.process.program()}: {self.process.errorString()}")
+
+    def _succeed(self):
+        try:
+            artifact = self.complete()
+        except Exception as e:
+            self._fail(str(e))
+            return
+        self.cleanup()
+        self.progress.emit(100, "")
+        self.finished.emit(artifact)
+
+    def _fail(self, message):
+        if self.output_tail:
+            message += "\n" + "\n".join(self.output_tail)
+        self.cleanup()
+        self.failed.emit(message)
+
+
+class NetconvertJob(SumoToolJob):
+    """
+    Builds a network with netconvert in the background
+
+    Runs the same build as SumoUtils.network_to_xml, including the build
+    cache and incremental patching.
+    """
+    # Roughly the number of "... done" steps netconvert reports with --verbose
+    NETCONVERT_STEPS = 30
+
+    def __init__(self, sumo_utils, nodes, edges, output_file=None, options=None, cache=None, parent=None):
+        """
+        Args:
+            sumo_utils (SumoUtils): Provides the netconvert binary and build planning
+            nodes (list): List of (id, x, y) tuples for nodes
+            edges (list): List of (id, from_node, to_node, lanes, speed) tuples for edges
+            output_file (str): Path to save the network file (optional)
+            options (list): Extra netconvert command line options (optional)
+            cache (NetworkBuildCache): Build cache to reuse networks from (optional)
+            parent (QObject): Parent object
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.sumo_utils = sumo_utils
+        self.nodes = nodes
+        self.edges = edges
+        self.output_file = output_file
+        self.cache = cache
+        self.build = sumo_utils.plan_network_build(
+            nodes, edges, self.temp_dir.name, options, cache, verbose=True
+        )
+        super().__init__(self.build.commands, self.build.built_file, self.NETCONVERT_STEPS, parent)
+
+    def complete(self):
+        return self.sumo_utils.finish_network_build(
+            self.build, self.nodes, self.edges, self.output_file, self.cache
+        )
+
+    def cleanup(self):
+        if self.temp_dir:
+            self.temp_dir.cleanup()
+            self.temp_dir = None
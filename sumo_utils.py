@@ -1,8 +1,191 @@
+import gzip
 import os
+import shutil
 import subprocess
 import tempfile
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from collections import namedtuple
+
+import numpy as np
+
+from demand import generate_route_file
+from routing import ROUTE_TYPES, normalize_route_type, route_demand
+from xml_stream import XMLStreamWriter
+
+# Compact records produced by the streaming network reader
+JunctionRecord = namedtuple("JunctionRecord", "id x y type")
+EdgeRecord = namedtuple("EdgeRecord", "id from_node to_node lanes speed length function shape")
+ConnectionRecord = namedtuple("ConnectionRecord", "from_edge to_edge")
+
+DEFAULT_SPEED = 13.89  # 50 km/h, used when a lane has no speed attribute
+
+# Edge functions that are not roads in their own right (junction internals,
+# pedestrian crossings/walking areas and district connectors)
+NON_ROAD_FUNCTIONS = {"internal", "crossing", "walkingarea", "connector"}
+
+# Largest share of changed elements (relative to the edge count) for which
+# network_to_xml patches the previous build instead of rebuilding it
+INCREMENTAL_BUILD_LIMIT = 0.25
+
+# A planned netconvert run: the commands to try in order and the file they write
+NetworkBuild = namedtuple("NetworkBuild", "key command commands built_file")
+
+
+def open_network_file(network_file):
+    """
+    Open a (possibly gzip compressed) SUMO XML file for binary reading
+    
+    Compression is detected from the file contents, so .net.xml.gz files
+    work regardless of their name.
+    """
+    with open(network_file, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(network_file, 'rb')
+    return open(network_file, 'rb')
+
+
+def parse_shape(shape):
+    """Parse a SUMO shape attribute ("x1,y1 x2,y2 ...") into a tuple of (x, y) points"""
+    if not shape:
+        return ()
+    return tuple(
+        tuple(float(value) for value in point.split(',')[:2])
+        for point in shape.split()
+    )
+
+
+def is_lane_permitted(allow, disallow, vclass):
+    """
+    Check whether a lane with the given allow/disallow attributes may be used by a vehicle class
+    
+    Args:
+        allow (str): The lane's allow attribute (space separated classes) or None
+        disallow (str): The lane's disallow attribute or None
+        vclass (str): SUMO vehicle class, e.g. "passenger"
+        
+    Returns:
+        bool: True if vehicles of the class may use the lane
+    """
+    if allow:
+        classes = allow.split()
+        return vclass in classes or "all" in classes
+    if disallow:
+        classes = disallow.split()
+        return vclass not in classes and "all" not in classes
+    return True
+
+
+def iter_network(network_file, vclass="passenger"):
+    """
+    Stream the junctions, edges and connections of a SUMO network file
+    
+    Uses iterparse and discards every top-level element once it has been
+    read, so peak memory is proportional to a single element rather than
+    to the whole document (plus the permitted lanes of each edge, which
+    the connections are checked against).
+    
+    Internal junctions, edges whose function is not a plain road
+    (internal, crossing, walkingarea, connector) and edges that no lane
+    permits for vclass are skipped while streaming. So are connections
+    between skipped edges or from/to a lane vclass may not use.
+    Connections are reported once per pair of edges, however many lanes
+    they link.
+    
+    Args:
+        network_file (str): Path to the .net.xml or .net.xml.gz file
+        vclass (str): Vehicle class the edges must be drivable by, or None
+            to return every junction, edge and connection in the file
+        
+    Yields:
+        JunctionRecord, EdgeRecord or ConnectionRecord: One record per
+            junction / edge / pair of connected edges, in file order
+    """
+    with open_network_file(network_file) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        depth = 0
+        permitted_lanes = {}  # Edge ID -> indices of the lanes vclass may use
+        connected = set()
+        
+        for event, elem in context:
+            if event == "start":
+                depth += 1
+                continue
+            
+            depth -= 1
+            if depth > 0:
+                # Child of a top-level element (lane, request, ...), handled with its parent
+                continue
+            
+            if elem.tag == "junction":
+                if vclass and elem.get("type") == "internal":
+                    root.clear()
+                    continue
+                
+                yield JunctionRecord(
+                    elem.get("id"),
+                    float(elem.get("x", 0)),
+                    float(elem.get("y", 0)),
+                    elem.get("type", "")
+                )
+            elif elem.tag == "edge":
+                function = elem.get("function", "normal")
+                lanes = elem.findall("lane")
+                
+                if vclass:
+                    permitted = {
+                        lane.get("index") for lane in lanes
+                        if is_lane_permitted(lane.get("allow"), lane.get("disallow"), vclass)
+                    }
+                    if function in NON_ROAD_FUNCTIONS or not permitted:
+                        root.clear()
+                        continue
+                    permitted_lanes[elem.get("id")] = permitted
+                
+                first_lane = lanes[0] if lanes else None
+                
+                speed = DEFAULT_SPEED
+                length = 0.0
+                if first_lane is not None:
+                    speed = float(first_lane.get("speed", speed))
+                    length = float(first_lane.get("length", length))
+                
+                # Prefer the edge's own shape, otherwise use its middle lane
+                shape = elem.get("shape")
+                if not shape and lanes:
+                    shape = lanes[len(lanes) // 2].get("shape")
+                
+                yield EdgeRecord(
+                    elem.get("id"),
+                    elem.get("from"),
+                    elem.get("to"),
+                    len(lanes),
+                    speed,
+                    length,
+                    function,
+                    parse_shape(shape)
+                )
+            elif elem.tag == "connection":
+                pair = (elem.get("from"), elem.get("to"))
+                if pair in connected:
+                    root.clear()
+                    continue
+                
+                if vclass:
+                    from_lanes = permitted_lanes.get(pair[0], ())
+                    to_lanes = permitted_lanes.get(pair[1], ())
+                    if (elem.get("fromLane") not in from_lanes or elem.get("toLane") not in to_lanes
+                            or not is_lane_permitted(elem.get("allow"), elem.get("disallow"), vclass)):
+                        root.clear()
+                        continue
+                
+                connected.add(pair)
+                yield ConnectionRecord(*pair)
+            
+            # Drop everything read so far
+            root.clear()
+
 
 class SumoUtils:
     """Utility class for interacting with SUMO"""
@@ -23,22 +206,155 @@ class SumoUtils:
             if not os.path.exists(bin_file) and not os.path.exists(bin_file + '.exe'):
                 raise FileNotFoundError(f"SUMO binary not found at {bin_file}")
     
-    def network_to_xml(self, nodes, edges, output_file=None):
+    def network_to_xml(self, nodes, edges, output_file=None, options=None, cache=None):
         """
         Convert network data to SUMO XML format
         
+        The plain node and edge files are written to a temporary directory
+        that is removed once netconvert has finished. With a build cache,
+        netconvert is skipped entirely when the same network was built
+        before with the same options, and small edits since the last build
+        are applied to that build as a netconvert patch instead of
+        converting the whole network again.
+        
+        This blocks until netconvert is done; sumo_jobs.NetconvertJob runs
+        the same build in the background.
+        
         Args:
             nodes (list): List of (id, x, y) tuples for nodes
             edges (list): List of (id, from_node, to_node, lanes, speed) tuples for edges
             output_file (str): Path to save the network file (optional)
+            options (list): Extra netconvert command line options (optional)
+            cache (NetworkBuildCache): Build cache to reuse networks from (optional)
             
         Returns:
             str: Path to the created network file
         """
-        temp_dir = tempfile.mkdtemp()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            build = self.plan_network_build(nodes, edges, temp_dir, options, cache)
+            
+            for index, cmd in enumerate(build.commands):
+                if callable(cmd):
+                    cmd = cmd()
+                try:
+                    subprocess.run(cmd, check=True)
+                    break
+                except subprocess.CalledProcessError as e:
+                    if index == len(build.commands) - 1:
+                        raise RuntimeError(f"Failed to convert network: {e}")
+                    print(f"Incremental network build failed, rebuilding from scratch: {e}")
+            
+            return self.finish_network_build(build, nodes, edges, output_file, cache)
+    
+    def plan_network_build(self, nodes, edges, directory, options=None, cache=None, verbose=False):
+        """
+        Prepare a netconvert build without running it
+        
+        Writes the netconvert input to directory and works out the commands
+        to try in order: a patch of the previous build when only a few
+        elements changed (see NetworkBuildCache.changesSince), then the
+        full conversion. Behind a patch, the full conversion is a callable
+        that writes its input and returns the command line when it is
+        reached. On a build cache hit there is nothing to run.
+        
+        Args:
+            nodes (list): List of (id, x, y) tuples for nodes
+            edges (list): List of (id, from_node, to_node, lanes, speed) tuples for edges
+            directory (str): Directory for the netconvert input and output
+            options (list): Extra netconvert command line options (optional)
+            cache (NetworkBuildCache): Build cache to reuse networks from (optional)
+            verbose (bool): Let netconvert report its progress (does not change the build)
+            
+        Returns:
+            NetworkBuild: The build key, the commands (or callables returning
+                them) to try and the file they write
+        """
+        command = [self.netconvert_bin] + list(options or [])
+        key = cache.buildKey(nodes, edges, command) if cache else None
+        
+        cached_file = cache.lookup(key) if cache else None
+        if cached_file:
+            return NetworkBuild(key, command, [], cached_file)
+        
+        built_file = os.path.join(directory, "network.net.xml")
+        extra_options = command[1:] + (["--verbose"] if verbose else [])
+        commands = []
         
+        # Small edits are applied as a patch to the previous build; junctions
+        # that lose all their edges are dropped by netconvert, so removed
+        # nodes need no entry of their own
+        patch = cache.changesSince(nodes, edges, command) if cache else None
+        if patch:
+            changed = len(patch.nodes) + len(patch.edges) + len(patch.removed_edges)
+            if changed <= INCREMENTAL_BUILD_LIMIT * max(len(edges), 1):
+                nodes_file, edges_file = self.write_plain_xml(
+                    patch.nodes, patch.edges, directory, prefix="patch_",
+                    deleted_edges=patch.removed_edges
+                )
+                commands.append(command[:1] + [
+                    "-s", patch.base_file,
+                    "-n", nodes_file,
+                    "-e", edges_file,
+                    "-o", built_file
+                ] + extra_options)
+        
+        def full_conversion():
+            nodes_file, edges_file = self.write_plain_xml(nodes, edges, directory)
+            return command[:1] + [
+                "-n", nodes_file,
+                "-e", edges_file,
+                "-o", built_file
+            ] + extra_options
+        
+        # Behind a patch, the full export is only written if the patch fails
+        commands.append(full_conversion if commands else full_conversion())
+        
+        return NetworkBuild(key, command, commands, built_file)
+    
+    def finish_network_build(self, build, nodes, edges, output_file=None, cache=None):
+        """
+        Store a completed build in the cache and copy it to its destination
+        
+        Args:
+            build (NetworkBuild): Build returned by plan_network_build, after one of its commands succeeded
+            nodes (list): Nodes the build was planned for
+            edges (list): Edges the build was planned for
+            output_file (str): Path to save the network file (optional)
+            cache (NetworkBuildCache): Build cache passed to plan_network_build (optional)
+            
+        Returns:
+            str: Path to the created network file
+        """
+        if cache:
+            if build.commands:
+                cached_file = cache.store(build.key, build.built_file)
+            else:
+                cached_file = build.built_file
+            if cached_file:
+                cache.recordBuild(build.key, nodes, edges, build.command)
+                return self._deliver_network(cached_file, output_file)
+        
+        if not output_file:
+            output_file = os.path.join(tempfile.mkdtemp(), "network.net.xml")
+        shutil.move(build.built_file, output_file)
+        return output_file
+    
+    def write_plain_xml(self, nodes, edges, directory, prefix="", deleted_edges=()):
+        """
+        Write nodes and edges as netconvert plain XML input
+        
+        Args:
+            nodes (list): List of (id, x, y) tuples for nodes
+            edges (list): List of (id, from_node, to_node, lanes, speed) tuples for edges
+            directory (str): Directory to write the files to
+            prefix (str): Prefix for the file names (optional)
+            deleted_edges (list): IDs of edges to remove, for patch files (optional)
+            
+        Returns:
+            tuple: (nodes_file, edges_file) paths
+        """
         # Create nodes file
-        nodes_file = os.path.join(temp_dir, "nodes.nod.xml")
+        nodes_file = os.path.join(directory, f"{prefix}nodes.nod.xml")
         with open(nodes_file, 'w') as f:
             f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
             f.write('<nodes>\n')
@@ -47,109 +363,66 @@ class SumoUtils:
             f.write('</nodes>\n')
         
         # Create edges file
-        edges_file = os.path.join(temp_dir, "edges.edg.xml")
+        edges_file = os.path.join(directory, f"{prefix}edges.edg.xml")
         with open(edges_file, 'w') as f:
             f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
             f.write('<edges>\n')
+            for edge_id in deleted_edges:
+                f.write(f'    <delete id="{edge_id}"/>\n')
             for edge_id, from_node, to_node, lanes, speed in edges:
                 f.write(f'    <edge id="{edge_id}" from="{from_node}" to="{to_node}" numLanes="{lanes}" speed="{speed}"/>\n')
             f.write('</edges>\n')
         
-        # Use netconvert to create the network file
+        return nodes_file, edges_file
+    
+    def _deliver_network(self, built_file, output_file):
+        """Copy a built network to the requested location (or hand out the build itself)"""
         if not output_file:
-            output_file = os.path.join(temp_dir, "network.net.xml")
-            
-        cmd = [
-            self.netconvert_bin,
-            "-n", nodes_file,
-            "-e", edges_file,
-            "-o", output_file
-        ]
-        
-        try:
-            subprocess.run(cmd, check=True)
-            return output_file
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to convert network: {e}")
+            return built_file
+        if os.path.abspath(built_file) != os.path.abspath(output_file):
+            shutil.copyfile(built_file, output_file)
+        return output_file
     
-    def create_route_file(self, edges, output_file, vehicle_count=100, start_time=0, end_time=3600, distribution='uniform'):
+    def create_route_file(self, edges, output_file, vehicle_count=100, start_time=0, end_time=3600, distribution='uniform', mode='vehicles',
+                          router=None, route_type='fastest_path', workers=1, seed=None):
             """
             Create a route file for simulation
             
             Args:
-                edges (list): List of edge IDs that form the route
+                edges (list): List of edge IDs that form the route (used without a router)
                 output_file (str): Path to save the route file
                 vehicle_count (int): Number of vehicles to generate
                 start_time (int): Simulation start time in seconds
                 end_time (int): Simulation end time in seconds
                 distribution (str): Distribution type for vehicles
+                mode (str): 'vehicles' for one element per vehicle, 'flows' for
+                    <flow> elements whose size does not grow with vehicle_count
+                router (Router): Router for the network; if given, vehicles follow
+                    routes between random origin-destination pairs (optional)
+                route_type (str): Key of routing.ROUTE_TYPES choosing the OD weighting
+                workers (int): Number of processes routing the OD pairs (see
+                    routing.route_all); the demand is the same for any number
+                seed (int): Seed for all random draws, for reproducible demand (optional)
                 
             Returns:
                 str: Path to the created route file
             """
-            import numpy as np
+            rng = np.random.default_rng(seed)
             
-            # Create the route XML
-            root = ET.Element("routes")
+            if router is None:
+                return generate_route_file(
+                    output_file, {"main_route": list(edges)}, vehicle_count, start_time, end_time,
+                    distribution, mode, rng=rng
+                )
             
-            # Add vehicle type
-            vtype = ET.SubElement(root, "vType")
-            vtype.set("id", "car")
-            vtype.set("accel", "2.6")
-            vtype.set("decel", "4.5")
-            vtype.set("sigma", "0.5")
-            vtype.set("length", "5.0")
-            vtype.set("maxSpeed", "50.0")
-            
-            # Add route
-            route = ET.SubElement(root, "route")
-            route.set("id", "main_route")
-            route.set("edges", " ".join(edges))
-            
-            # Generate vehicles with different distributions
-            for i in range(vehicle_count):
-                # Calculate departure time based on distribution
-                if distribution == 'uniform':
-                    depart_time = start_time + (i * (end_time - start_time) / vehicle_count)
-                elif distribution == 'poisson':
-                    # Poisson distribution
-                    depart_time = start_time + np.random.poisson(
-                        (end_time - start_time) / vehicle_count
-                    )
-                elif distribution == 'normal':
-                    # Normal distribution
-                    depart_time = start_time + max(0, np.random.normal(
-                        loc=(start_time + end_time) / 2, 
-                        scale=(end_time - start_time) / 6
-                    ))
-                elif distribution == 'rush_hour':
-                    # Concentrate vehicles in the middle third of simulation time
-                    rush_start = start_time + (end_time - start_time) * 0.3
-                    rush_end = start_time + (end_time - start_time) * 0.7
-                    depart_time = rush_start + (i * (rush_end - rush_start) / vehicle_count)
-                else:
-                    # Fallback to uniform
-                    depart_time = start_time + (i * (end_time - start_time) / vehicle_count)
-                
-                # Ensure depart time is within simulation duration
-                depart_time = min(max(start_time, depart_time), end_time - 1)
-                
-                vehicle = ET.SubElement(root, "vehicle")
-                vehicle.set("id", f"veh{i}")
-                vehicle.set("type", "car")
-                vehicle.set("route", "main_route")
-                vehicle.set("depart", f"{depart_time:.2f}")
-                vehicle.set("departPos", "random")
-            
-            # Write to file with pretty formatting
-            rough_string = ET.tostring(root, 'utf-8')
-            reparsed = minidom.parseString(rough_string)
-            with open(output_file, 'w') as f:
-                f.write(reparsed.toprettyxml(indent="    "))
-                
-            return output_file
+            _, weighting = ROUTE_TYPES[normalize_route_type(route_type)]
+            routes, shares = route_demand(router, vehicle_count, rng, weighting, workers=workers)
+            return generate_route_file(
+                output_file, routes, vehicle_count, start_time, end_time,
+                distribution, mode, shares, rng
+            )
     
-    def create_config_file(self, network_file, route_file, output_file, gui=True, step_length=0.1, end_time=3600):
+    def create_config_file(self, network_file, route_file, output_file, gui=True, step_length=0.1, end_time=3600, seed=None):
         """
         Create a SUMO configuration file
         
@@ -160,34 +433,33 @@ class SumoUtils:
             gui (bool): Whether to use the GUI version
             step_length (float): Simulation step length in seconds
             end_time (int): Simulation end time in seconds
+            seed (int): Seed for SUMO's random number generator (optional)
             
         Returns:
             str: Path to the created configuration file
         """
-        # Create the configuration XML
-        root = ET.Element("configuration")
-        
-        # Input section
-        input_section = ET.SubElement(root, "input")
-        net_file = ET.SubElement(input_section, "net-file")
-        net_file.set("value", os.path.basename(network_file))
-        route_files = ET.SubElement(input_section, "route-files")
-        route_files.set("value", os.path.basename(route_file))
-        
-        # Time section
-        time_section = ET.SubElement(root, "time")
-        begin = ET.SubElement(time_section, "begin")
-        begin.set("value", "0")
-        end = ET.SubElement(time_section, "end")
-        end.set("value", str(end_time))
-        step_length_elem = ET.SubElement(time_section, "step-length")
-        step_length_elem.set("value", str(step_length))
-        
-        # Write to file with pretty formatting
-        rough_string = ET.tostring(root, 'utf-8')
-        reparsed = minidom.parseString(rough_string)
-        with open(output_file, 'w') as f:
-            f.write(reparsed.toprettyxml(indent="    "))
+        with XMLStreamWriter(output_file) as writer:
+            writer.start("configuration")
+            
+            # Input section
+            writer.start("input")
+            writer.element("net-file", {"value": os.path.basename(network_file)})
+            writer.element("route-files", {"value": os.path.basename(route_file)})
+            writer.end()
+            
+            # Time section
+            writer.start("time")
+            writer.element("begin", {"value": "0"})
+            writer.element("end", {"value": str(end_time)})
+            writer.element("step-length", {"value": str(step_length)})
+            writer.end()
+            
+            if seed is not None:
+                writer.start("random_number")
+                writer.element("seed", {"value": str(seed)})
+                writer.end()
+            
+            writer.end()
             
         return output_file
     
@@ -215,46 +487,37 @@ class SumoUtils:
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to run simulation: {e}")
     
-    def extract_network_data(self, network_file):
+    def extract_network_data(self, network_file, cache=None):
         """
         Extract node and edge data from an existing SUMO network file
         
+        The file is streamed (see iter_network), so large and gzip
+        compressed networks can be loaded without reading the whole
+        document into memory.
+        
         Args:
-            network_file (str): Path to the network file
+            network_file (str): Path to the network file (.net.xml or .net.xml.gz)
+            cache (NetworkCache): Parsed network cache to read from (optional)
             
         Returns:
-            tuple: (nodes, edges) where nodes and edges are lists of data
+            tuple: (nodes, edges) where nodes are (id, x, y) tuples and edges
+                are (id, from_node, to_node, lanes, speed) tuples
         """
-        # This is a simplified version that would need to be expanded for a real application
-        # SUMO network files are complex XML, so we'd need more sophisticated parsing
-        
         try:
-            tree = ET.parse(network_file)
-            root = tree.getroot()
+            if cache:
+                junctions, edge_records = cache.load(network_file)
+                records = junctions + edge_records
+            else:
+                records = iter_network(network_file)
             
             nodes = []
-            for junction in root.findall(".//junction"):
-                node_id = junction.get("id")
-                x = float(junction.get("x"))
-                y = float(junction.get("y"))
-                nodes.append((node_id, x, y))
-            
             edges = []
-            for edge in root.findall(".//edge"):
-                edge_id = edge.get("id")
-                from_node = edge.get("from")
-                to_node = edge.get("to")
-                
-                # Get lane information
-                lanes = len(edge.findall("lane"))
-                
-                # Get speed (from the first lane)
-                first_lane = edge.find("lane")
-                speed = 13.89  # Default 50 km/h
-                if first_lane is not None:
-                    speed = float(first_lane.get("speed", speed))
-                
-                edges.append((edge_id, from_node, to_node, lanes, speed))
+            for record in records:
+                if isinstance(record, JunctionRecord):
+                    nodes.append((record.id, record.x, record.y))
+                elif isinstance(record, EdgeRecord):
+                    edges.append((record.id, record.from_node, record.to_node,
+                                  record.lanes, record.speed))
             
             return nodes, edges
         except Exception as e:
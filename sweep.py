@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+SUMO Sci-Fi Dashboard - Parameter Sweeps
+----------------------------------------
+Expands a parameter grid or random search into scenarios and runs them
+headless on a pool of worker processes, each driving its own SUMO
+instance on its own TraCI port.
+
+    python sweep.py sweep.json --workers 4 --output-dir sweeps/peak
+
+The sweep spec is a JSON object:
+
+    {
+        "base": {"network_file": "city.net.xml", "duration": 3600},
+        "grid": {"vehicle_count": [500, 1000, 2000], "distribution": ["uniform", "rush_hour"]},
+        "seeds": [1, 2, 3]
+    }
+
+or, instead of "grid", a random search:
+
+    "random": {"samples": 50, "seed": 0, "parameters": {
+        "vehicle_count": {"low": 100, "high": 5000, "integer": true},
+        "step_length": {"low": 0.05, "high": 1.0, "log": true},
+        "distribution": ["uniform", "poisson", "normal", "rush_hour"]}}
+
+Every finished run is appended to a journal in the output directory, so
+an interrupted sweep picks up where it stopped when started again, and
+all runs are collected in one results.csv table.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from batch_runner import EXIT_BAD_SPEC, EXIT_FAILED, EXIT_OK, run_scenario, scenario_from_dict
+from network_cache import NetworkCache
+from scenario import ScenarioCache, scenario_fingerprint
+from traci_controller import TRACI_AVAILABLE
+
+# Files written to the sweep's output directory
+JOURNAL_FILE = "journal.jsonl"
+RESULTS_FILE = "results.csv"
+
+# Metrics of a run copied into the results table
+RESULT_COLUMNS = (
+    "steps", "simulated_time", "wall_time", "peak_vehicles", "mean_vehicles",
+    "trips_finished", "mean_travel_time", "mean_waiting_time", "mean_time_loss",
+    "mean_route_length", "p90_travel_time", "p90_time_loss", "throughput",
+)
+
+# State of a worker process, set up once by _init_worker
+_worker_port = None
+_worker_network_cache = None
+_worker_scenario_cache = None
+
+
+def expand_grid(grid):
+    """
+    Expand a parameter grid into all combinations
+
+    Args:
+        grid (dict): Parameter names mapped to lists of values (single
+            values are used as is)
+
+    Returns:
+        list: One dict of parameter values per combination
+    """
+    names = list(grid)
+    values = [value if isinstance(value, list) else [value] for value in grid.values()]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def sample_parameters(parameters, samples, rng):
+    """
+    Draw random parameter combinations
+
+    Args:
+        parameters (dict): Parameter names mapped to a list of choices, or
+            to {"low", "high"} bounds with optional "integer" and "log" flags
+        samples (int): Number of combinations
+        rng (numpy.random.Generator): Random generator
+
+    Returns:
+        list: One dict of parameter values per combination
+    """
+    columns = {}
+    for name, spec in parameters.items():
+        if isinstance(spec, list):
+            columns[name] = [spec[i] for i in rng.integers(len(spec), size=samples).tolist()]
+        elif isinstance(spec, dict):
+            low, high = float(spec["low"]), float(spec["high"])
+            if spec.get("log"):
+                values = np.exp(rng.uniform(math.log(low), math.log(high), samples))
+            else:
+                values = rng.uniform(low, high, samples)
+            if spec.get("integer"):
+                values = np.round(values).astype(np.int64)
+            columns[name] = values.tolist()
+        else:
+            columns[name] = [spec] * samples
+
+    return [{name: column[i] for name, column in columns.items()} for i in range(samples)]
+
+
+def sweep_points(spec):
+    """
+    Get the parameter combinations of a sweep spec
+
+    Random searches are drawn from the spec's seed (0 if omitted), so a
+    resumed sweep draws the same combinations again.
+
+    Returns:
+        list: One dict of parameter values per run
+    """
+    if "grid" in spec:
+        points = expand_grid(spec["grid"])
+    elif "random" in spec:
+        search = spec["random"]
+        rng = np.random.default_rng(search.get("seed", 0))
+        points = sample_parameters(search["parameters"], int(search["samples"]), rng)
+    else:
+        points = [{}]
+
+    # Replicate every combination once per seed
+    seeds = spec.get("seeds")
+    if seeds:
+        points = [dict(point, seed=seed) for point in points for seed in seeds]
+    return points
+
+
+def load_sweep(spec_file):
+    """
+    Read a sweep spec
+
+    Returns:
+        list: (parameters, Scenario) pairs, one per run
+    """
+    with open(spec_file, 'r') as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError("The sweep spec must be a JSON object")
+
+    base_dir = os.path.dirname(os.path.abspath(spec_file))
+    base = spec.get("base", {})
+    return [
+        (point, scenario_from_dict(dict(base, **point), base_dir))
+        for point in sweep_points(spec)
+    ]
+
+
+def read_journal(journal_file):
+    """
+    Read the outcomes recorded in a sweep journal
+
+    Returns:
+        dict: Run IDs mapped to their latest journal entry
+    """
+    entries = {}
+    if not os.path.exists(journal_file):
+        return entries
+
+    with open(journal_file, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Line cut short by an interrupted write
+                continue
+            entries[entry["run_id"]] = entry
+    return entries
+
+
+def append_journal(journal_file, entry):
+    """Record the outcome of a run, flushed to disk so it survives an interruption"""
+    with open(journal_file, 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_results(results_file, runs, entries):
+    """
+    Write one table row per run
+
+    Args:
+        results_file (str): CSV file to write
+        runs (list): (run_id, parameters) pairs in sweep order
+        entries (dict): Journal entries by run ID
+    """
+    parameter_names = []
+    for _, parameters in runs:
+        parameter_names.extend(name for name in parameters if name not in parameter_names)
+
+    with open(results_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["run_id", "status", "attempts", "cached"] + parameter_names
+                        + list(RESULT_COLUMNS) + ["error"])
+        for run_id, parameters in runs:
+            entry = entries.get(run_id, {"status": "pending"})
+            metrics = entry.get("metrics") or {}
+            writer.writerow(
+                [run_id, entry["status"], entry.get("attempts", 0), entry.get("cached", "")]
+                + [parameters.get(name, "") for name in parameter_names]
+                + [_cell(metrics.get(name)) for name in RESULT_COLUMNS]
+                + [entry.get("error", "")]
+            )
+
+
+def run_sweep(runs, output_dir, workers=None, retries=1, base_port=8813, use_cache=True):
+    """
+    Run the scenarios of a sweep concurrently
+
+    Worker i drives SUMO on TraCI port base_port + i. Failed runs are
+    submitted again up to retries times. Runs already completed in the
+    output directory's journal are skipped, identical scenarios run once,
+    and results stored in the scenario cache are reused unless use_cache
+    is False.
+
+    Args:
+        runs (list): (parameters, Scenario) pairs from load_sweep
+        output_dir (str): Directory for the journal, results and run files
+        workers (int): Number of worker processes (defaults to the CPU count)
+        retries (int): Extra attempts for a failed run
+        base_port (int): TraCI port of the first worker
+        use_cache (bool): Reuse results of identical scenarios run before
+
+    Returns:
+        dict: Number of runs per status
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    journal_file = os.path.join(output_dir, JOURNAL_FILE)
+    entries = read_journal(journal_file)
+
+    network_cache = NetworkCache()
+    run_ids = []
+    pending = {}
+    for parameters, scenario in runs:
+        run_id = scenario_fingerprint(scenario, network_cache)
+        run_ids.append((run_id, parameters))
+        if entries.get(run_id, {}).get("status") != "completed":
+            pending[run_id] = (parameters, scenario)
+
+    skipped = len(set(run_id for run_id, _ in run_ids)) - len(pending)
+    if skipped:
+        print(f"Resuming sweep: {skipped} runs already completed")
+
+    if pending:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        ports = multiprocessing.Queue()
+        for i in range(workers):
+            ports.put(base_port + i)
+
+        attempts = dict.fromkeys(pending, 0)
+        finished = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(ports,)) as pool:
+            futures = {}
+
+            def submit(run_id):
+                attempts[run_id] += 1
+                run_dir = os.path.join(output_dir, "runs", run_id[:16])
+                future = pool.submit(_run_task, run_id, pending[run_id][1], run_dir, use_cache)
+                futures[future] = run_id
+
+            for run_id in pending:
+                submit(run_id)
+
+            try:
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        run_id = futures.pop(future)
+                        try:
+                            outcome = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            outcome = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+                        if outcome["status"] == "failed" and attempts[run_id] <= retries:
+                            print(f"Run {run_id[:16]} failed ({outcome['error']}), retrying")
+                            submit(run_id)
+                            continue
+
+                        entry = dict(outcome, run_id=run_id, attempts=attempts[run_id],
+                                     parameters=pending[run_id][0])
+                        append_journal(journal_file, entry)
+                        entries[run_id] = entry
+                        finished += 1
+                        print(f"Run {run_id[:16]} {entry['status']} ({finished}/{len(pending)})")
+            except BrokenProcessPool:
+                # Runs still in flight stay out of the journal and are redone on resume
+                print("A worker process died; run the sweep again to resume it")
+
+    write_results(os.path.join(output_dir, RESULTS_FILE), run_ids, entries)
+
+    counts = {}
+    for run_id in dict(run_ids):
+        status = entries.get(run_id, {}).get("status", "pending")
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def _init_worker(ports):
+    """Claim a TraCI port and open the caches once per worker process"""
+    global _worker_port, _worker_network_cache, _worker_scenario_cache
+    _worker_port = ports.get()
+    _worker_network_cache = NetworkCache()
+    _worker_scenario_cache = ScenarioCache()
+
+
+def _run_task(run_id, scenario, run_dir, use_cache):
+    """Run one scenario in a worker; failures are returned rather than raised"""
+    try:
+        metrics = _worker_scenario_cache.lookupResult(run_id) if use_cache else None
+        cached = metrics is not None
+        if not cached:
+            metrics = run_scenario(scenario, run_dir, _worker_network_cache,
+                                   _worker_scenario_cache, _worker_port)
+            _worker_scenario_cache.storeResult(run_id, metrics)
+        return {"status": "completed", "cached": cached, "metrics": metrics}
+    except Exception as e:
+        return {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+
+def _cell(value):
+    return "" if value is None else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sumo-dashboard-sweep",
+        description="Run a parameter sweep of SUMO dashboard scenarios headless."
+    )
+    parser.add_argument("spec", help="sweep spec (JSON with base, grid or random, and seeds)")
+    parser.add_argument("-o", "--output-dir", default="sweep",
+                        help="directory for the journal, results table and runs (default: sweep)")
+    parser.add_argument("-w", "--workers", type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--retries", type=int, default=1, help="extra attempts for failed runs (default: 1)")
+    parser.add_argument("--base-port", type=int, default=8813,
+                        help="TraCI port of the first worker; worker i uses base-port + i (default: 8813)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="simulate even if results for a scenario are cached")
+    args = parser.parse_args(argv)
+
+    try:
+        runs = load_sweep(args.spec)
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        print(f"Invalid sweep spec {args.spec}: {e}", file=sys.stderr)
+        return EXIT_BAD_SPEC
+
+    if not TRACI_AVAILABLE and args.no_cache:
+        print("TraCI is not available; set SUMO_HOME to your SUMO installation", file=sys.stderr)
+        return EXIT_FAILED
+
+    counts = run_sweep(runs, args.output_dir, args.workers, args.retries, args.base_port,
+                       not args.no_cache)
+    print(", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    print(f"Results: {os.path.join(args.output_dir, RESULTS_FILE)}")
+
+    return EXIT_OK if set(counts) == {"completed"} else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+import os
+import socket
+import sys
+import subprocess
+import time
+
+# Try to import TraCI (Traffic Control Interface) for SUMO
+try:
+    # Add SUMO_HOME/tools to the Python path
+    if 'SUMO_HOME' in os.environ:
+        tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+        sys.path.append(tools)
+    else:
+        raise EnvironmentError("Please declare environment variable 'SUMO_HOME'")
+    
+    import traci
+    TRACI_AVAILABLE = True
+except (ImportError, EnvironmentError):
+    TRACI_AVAILABLE = False
+    print("TraCI not available. Limited simulation functionality.")
+
+# Seconds SUMO gets to write its outputs and exit after the TraCI connection is closed
+SHUTDOWN_TIMEOUT = 10
+
+
+def free_port():
+    """Get a TCP port no other process is listening on, for an additional SUMO instance"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+class TraciSimulationController:
+    """
+    Controller class for interacting with SUMO via TraCI
+    """
+    def __init__(self):
+        self.connected = False
+        self.simulation_running = False
+        self.sumo_process = None
+        self.port = 8813
+        self.config_file = None
+        self.options = None
+        self.connection = None  # Own TraCI connection, so several controllers can run at once
+        self.arrived = 0  # Vehicles that reached their destination so far
+        self.error = None  # Exception that stopped the last simulation, if any
+        self.checkpoint_times = []  # Pending checkpoint times, ascending
+        self.checkpoint_dir = None
+        self.checkpoints = []  # (time, state file) of the checkpoints saved in this run
+    
+    def connect(self, config_file=None, port=8813, options=None):
+        """
+        Connect to SUMO via TraCI
+        
+        Args:
+            config_file (str): Configuration to start SUMO with; connects to a
+                running SUMO instance if not given
+            port (int): TraCI port
+            options (list): Additional SUMO command line options
+        """
+        if not TRACI_AVAILABLE:
+            print("TraCI is not available")
+            return False
+        
+        try:
+            # Get SUMO_HOME
+            if 'SUMO_HOME' not in os.environ:
+                raise EnvironmentError("Please declare environment variable 'SUMO_HOME'")
+            
+            sumo_home = os.environ['SUMO_HOME']
+            sumo_binary = os.path.join(sumo_home, 'bin', 'sumo')
+            
+            if not os.path.exists(sumo_binary) and not os.path.exists(sumo_binary + '.exe'):
+                # Try with default path
+                sumo_binary = 'sumo'
+            
+            self.port = port
+            self.config_file = config_file
+            self.options = options
+            self.arrived = 0
+            self.error = None
+            self.checkpoints = []
+            
+            if config_file:
+                # Start SUMO as a subprocess
+                cmd = [
+                    sumo_binary,
+                    '-c', config_file,
+                    '--remote-port', str(port),
+                    '--start',  # Start immediately
+                    '--no-warnings',  # Don't show warnings in console
+                    '--no-step-log',  # Don't show step info in console
+                ]
+                cmd.extend(options or [])
+                
+                # Start SUMO process
+                self.sumo_process = subprocess.Popen(cmd, 
+                                                    stdout=subprocess.PIPE, 
+                                                    stderr=subprocess.PIPE)
+                
+                # Give it a moment to start
+                time.sleep(1.0)
+                
+                # Connect to the running SUMO instance
+                self.connection = traci.connect(port=port)
+            else:
+                # Connect to an already running SUMO instance
+                self.connection = traci.connect(port=port)
+            
+            self.connected = True
+            self.simulation_running = True
+            return True
+        
+        except Exception as e:
+            print(f"Error connecting to SUMO: {e}")
+            self.connected = False
+            
+            # Don't leave SUMO holding the port
+            if self.sumo_process:
+                self.sumo_process.terminate()
+                self.sumo_process = None
+            return False
+    
+    def disconnect(self):
+        """Disconnect from SUMO"""
+        if self.connected:
+            try:
+                self.connection.close()
+                self.connection = None
+                
+                # Let SUMO finish writing its outputs, then terminate it if it's still running
+                if self.sumo_process:
+                    try:
+                        self.sumo_process.wait(timeout=SHUTDOWN_TIMEOUT)
+                    except subprocess.TimeoutExpired:
+                        self.sumo_process.terminate()
+                    self.sumo_process = None
+                
+                self.connected = False
+                self.simulation_running = False
+            except Exception as e:
+                print(f"Error disconnecting from SUMO: {e}")
+    
+    def step(self):
+        """Perform one simulation step"""
+        if self.connected and self.simulation_running:
+            try:
+                self.connection.simulationStep()
+                self.arrived += self.connection.simulation.getArrivedNumber()
+                
+                if self.checkpoint_times:
+                    self._saveDueCheckpoints()
+                
+                # Check if simulation has ended
+                if self.connection.simulation.getMinExpectedNumber() <= 0:
+                    # No more vehicles expected, we can end the simulation
+                    self.simulation_running = False
+                    return False
+                
+                return True
+            except Exception as e:
+                print(f"Error in simulation step: {e}")
+                self.error = e
+                self.simulation_running = False
+                return False
+        return False
+    
+    def saveState(self, state_file):
+        """
+        Save the simulation state (time, vehicles, signals) to a file
+        
+        Returns:
+            bool: True if the state was written
+        """
+        if self.connected:
+            try:
+                self.connection.simulation.saveState(state_file)
+                return True
+            except Exception as e:
+                print(f"Error saving simulation state: {e}")
+        return False
+    
+    def loadState(self, state_file):
+        """
+        Restore a state written by saveState
+        
+        The simulation continues from the time of the state. SUMO must run
+        the same network and route files the state was saved with.
+        
+        Returns:
+            bool: True if the state was loaded
+        """
+        if self.connected:
+            try:
+                self.connection.simulation.loadState(state_file)
+                self.simulation_running = True
+                return True
+            except Exception as e:
+                print(f"Error loading simulation state: {e}")
+        return False
+    
+    def fork(self, state_file, config_file=None, port=None):
+        """
+        Start a second SUMO instance that continues from the current state
+        
+        The fork runs the same network and routes, and with the
+        --save-state.rng option (see connect) the same random numbers, so
+        it only differs from this simulation by what is changed in it
+        afterwards. Both can then be stepped side by side.
+        
+        Args:
+            state_file (str): Where to save the current state
+            config_file (str): Configuration for the fork, e.g. one writing its
+                outputs to another directory (defaults to this simulation's)
+            port (int): TraCI port for the fork (defaults to a free port)
+        
+        Returns:
+            TraciSimulationController: Controller of the fork, or None if it could not be started
+        """
+        if not self.saveState(state_file):
+            return None
+        
+        branch = TraciSimulationController()
+        if not branch.connect(config_file or self.config_file, port or free_port(), self.options):
+            return None
+        if not branch.loadState(state_file):
+            branch.disconnect()
+            return None
+        branch.arrived = self.arrived
+        return branch
+    
+    def getSummary(self):
+        """
+        Get key figures of the current simulation step
+        
+        Returns:
+            dict: Simulation time, running and halting (below 0.1 m/s) vehicles,
+                their mean speed and the number of arrived vehicles
+        """
+        summary = {'time': 0, 'vehicles': 0, 'halting': 0, 'mean_speed': 0.0, 'arrived': self.arrived}
+        if self.connected:
+            try:
+                vehicle = self.connection.vehicle
+                speeds = [vehicle.getSpeed(vehicle_id) for vehicle_id in vehicle.getIDList()]
+                summary['time'] = self.connection.simulation.getTime()
+                summary['vehicles'] = len(speeds)
+                summary['halting'] = sum(1 for speed in speeds if speed < 0.1)
+                summary['mean_speed'] = sum(speeds) / len(speeds) if speeds else 0.0
+            except Exception as e:
+                print(f"Error getting simulation summary: {e}")
+        return summary
+    
+    def setCheckpoints(self, times, directory):
+        """
+        Save the simulation state when it reaches each of the given times
+        
+        Saved checkpoints are listed in self.checkpoints as (time, state file).
+        
+        Args:
+            times (list): Simulation times in seconds
+            directory (str): Directory for the state files
+        """
+        self.checkpoint_times = sorted(set(times))
+        self.checkpoint_dir = directory
+        if self.checkpoint_times:
+            os.makedirs(directory, exist_ok=True)
+    
+    def _saveDueCheckpoints(self):
+        now = self.connection.simulation.getTime()
+        while self.checkpoint_times and now >= self.checkpoint_times[0]:
+            due = self.checkpoint_times.pop(0)
+            state_file = os.path.join(self.checkpoint_dir, f"state-{due:g}.xml.gz")
+            if self.saveState(state_file):
+                self.checkpoints.append((due, state_file))
+    
+    def getVehicles(self):
+        """Get all vehicles in the simulation"""
+        if self.connected:
+            try:
+                return self.connection.vehicle.getIDList()
+            except Exception as e:
+                print(f"Error getting vehicles: {e}")
+        return []
+    
+    def getVehicleData(self, vehicle_id):
+        """Get data for a specific vehicle"""
+        if self.connected:
+            try:
+                # Convert SUMO coordinates to scene coordinates
+                # Note: This is a simplified conversion - you may need to adjust based on your network
+                vehicle = self.connection.vehicle
+                x, y = vehicle.getPosition(vehicle_id)
+                
+                return {
+                    'position': (x, y),  # Adjusted coordinates
+                    'speed': vehicle.getSpeed(vehicle_id),
+                    'route': vehicle.getRoute(vehicle_id),
+                    'edge': vehicle.getRoadID(vehicle_id),
+                    'lane': vehicle.getLaneID(vehicle_id),
+                    'type': vehicle.getTypeID(vehicle_id),
+                    'angle': vehicle.getAngle(vehicle_id)  # Useful for rotation
+                }
+            except Exception as e:
+                print(f"Error getting vehicle data: {e}")
+        return None
+    
+    def getSimulationTime(self):
+        """Get current simulation time"""
+        if self.connected:
+            try:
+                return self.connection.simulation.getTime()
+            except Exception as e:
+                print(f"Error getting simulation time: {e}")
+        return 0
+    
+    def getTrafficLights(self):
+        """Get all traffic lights in the simulation"""
+        if self.connected:
+            try:
+                return self.connection.trafficlight.getIDList()
+            except Exception as e:
+                print(f"Error getting traffic lights: {e}")
+        return []
+    
+    def getTrafficLightState(self, tl_id):
+        """Get state of a specific traffic light"""
+        if self.connected:
+            try:
+                return self.connection.trafficlight.getRedYellowGreenState(tl_id)
+            except Exception as e:
+                print(f"Error getting traffic light state: {e}")
+        return None
+    
+    def setTrafficLightState(self, tl_id, state):
+        """Set state of a specific traffic light"""
+        if self.connected:
+            try:
+                self.connection.trafficlight.setRedYellowGreenState(tl_id, state)
+                return True
+            except Exception as e:
+                print(f"Error setting traffic light state: {e}")
+        return False
+    
+    def getNetworkBounds(self):
+        """Get the boundaries of the network"""
+        if self.connected:
+            try:
+                return self.connection.simulation.getNetBoundary()
+            except Exception as e:
+                print(f"Error getting network bounds: {e}")
+        return [0, 0, 100, 100]  # Default bounds if not connected
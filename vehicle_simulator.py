@@ -18,29 +18,27 @@ import sys
 import subprocess
 import tempfile
 import time
+import shutil
 import threading
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                             QLabel, QSlider, QComboBox, QSpinBox, QDoubleSpinBox, QCheckBox,
                             QGroupBox, QFormLayout, QFileDialog, QMessageBox,
                             QProgressBar, QTabWidget, QGraphicsView, QGraphicsScene,
-                            QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsRectItem)
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal, pyqtSlot, QProcess, QPointF, QLineF
-from PyQt6.QtGui import QFont, QColor, QPen, QBrush, QPainter, QTransform
+                            QGridLayout, QInputDialog, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsRectItem,
+                            QGraphicsPathItem)
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal, pyqtSlot, QProcess, QPointF, QLineF, QRectF
+from PyQt6.QtGui import QFont, QColor, QPen, QBrush, QPainter, QPainterPath, QTransform
 
-# Try to import TraCI (Traffic Control Interface) for SUMO
-try:
-    # Add SUMO_HOME/tools to the Python path
-    if 'SUMO_HOME' in os.environ:
-        tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
-        sys.path.append(tools)
-    else:
-        raise EnvironmentError("Please declare environment variable 'SUMO_HOME'")
-    
-    import traci
-    TRACI_AVAILABLE = True
-except ImportError:
-    TRACI_AVAILABLE = False
-    print("TraCI not available. Limited simulation functionality.")
+import numpy as np
+
+from network_cache import NetworkCache
+from network_model import NetworkModel
+from demand import generate_route_file
+from od_demand import load_demand, read_taz
+from output_stats import OutputMonitor
+from scenario import (Scenario, ScenarioCache, DEFAULT_SEED, scenario_fingerprint,
+                      scenario_router, write_scenario_config, write_scenario_routes)
+from traci_controller import TraciSimulationController, TRACI_AVAILABLE
 
 
 class SimulationControlPanel(QWidget):
@@ -51,10 +49,44 @@ class SimulationControlPanel(QWidget):
     simulation_stopped = pyqtSignal()
     simulation_data_updated = pyqtSignal(dict)  # Emits vehicle data for visualization
     
+    # Figures compared between the baseline and a fork: (summary key, label)
+    COMPARISON_ROWS = [
+        ('time', "Time (s):"),
+        ('vehicles', "Vehicles:"),
+        ('halting', "Halting:"),
+        ('mean_speed', "Mean Speed (m/s):"),
+        ('arrived', "Arrived:"),
+    ]
+    
+    # Live KPIs from the simulation outputs: (OutputMonitor key, label)
+    KPI_ROWS = [
+        ('running', "Running:"),
+        ('halting', "Halting:"),
+        ('mean_speed', "Mean Speed (m/s):"),
+        ('trips_finished', "Trips Finished:"),
+        ('throughput', "Throughput (veh/h):"),
+        ('mean_travel_time', "Mean Travel Time (s):"),
+        ('p90_travel_time', "P90 Travel Time (s):"),
+        ('mean_time_loss', "Mean Delay (s):"),
+        ('p90_time_loss', "P90 Delay (s):"),
+    ]
+    
     def __init__(self, parent=None):
         super().__init__(parent)
         self.sumo_process = None
         self.traci_controller = None
+        self.branch_controller = None  # Fork of the running simulation, stepped alongside it
+        self.branch_summary = None  # Last figures of a fork that has ended
+        self.running_scenario = None
+        self.output_monitor = None  # Follows the summary and tripinfo outputs of a run
+        self.network_cache = NetworkCache()
+        self.network_model = None  # Parsed network shared with the visualization
+        self.router = None  # Router over network_model, reused between runs
+        self.scenario_cache = ScenarioCache()
+        self.demand_file = None
+        self.demand_matrix = None  # Imported OD matrix or turn counts (replaces random trips)
+        self.taz_file = None
+        self.taz = None  # Zone IDs mapped to edge IDs for the imported matrix
         self.setupUI()
     
     def setupUI(self):
@@ -101,7 +133,7 @@ class SimulationControlPanel(QWidget):
         
         # Vehicle count
         self.vehicle_count = QSpinBox()
-        self.vehicle_count.setRange(1, 1000)
+        self.vehicle_count.setRange(1, 1000000)
         self.vehicle_count.setValue(100)
         self.vehicle_count.setStyleSheet("color: #e6e6ff; background-color: #2a2a4a; border: 1px solid #4040bf;")
         param_layout.addRow("Vehicles:", self.vehicle_count)
@@ -143,6 +175,32 @@ class SimulationControlPanel(QWidget):
         self.distribution.setStyleSheet("color: #e6e6ff; background-color: #2a2a4a; border: 1px solid #4040bf;")
         route_layout.addRow("Distribution:", self.distribution)
         
+        # Demand mode (flows keep route files small for large vehicle counts)
+        self.demand_mode = QComboBox()
+        self.demand_mode.addItems(["Vehicles", "Flows"])
+        self.demand_mode.setStyleSheet("color: #e6e6ff; background-color: #2a2a4a; border: 1px solid #4040bf;")
+        route_layout.addRow("Demand Mode:", self.demand_mode)
+        
+        # Imported demand (OD matrix or turn counts) instead of random trips
+        demand_file_layout = QHBoxLayout()
+        self.demand_label = QLabel("Random trips")
+        self.demand_label.setStyleSheet("color: #e6e6ff;")
+        import_demand_btn = QPushButton("Import...")
+        import_demand_btn.setToolTip("Load an OD matrix (CSV or O-format) or turn counts (edgeRelation XML or CSV)")
+        import_demand_btn.clicked.connect(self.importDemand)
+        import_taz_btn = QPushButton("Zones...")
+        import_taz_btn.setToolTip("Load the traffic assignment zones (TAZ) the OD matrix refers to")
+        import_taz_btn.clicked.connect(self.importZones)
+        clear_demand_btn = QPushButton("Clear")
+        clear_demand_btn.clicked.connect(self.clearDemand)
+        for btn in (import_demand_btn, import_taz_btn, clear_demand_btn):
+            btn.setStyleSheet("color: #e6e6ff; background-color: #2a2a4a; border: 1px solid #4040bf; padding: 2px 6px;")
+        demand_file_layout.addWidget(self.demand_label)
+        demand_file_layout.addWidget(import_demand_btn)
+        demand_file_layout.addWidget(import_taz_btn)
+        demand_file_layout.addWidget(clear_demand_btn)
+        route_layout.addRow("Demand:", demand_file_layout)
+        
         # Simulation duration
         self.duration = QSpinBox()
         self.duration.setRange(10, 3600)  # 10s to 1h
@@ -171,6 +229,27 @@ class SimulationControlPanel(QWidget):
         self.collect_data.setStyleSheet("color: #e6e6ff;")
         advanced_layout.addRow("", self.collect_data)
         
+        # Routing index for large demands (built once per network and cached)
+        self.use_routing_index = QCheckBox("Precompute Routing Index")
+        self.use_routing_index.setToolTip("Build a contraction hierarchy of the network to speed up routing large demands")
+        self.use_routing_index.setStyleSheet("color: #e6e6ff;")
+        advanced_layout.addRow("", self.use_routing_index)
+        
+        # Processes routing the demand (the demand itself does not depend on it)
+        self.routing_workers = QSpinBox()
+        self.routing_workers.setRange(1, os.cpu_count() or 1)
+        self.routing_workers.setValue(1)
+        self.routing_workers.setToolTip("Route the demand in several processes on large networks")
+        self.routing_workers.setStyleSheet("color: #e6e6ff; background-color: #2a2a4a; border: 1px solid #4040bf;")
+        advanced_layout.addRow("Routing Workers:", self.routing_workers)
+        
+        # Random seed for demand and SUMO, so runs can be repeated and compared
+        self.seed = QSpinBox()
+        self.seed.setRange(0, 2147483647)
+        self.seed.setValue(DEFAULT_SEED)
+        self.seed.setStyleSheet("color: #e6e6ff; background-color: #2a2a4a; border: 1px solid #4040bf;")
+        advanced_layout.addRow("Random Seed:", self.seed)
+        
         # GUI option
         self.use_gui = QCheckBox("Show SUMO GUI")
         self.use_gui.setChecked(True)
@@ -215,8 +294,15 @@ class SimulationControlPanel(QWidget):
         self.reset_btn.setStyleSheet(btn_style)
         self.reset_btn.clicked.connect(self.resetSimulation)
         
+        self.fork_btn = QPushButton("🔀 Fork")
+        self.fork_btn.setStyleSheet(btn_style)
+        self.fork_btn.setEnabled(False)
+        self.fork_btn.setToolTip("Branch the running simulation to try a traffic light change next to it")
+        self.fork_btn.clicked.connect(self.forkSimulation)
+        
         button_layout.addWidget(self.start_btn)
         button_layout.addWidget(self.stop_btn)
+        button_layout.addWidget(self.fork_btn)
         button_layout.addWidget(self.reset_btn)
         
         # Status indicator
@@ -246,6 +332,42 @@ class SimulationControlPanel(QWidget):
             }
         """)
         
+        # Baseline and fork side by side, with their difference
+        self.comparison_group = QGroupBox("Fork Comparison")
+        self.comparison_group.setStyleSheet(group_style)
+        comparison_layout = QGridLayout(self.comparison_group)
+        for column, title in enumerate(["Baseline", "Fork", "Δ"], 1):
+            header = QLabel(title)
+            header.setStyleSheet("color: #00FFFF; font-weight: bold;")
+            comparison_layout.addWidget(header, 0, column)
+        self.comparison_labels = {}
+        for row, (key, title) in enumerate(self.COMPARISON_ROWS, 1):
+            comparison_layout.addWidget(QLabel(title), row, 0)
+            labels = []
+            for column in range(1, 4):
+                label = QLabel("-")
+                label.setStyleSheet("color: #e6e6ff;")
+                comparison_layout.addWidget(label, row, column)
+                labels.append(label)
+            self.comparison_labels[key] = labels
+        self.comparison_group.hide()
+        
+        # KPIs read from the summary and tripinfo outputs while SUMO writes them
+        self.kpi_group = QGroupBox("Live KPIs")
+        self.kpi_group.setStyleSheet(group_style)
+        kpi_layout = QFormLayout(self.kpi_group)
+        self.kpi_labels = {}
+        for key, title in self.KPI_ROWS:
+            label = QLabel("-")
+            label.setStyleSheet("color: #e6e6ff;")
+            kpi_layout.addRow(title, label)
+            self.kpi_labels[key] = label
+        self.output_label = QLabel("")
+        self.output_label.setStyleSheet("color: #e6e6ff;")
+        self.output_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        kpi_layout.addRow("Outputs:", self.output_label)
+        self.kpi_group.hide()
+        
         # Add everything to main layout
         main_layout.addWidget(param_group)
         main_layout.addWidget(route_group)
@@ -253,11 +375,17 @@ class SimulationControlPanel(QWidget):
         main_layout.addLayout(button_layout)
         main_layout.addLayout(status_layout)
         main_layout.addWidget(self.progress_bar)
+        main_layout.addWidget(self.comparison_group)
+        main_layout.addWidget(self.kpi_group)
         
         # Create a timer for updating the simulation
         self.update_timer = QTimer(self)
         self.update_timer.timeout.connect(self.updateSimulation)
         
+        # Timer for reading the simulation outputs
+        self.kpi_timer = QTimer(self)
+        self.kpi_timer.timeout.connect(self.updateKpis)
+        
         # Set up the simulation process handler
         self.simulation_process = QProcess(self)
         self.simulation_process.finished.connect(self.processFinished)
@@ -289,6 +417,9 @@ class SimulationControlPanel(QWidget):
         
         # Create a temporary directory for simulation files
         self.temp_dir = tempfile.mkdtemp()
+        self.running_scenario = self.currentScenario()
+        self.branch_summary = None
+        self.comparison_group.hide()
         
         try:
             # Create route file
@@ -312,8 +443,9 @@ class SimulationControlPanel(QWidget):
             if not hasattr(self, 'traci_controller') or not self.traci_controller:
                 self.traci_controller = TraciSimulationController()
             
-            # Start simulation with TraCI instead of launching external GUI
-            success = self.traci_controller.connect(config_file)
+            # Start simulation with TraCI instead of launching external GUI.
+            # Saving the random number state lets forks continue exactly like it.
+            success = self.traci_controller.connect(config_file, options=["--save-state.rng"])
             
             if not success:
                 raise Exception("Failed to connect to SUMO via TraCI")
@@ -327,6 +459,20 @@ class SimulationControlPanel(QWidget):
             interval = max(10, int(100 / (self.speed_factor.value() / 100.0)))
             self.simulation_timer.start(interval)
             
+            self.fork_btn.setEnabled(True)
+            
+            # Follow the outputs for live KPIs
+            if self.collect_data.isChecked():
+                self.output_monitor = OutputMonitor(self.temp_dir)
+                for label in self.kpi_labels.values():
+                    label.setText("-")
+                self.output_label.setText(self.temp_dir)
+                self.kpi_group.show()
+                self.kpi_timer.start(1000)
+            else:
+                self.output_monitor = None
+                self.kpi_group.hide()
+            
             # Emit signal that simulation started
             self.simulation_started.emit(config_file)
             
@@ -348,6 +494,10 @@ class SimulationControlPanel(QWidget):
                 self.stopSimulation()
                 return
             
+            # Advance a fork in lockstep with the baseline
+            if self.branch_controller or self.branch_summary:
+                self.stepFork()
+            
             # Update progress
             elapsed_time = time.time() - self.simulation_start_time
             total_time = self.duration.value()
@@ -365,130 +515,202 @@ class SimulationControlPanel(QWidget):
             print(f"Error in simulation step: {e}")
             self.stopSimulation()
     
+    def forkSimulation(self):
+        """Branch the running simulation to try an intervention next to it"""
+        if not self.traci_controller or not self.traci_controller.connected:
+            return
+        self.stopFork()
+        
+        # Keep both simulations at the same time while the fork starts
+        was_stepping = self.simulation_timer.isActive()
+        self.simulation_timer.stop()
+        
+        try:
+            # The fork writes its outputs to its own directory
+            fork_dir = os.path.join(self.temp_dir, "fork")
+            os.makedirs(fork_dir, exist_ok=True)
+            route_file = os.path.join(fork_dir, os.path.basename(self.route_file))
+            shutil.copyfile(self.route_file, route_file)
+            config_file = write_scenario_config(
+                self.running_scenario, fork_dir, route_file, self.collect_data.isChecked()
+            )
+            
+            fork_time = self.traci_controller.getSimulationTime()
+            state_file = os.path.join(fork_dir, f"state-{fork_time:g}.xml.gz")
+            self.branch_controller = self.traci_controller.fork(state_file, config_file)
+            if not self.branch_controller:
+                raise Exception("Failed to start the fork")
+            
+            self.applyIntervention(self.branch_controller)
+            self.comparison_group.setTitle(f"Fork Comparison (forked at {fork_time:g}s)")
+            self.comparison_group.show()
+            self.updateComparison()
+        except Exception as e:
+            QMessageBox.critical(self, "Fork Error", f"Error forking simulation: {str(e)}")
+            self.stopFork()
+        finally:
+            if was_stepping:
+                self.simulation_timer.start()
+    
+    def applyIntervention(self, controller):
+        """Ask for a traffic light state to set in a fork"""
+        tl_ids = list(controller.getTrafficLights())
+        if not tl_ids:
+            return
+        
+        tl_id, ok = QInputDialog.getItem(
+            self, "Fork Intervention", "Traffic light to change:", tl_ids, 0, False
+        )
+        if not ok:
+            return
+        
+        current_state = controller.getTrafficLightState(tl_id) or ""
+        state, ok = QInputDialog.getText(
+            self, "Fork Intervention",
+            f"Signal state of {tl_id} (one of r, y, g, G per link):", text=current_state
+        )
+        state = state.strip()
+        if ok and state and state != current_state:
+            controller.setTrafficLightState(tl_id, state)
+    
+    def stepFork(self):
+        """Step the fork once, keeping its last figures when it ends"""
+        if self.branch_controller:
+            if not self.branch_controller.step():
+                self.branch_summary = self.branch_controller.getSummary()
+                self.stopFork()
+        self.updateComparison()
+    
+    def stopFork(self):
+        """Close the fork's SUMO instance"""
+        if self.branch_controller:
+            self.branch_controller.disconnect()
+            self.branch_controller = None
+    
+    def updateComparison(self):
+        """Show the baseline and fork figures and their difference"""
+        baseline = self.traci_controller.getSummary()
+        fork = self.branch_controller.getSummary() if self.branch_controller else self.branch_summary
+        if not fork:
+            return
+        
+        for key, _ in self.COMPARISON_ROWS:
+            base_label, fork_label, diff_label = self.comparison_labels[key]
+            diff = fork[key] - baseline[key]
+            base_label.setText(f"{baseline[key]:.1f}" if key == 'mean_speed' else f"{baseline[key]:g}")
+            fork_label.setText(f"{fork[key]:.1f}" if key == 'mean_speed' else f"{fork[key]:g}")
+            diff_label.setText(f"{diff:+.1f}" if key == 'mean_speed' else f"{diff:+g}")
+    
+    def updateKpis(self):
+        """Read new simulation output records and show the KPIs"""
+        if not self.output_monitor:
+            return
+        
+        kpis = self.output_monitor.poll()
+        for key, label in self.kpi_labels.items():
+            value = kpis.get(key)
+            if value is None:
+                label.setText("-")
+            elif isinstance(value, float):
+                label.setText(f"{value:.1f}")
+            else:
+                label.setText(str(value))
+    
     def createRouteFile(self):
             """Create a route file for the simulation"""
-            # This would normally use SUMO tools to generate routes
-            # For now, we'll create a route file using actual network edges
-            
             self.route_file = os.path.join(self.temp_dir, "routes.rou.xml")
             
-            # First, try to parse the network file to get actual edges
-            try:
-                import xml.etree.ElementTree as ET
-                
-                # Read the network file
-                network_file = self.network_file
-                tree = ET.parse(network_file)
-                root = tree.getroot()
-                
-                # Find all edge IDs
-                edge_ids = [edge.get('id') for edge in root.findall('.//edge')]
-                
-                # If no edges found, use a default route
-                if not edge_ids:
-                    edge_ids = ['edge0']
-            except Exception as e:
-                print(f"Error parsing network file: {e}")
-                edge_ids = ['edge0']
+            scenario = self.currentScenario()
+            fingerprint = scenario_fingerprint(scenario, self.network_cache)
             
-            # Validate edge_ids
-            if not edge_ids:
-                edge_ids = ['edge0']
+            # The same scenario always gets the same demand, so reuse it
+            cached_file = self.scenario_cache.lookupRoutes(fingerprint)
+            if cached_file:
+                shutil.copyfile(cached_file, self.route_file)
+                return self.route_file
             
-            # Create route file
-            with open(self.route_file, 'w') as f:
-                f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-                f.write('<routes>\n')
-                
-                # Define a vehicle type
-                f.write('    <vType id="car" accel="2.6" decel="4.5" sigma="0.5" length="5" maxSpeed="50"/>\n')
-                
-                # Define route using the first edge found
-                f.write(f'    <route id="route0" edges="{" ".join(edge_ids)}"/>\n')
-                
-                # Add vehicles
-                vehicle_count = self.vehicle_count.value()
-                for i in range(vehicle_count):
-                    # Calculate departure time and position based on distribution
-                    if self.distribution.currentText() == "Uniform":
-                        depart_time = i * (self.duration.value() / vehicle_count)
-                        depart_pos = "random"  # Random position along the first edge
-                    elif self.distribution.currentText() == "Poisson":
-                        import numpy as np
-                        # Poisson distribution for departure times
-                        depart_time = np.random.poisson(self.duration.value() / vehicle_count) * 1.0
-                        depart_pos = "random"
-                    elif self.distribution.currentText() == "Normal":
-                        import numpy as np
-                        # Normal distribution for departure times
-                        depart_time = max(0, np.random.normal(
-                            loc=self.duration.value() / 2, 
-                            scale=self.duration.value() / 6
-                        ))
-                        depart_pos = "random"
-                    else:  # Rush Hour simulation
-                        # Concentrate vehicles in the middle third of simulation time
-                        rush_start = self.duration.value() * 0.3
-                        rush_end = self.duration.value() * 0.7
-                        depart_time = rush_start + (i * (rush_end - rush_start) / vehicle_count)
-                        depart_pos = "random"
-                    
-                    # Ensure depart time is within simulation duration
-                    depart_time = min(max(0, depart_time), self.duration.value() - 1)
-                    
-                    f.write(
-                        f'    <vehicle id="veh{i}" type="car" route="route0" '
-                        f'depart="{depart_time:.2f}" departPos="{depart_pos}"/>\n'
-                    )
-                
-                f.write('</routes>\n')
+            # Use the model parsed when the network was set
+            try:
+                if self.network_model is None:
+                    self.network_model = NetworkModel.load(self.network_file, cache=self.network_cache)
+                self.router = scenario_router(scenario, self.network_model, self.network_cache, self.router)
+                write_scenario_routes(scenario, self.route_file, self.router, self.demand_matrix, self.taz,
+                                      workers=self.routing_workers.value())
+            except Exception as e:
+                print(f"Error routing demand: {e}")
+                edge_ids = self.network_model.edge_ids[:1] if self.network_model else []
+                generate_route_file(
+                    self.route_file, {"route0": edge_ids or ['edge0']}, scenario.vehicle_count, 0,
+                    scenario.duration, scenario.distribution, scenario.demand_mode,
+                    rng=np.random.default_rng(scenario.seed)
+                )
+                return self.route_file
             
+            self.scenario_cache.storeRoutes(fingerprint, self.route_file)
             return self.route_file
     
-    def createConfigFile(self):
-        """Create a SUMO configuration file"""
-        config_file = os.path.join(self.temp_dir, "sim.sumocfg")
+    def currentScenario(self):
+        """Get the scenario described by the current settings"""
+        return Scenario(
+            network_file=self.network_file,
+            vehicle_count=self.vehicle_count.value(),
+            duration=self.duration.value(),
+            distribution=self.distribution.currentText(),
+            demand_mode=self.demand_mode.currentText(),
+            route_type=self.route_type.currentText(),
+            routing_index=self.use_routing_index.isChecked(),
+            step_length=self.step_length.value(),
+            seed=self.seed.value(),
+            demand_file=self.demand_file,
+            taz_file=self.taz_file,
+        )
+    
+    def importDemand(self):
+        """Load an OD matrix or turn counts to generate the trips from"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Import Demand", "",
+            "Demand Files (*.csv *.txt *.od *.fma *.mtx *.xml);;All Files (*)"
+        )
+        if not file_path:
+            return
         
-        with open(config_file, 'w') as f:
-            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-            f.write('<configuration>\n')
-            
-            f.write('    <input>\n')
-            f.write(f'        <net-file value="{os.path.basename(self.network_file)}"/>\n')
-            f.write(f'        <route-files value="{os.path.basename(self.route_file)}"/>\n')
-            f.write('    </input>\n')
-            f.write('    <defaults>\n')
-            f.write('        <randomize>\n')
-            f.write('            <vehicle.depart-pos value="random"/>\n')
-            f.write('            <vehicle.departspeed value="random"/>\n')
-            f.write('        </randomize>\n')
-            f.write('    </defaults>\n')
-            
-            f.write('    <time>\n')
-            f.write('        <begin value="0"/>\n')
-            f.write(f'        <end value="{self.duration.value()}"/>\n')
-            f.write(f'        <step-length value="{self.step_length.value()}"/>\n')
-            f.write('    </time>\n')
-            
-            if self.collect_data.isChecked():
-                f.write('    <output>\n')
-                f.write(f'        <summary-output value="{os.path.join(self.temp_dir, "summary.xml")}"/>\n')
-                f.write(f'        <tripinfo-output value="{os.path.join(self.temp_dir, "tripinfo.xml")}"/>\n')
-                f.write('    </output>\n')
-            
-            f.write('    <report>\n')
-            f.write('        <verbose value="false"/>\n')
-            f.write('        <no-step-log value="true"/>\n')
-            f.write('    </report>\n')
-            
-            f.write('</configuration>\n')
+        try:
+            self.demand_matrix = load_demand(file_path)
+            self.demand_file = file_path
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to import demand: {str(e)}")
+            return
         
-        # Copy network file to temp dir if it's not already there
-        if not os.path.exists(os.path.join(self.temp_dir, os.path.basename(self.network_file))):
-            import shutil
-            shutil.copy(self.network_file, self.temp_dir)
+        trips = int(round(self.demand_matrix.counts.sum()))
+        self.demand_label.setText(f"{os.path.basename(file_path)} ({trips} trips)")
+    
+    def importZones(self):
+        """Load the traffic assignment zones an OD matrix refers to"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Import Zones", "", "TAZ Files (*.taz.xml *.xml);;All Files (*)"
+        )
+        if not file_path:
+            return
         
-        return config_file
+        try:
+            self.taz = read_taz(file_path)
+            self.taz_file = file_path
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to import zones: {str(e)}")
+    
+    def clearDemand(self):
+        """Go back to random trips"""
+        self.demand_file = None
+        self.demand_matrix = None
+        self.taz_file = None
+        self.taz = None
+        self.demand_label.setText("Random trips")
+    
+    def createConfigFile(self):
+        """Create a SUMO configuration file"""
+        return write_scenario_config(
+            self.currentScenario(), self.temp_dir, self.route_file, self.collect_data.isChecked()
+        )
     
     def updateSimulationData(self):
         """Get current simulation data and update visualization"""
@@ -515,9 +737,15 @@ class SimulationControlPanel(QWidget):
             self.simulation_timer.stop()
         
         # Disconnect from TraCI
+        self.stopFork()
         if hasattr(self, 'traci_controller') and self.traci_controller:
             self.traci_controller.disconnect()
         
+        # SUMO has finished its outputs now; read the rest of them
+        self.kpi_timer.stop()
+        if self.output_monitor:
+            self.updateKpis()
+        
         self.resetUI()
         self.update_timer.stop()
         
@@ -544,6 +772,7 @@ class SimulationControlPanel(QWidget):
         """Reset the UI controls after simulation stops"""
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
+        self.fork_btn.setEnabled(False)
         self.status_label.setText("Ready")
         self.status_label.setStyleSheet("color: #00FF00; font-weight: bold;")
         self.progress_bar.setValue(0)
@@ -563,6 +792,8 @@ class SimulationControlPanel(QWidget):
         self.step_length.setValue(0.1)
         self.collect_data.setChecked(True)
         self.use_gui.setChecked(True)
+        self.seed.setValue(DEFAULT_SEED)
+        self.routing_workers.setValue(1)
         
         # Reset status
         self.resetUI()
@@ -583,23 +814,30 @@ class SimulationControlPanel(QWidget):
         if progress >= 100:
             self.update_timer.stop()
     
-    def setNetworkFile(self, file_path):
-        """Set the network file to use for simulation"""
+    def setNetworkFile(self, file_path, model=None):
+        """
+        Set the network file to use for simulation
+        
+        Args:
+            file_path (str): Path to the network file
+            model (NetworkModel): Already parsed model of the file (optional,
+                otherwise it is loaded here)
+        """
         self.network_file = file_path
+        self.network_model = model
+        
+        if self.network_model is None:
+            try:
+                self.network_model = NetworkModel.load(file_path, cache=self.network_cache)
+            except Exception as e:
+                print(f"Error parsing network file: {e}")
+                return
         
         # Log network details for debugging
-        try:
-            import xml.etree.ElementTree as ET
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            
-            edges = root.findall('.//edge')
-            print(f"Network File: {file_path}")
-            print(f"Total Edges: {len(edges)}")
-            for edge in edges[:5]:  # Print first 5 edges
-                print(f"Edge ID: {edge.get('id')}")
-        except Exception as e:
-            print(f"Error parsing network file: {e}")
+        print(f"Network File: {file_path}")
+        print(f"Total Edges: {self.network_model.edge_count}")
+        for edge_id in self.network_model.edge_ids[:5]:  # Print first 5 edges
+            print(f"Edge ID: {edge_id}")
 
 
 class SimulationVisualization(QWidget):
@@ -714,356 +952,6 @@ class SimulationVisualization(QWidget):
         # to update the visualizations with new data
         pass
 
-class TraciSimulationController:
-    """
-    Controller class for interacting with SUMO via TraCI
-    """
-    def __init__(self):
-        self.connected = False
-        self.simulation_running = False
-        self.sumo_process = None
-        self.port = 8813
-    
-    def connect(self, config_file=None, port=8813):
-        """Connect to SUMO via TraCI"""
-        if not TRACI_AVAILABLE:
-            print("TraCI is not available")
-            return False
-        
-        try:
-            # Get SUMO_HOME
-            if 'SUMO_HOME' not in os.environ:
-                raise EnvironmentError("Please declare environment variable 'SUMO_HOME'")
-            
-            sumo_home = os.environ['SUMO_HOME']
-            sumo_binary = os.path.join(sumo_home, 'bin', 'sumo')
-            
-            if not os.path.exists(sumo_binary) and not os.path.exists(sumo_binary + '.exe'):
-                # Try with default path
-                sumo_binary = 'sumo'
-            
-            self.port = port
-            
-            if config_file:
-                # Start SUMO as a subprocess
-                cmd = [
-                    sumo_binary,
-                    '-c', config_file,
-                    '--remote-port', str(port),
-                    '--start',  # Start immediately
-                    '--no-warnings',  # Don't show warnings in console
-                    '--no-step-log',  # Don't show step info in console
-                ]
-                
-                # Start SUMO process
-                self.sumo_process = subprocess.Popen(cmd, 
-                                                    stdout=subprocess.PIPE, 
-                                                    stderr=subprocess.PIPE)
-                
-                # Give it a moment to start
-                time.sleep(1.0)
-                
-                # Connect to the running SUMO instance
-                traci.connect(port=port)
-            else:
-                # Connect to an already running SUMO instance
-                traci.connect(port=port)
-            
-            self.connected = True
-            self.simulation_running = True
-            return True
-        
-        except Exception as e:
-            print(f"Error connecting to SUMO: {e}")
-            self.connected = False
-            return False
-    
-    def disconnect(self):
-        """Disconnect from SUMO"""
-        if self.connected:
-            try:
-                traci.close()
-                
-                # Terminate the SUMO process if it's still running
-                if self.sumo_process:
-                    self.sumo_process.terminate()
-                    self.sumo_process = None
-                
-                self.connected = False
-                self.simulation_running = False
-            except Exception as e:
-                print(f"Error disconnecting from SUMO: {e}")
-    
-    def step(self):
-        """Perform one simulation step"""
-        if self.connected and self.simulation_running:
-            try:
-                traci.simulationStep()
-                
-                # Check if simulation has ended
-                if traci.simulation.getMinExpectedNumber() <= 0:
-                    # No more vehicles expected, we can end the simulation
-                    self.simulation_running = False
-                    return False
-                
-                return True
-            except Exception as e:
-                print(f"Error in simulation step: {e}")
-                self.simulation_running = False
-                return False
-        return False
-        
-    def getVehicles(self):
-        """Get all vehicles in the simulation"""
-        if self.connected:
-            try:
-                vehicles = traci.vehicle.getIDList()
-                print(f"Vehicles in simulation: {vehicles}")
-                return vehicles
-            except Exception as e:
-                print(f"Error getting vehicles: {e}")
-        return []
-    
-    def getVehicleData(self, vehicle_id):
-        """Get data for a specific vehicle"""
-        if self.connected:
-            try:
-                # Convert SUMO coordinates to scene coordinates
-                # Note: This is a simplified conversion - you may need to adjust based on your network
-                x, y = traci.vehicle.getPosition(vehicle_id)
-                
-                return {
-                    'position': (x, y),  # Adjusted coordinates
-                    'speed': traci.vehicle.getSpeed(vehicle_id),
-                    'route': traci.vehicle.getRoute(vehicle_id),
-                    'edge': traci.vehicle.getRoadID(vehicle_id),
-                    'lane': traci.vehicle.getLaneID(vehicle_id),
-                    'type': traci.vehicle.getTypeID(vehicle_id),
-                    'angle': traci.vehicle.getAngle(vehicle_id)  # Useful for rotation
-                }
-            except Exception as e:
-                print(f"Error getting vehicle data: {e}")
-        return None
-    
-    def getSimulationTime(self):
-        """Get current simulation time"""
-        if self.connected:
-            try:
-                return traci.simulation.getTime()
-            except Exception as e:
-                print(f"Error getting simulation time: {e}")
-        return 0
-    
-    def getTrafficLights(self):
-        """Get all traffic lights in the simulation"""
-        if self.connected:
-            try:
-                return traci.trafficlight.getIDList()
-            except Exception as e:
-                print(f"Error getting traffic lights: {e}")
-        return []
-    
-    def getTrafficLightState(self, tl_id):
-        """Get state of a specific traffic light"""
-        if self.connected:
-            try:
-                return traci.trafficlight.getRedYellowGreenState(tl_id)
-            except Exception as e:
-                print(f"Error getting traffic light state: {e}")
-        return None
-    
-    def setTrafficLightState(self, tl_id, state):
-        """Set state of a specific traffic light"""
-        if self.connected:
-            try:
-                traci.trafficlight.setRedYellowGreenState(tl_id, state)
-                return True
-            except Exception as e:
-                print(f"Error setting traffic light state: {e}")
-        return False
-    
-    def getNetworkBounds(self):
-        """Get the boundaries of the network"""
-        if self.connected:
-            try:
-                return traci.simulation.getNetBoundary()
-            except Exception as e:
-                print(f"Error getting network bounds: {e}")
-        return [0, 0, 100, 100]  # Default bounds if not connectedclass TraciSimulationController:
-    """
-    Controller class for interacting with SUMO via TraCI
-    """
-    def __init__(self):
-        self.connected = False
-        self.simulation_running = False
-        self.sumo_process = None
-        self.port = 8813
-    
-    def connect(self, config_file=None, port=8813):
-        """Connect to SUMO via TraCI"""
-        if not TRACI_AVAILABLE:
-            print("TraCI is not available")
-            return False
-        
-        try:
-            # Get SUMO_HOME
-            if 'SUMO_HOME' not in os.environ:
-                raise EnvironmentError("Please declare environment variable 'SUMO_HOME'")
-            
-            sumo_home = os.environ['SUMO_HOME']
-            sumo_binary = os.path.join(sumo_home, 'bin', 'sumo')
-            
-            if not os.path.exists(sumo_binary) and not os.path.exists(sumo_binary + '.exe'):
-                # Try with default path
-                sumo_binary = 'sumo'
-            
-            self.port = port
-            
-            if config_file:
-                # Start SUMO as a subprocess
-                cmd = [
-                    sumo_binary,
-                    '-c', config_file,
-                    '--remote-port', str(port),
-                    '--start',  # Start immediately
-                    '--no-warnings',  # Don't show warnings in console
-                    '--no-step-log',  # Don't show step info in console
-                ]
-                
-                # Start SUMO process
-                self.sumo_process = subprocess.Popen(cmd, 
-                                                    stdout=subprocess.PIPE, 
-                                                    stderr=subprocess.PIPE)
-                
-                # Give it a moment to start
-                time.sleep(1.0)
-                
-                # Connect to the running SUMO instance
-                traci.connect(port=port)
-            else:
-                # Connect to an already running SUMO instance
-                traci.connect(port=port)
-            
-            self.connected = True
-            self.simulation_running = True
-            return True
-        
-        except Exception as e:
-            print(f"Error connecting to SUMO: {e}")
-            self.connected = False
-            return False
-    
-    def disconnect(self):
-        """Disconnect from SUMO"""
-        if self.connected:
-            try:
-                traci.close()
-                
-                # Terminate the SUMO process if it's still running
-                if self.sumo_process:
-                    self.sumo_process.terminate()
-                    self.sumo_process = None
-                
-                self.connected = False
-                self.simulation_running = False
-            except Exception as e:
-                print(f"Error disconnecting from SUMO: {e}")
-    
-    def step(self):
-        """Perform one simulation step"""
-        if self.connected and self.simulation_running:
-            try:
-                traci.simulationStep()
-                
-                # Check if simulation has ended
-                if traci.simulation.getMinExpectedNumber() <= 0:
-                    # No more vehicles expected, we can end the simulation
-                    self.simulation_running = False
-                    return False
-                
-                return True
-            except Exception as e:
-                print(f"Error in simulation step: {e}")
-                self.simulation_running = False
-                return False
-        return False
-    
-    def getVehicles(self):
-        """Get all vehicles in the simulation"""
-        if self.connected:
-            try:
-                return traci.vehicle.getIDList()
-            except Exception as e:
-                print(f"Error getting vehicles: {e}")
-        return []
-    
-    def getVehicleData(self, vehicle_id):
-        """Get data for a specific vehicle"""
-        if self.connected:
-            try:
-                # Convert SUMO coordinates to scene coordinates
-                # Note: This is a simplified conversion - you may need to adjust based on your network
-                x, y = traci.vehicle.getPosition(vehicle_id)
-                
-                return {
-                    'position': (x, y),  # Adjusted coordinates
-                    'speed': traci.vehicle.getSpeed(vehicle_id),
-                    'route': traci.vehicle.getRoute(vehicle_id),
-                    'edge': traci.vehicle.getRoadID(vehicle_id),
-                    'lane': traci.vehicle.getLaneID(vehicle_id),
-                    'type': traci.vehicle.getTypeID(vehicle_id),
-                    'angle': traci.vehicle.getAngle(vehicle_id)  # Useful for rotation
-                }
-            except Exception as e:
-                print(f"Error getting vehicle data: {e}")
-        return None
-    
-    def getSimulationTime(self):
-        """Get current simulation time"""
-        if self.connected:
-            try:
-                return traci.simulation.getTime()
-            except Exception as e:
-                print(f"Error getting simulation time: {e}")
-        return 0
-    
-    def getTrafficLights(self):
-        """Get all traffic lights in the simulation"""
-        if self.connected:
-            try:
-                return traci.trafficlight.getIDList()
-            except Exception as e:
-                print(f"Error getting traffic lights: {e}")
-        return []
-    
-    def getTrafficLightState(self, tl_id):
-        """Get state of a specific traffic light"""
-        if self.connected:
-            try:
-                return traci.trafficlight.getRedYellowGreenState(tl_id)
-            except Exception as e:
-                print(f"Error getting traffic light state: {e}")
-        return None
-    
-    def setTrafficLightState(self, tl_id, state):
-        """Set state of a specific traffic light"""
-        if self.connected:
-            try:
-                traci.trafficlight.setRedYellowGreenState(tl_id, state)
-                return True
-            except Exception as e:
-                print(f"Error setting traffic light state: {e}")
-        return False
-    
-    def getNetworkBounds(self):
-        """Get the boundaries of the network"""
-        if self.connected:
-            try:
-                return traci.simulation.getNetBoundary()
-            except Exception as e:
-                print(f"Error getting network bounds: {e}")
-        return [0, 0, 100, 100]  # Default bounds if not connected
-
 class IntegratedSimulationVisualization(QWidget):
     """
     Widget for displaying SUMO simulation results directly in our application
@@ -1190,14 +1078,21 @@ class IntegratedSimulationVisualization(QWidget):
         main_layout.addWidget(control_panel)
     
     def setNetworkData(self, network_edges, network_nodes):
-        """Set the network data for visualization"""
-        self.network = {
-            'edges': network_edges,
-            'nodes': network_nodes
-        }
+        """Set the network data for visualization from editor tuples"""
+        self.setNetworkModel(NetworkModel.fromTuples(network_nodes, network_edges))
+    
+    def setNetworkModel(self, model):
+        """
+        Set the network to visualize
+        
+        Args:
+            model (NetworkModel): Parsed network, shared with the simulation panel
+        """
+        self.network = model
         
         # Clear the scene
         self.scene.clear()
+        self.vehicle_objects = {}
         
         # Draw the network
         self.drawNetwork()
@@ -1207,47 +1102,47 @@ class IntegratedSimulationVisualization(QWidget):
         if not self.network:
             return
         
+        model = self.network
+        
         # Draw nodes (junctions)
-        for node_id, x, y in self.network['nodes']:
-            # Create a node representation
+        node_pen = QPen(QColor("#4040bf"), 1)
+        node_brush = QBrush(QColor(64, 64, 191, 100))
+        for x, y in model.junction_xy.tolist():
             node = QGraphicsEllipseItem(x - 6, y - 6, 12, 12)
-            node.setPen(QPen(QColor("#4040bf"), 1))
-            node.setBrush(QBrush(QColor(64, 64, 191, 100)))
+            node.setPen(node_pen)
+            node.setBrush(node_brush)
             self.scene.addItem(node)
         
-        # Draw edges (roads)
-        for edge_id, from_node, to_node, lanes, speed in self.network['edges']:
-            # Find the nodes
-            from_coords = None
-            to_coords = None
+        # Draw edges (roads) along their shapes, so they line up with
+        # the vehicle positions reported by SUMO
+        for edge, (lanes, speed) in enumerate(zip(model.edge_lanes.tolist(), model.edge_speed.tolist())):
+            points = model.edgeShape(edge)
+            if len(points) < 2:
+                continue
+            
+            path = QPainterPath(QPointF(*points[0]))
+            for x, y in points[1:].tolist():
+                path.lineTo(x, y)
+            edge_item = QGraphicsPathItem(path)
+            
+            # Set color based on speed
+            if speed > 27.78:  # > 100 km/h
+                color = QColor("#FF3300")  # Red for highways
+            elif speed > 13.89:  # > 50 km/h
+                color = QColor("#FFAA00")  # Orange for main roads
+            else:
+                color = QColor("#00FFAA")  # Cyan-green for local roads
             
-            for node_id, x, y in self.network['nodes']:
-                if node_id == from_node:
-                    from_coords = (x, y)
-                elif node_id == to_node:
-                    to_coords = (x, y)
+            # Set width based on lanes
+            width = 1 + lanes
             
-            if from_coords and to_coords:
-                # Create an edge representation
-                edge = QGraphicsLineItem(from_coords[0], from_coords[1], to_coords[0], to_coords[1])
-                
-                # Set color based on speed
-                if speed > 27.78:  # > 100 km/h
-                    color = QColor("#FF3300")  # Red for highways
-                elif speed > 13.89:  # > 50 km/h
-                    color = QColor("#FFAA00")  # Orange for main roads
-                else:
-                    color = QColor("#00FFAA")  # Cyan-green for local roads
-                
-                # Set width based on lanes
-                width = 1 + lanes
-                
-                edge.setPen(QPen(color, width, Qt.PenStyle.SolidLine, 
-                              Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin))
-                self.scene.addItem(edge)
+            edge_item.setPen(QPen(color, width, Qt.PenStyle.SolidLine, 
+                                  Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin))
+            self.scene.addItem(edge_item)
         
         # Set the scene rect to fit the network
-        self.scene.setSceneRect(self.scene.itemsBoundingRect())
+        min_x, min_y, max_x, max_y = model.bounds
+        self.scene.setSceneRect(QRectF(min_x, min_y, max_x - min_x, max_y - min_y).adjusted(-20, -20, 20, 20))
         self.view.fitInView(self.scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
     
     def updateVehicles(self, vehicles_data):
@@ -0,0 +1,91 @@
+import gzip
+from xml.sax.saxutils import quoteattr
+
+# Size of the write buffer for plain files
+BUFFER_SIZE = 1 << 20
+
+
+class XMLStreamWriter:
+    """
+    Writes indented XML incrementally to a file
+
+    Elements are written as soon as they are added, so memory use does not
+    depend on the size of the document. Files ending in .gz are gzip
+    compressed. Use as a context manager, or call close() when done.
+
+        with XMLStreamWriter("routes.rou.xml") as writer:
+            writer.start("routes")
+            writer.element("vType", {"id": "car"})
+            writer.end()
+    """
+    def __init__(self, output, indent="    ", compresslevel=6):
+        """
+        Args:
+            output (str): Path of the file to write (gzip compressed if it ends in .gz)
+            indent (str): Indentation per nesting level
+            compresslevel (int): gzip compression level (1 is fastest)
+        """
+        if output.endswith(".gz"):
+            self.file = gzip.open(output, 'wt', encoding="utf-8", compresslevel=compresslevel)
+        else:
+            self.file = open(output, 'w', encoding="utf-8", buffering=BUFFER_SIZE)
+        self.indent = indent
+        self.open_tags = []
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self, tag, attributes=None):
+        """Open an element; its children follow until the matching end()"""
+        self.file.write(f"{self._prefix()}<{tag}{self._attributes(attributes)}>\n")
+        self.open_tags.append(tag)
+
+    def end(self):
+        """Close the innermost open element"""
+        tag = self.open_tags.pop()
+        self.file.write(f"{self._prefix()}</{tag}>\n")
+
+    def element(self, tag, attributes=None, text=None):
+        """Write a complete element (self-closing unless it has text)"""
+        prefix = self._prefix()
+        if text is None:
+            self.file.write(f"{prefix}<{tag}{self._attributes(attributes)}/>\n")
+        else:
+            text = str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            self.file.write(f"{prefix}<{tag}{self._attributes(attributes)}>{text}</{tag}>\n")
+
+    def comment(self, text):
+        self.file.write(f"{self._prefix()}<!-- {text} -->\n")
+
+    def raw(self, text):
+        """
+        Write pre-rendered markup as is
+
+        Used for large batches of elements rendered in one join; the text
+        must already be indented and escaped.
+        """
+        self.file.write(text)
+
+    def level(self):
+        """Get the indentation for children of the innermost open element"""
+        return self._prefix()
+
+    def close(self):
+        """Close any open elements and the file"""
+        if self.file.closed:
+            return
+        while self.open_tags:
+            self.end()
+        self.file.close()
+
+    def _prefix(self):
+        return self.indent * len(self.open_tags)
+
+    def _attributes(self, attributes):
+        if not attributes:
+            return ""
+        return "".join(f" {key}={quoteattr(str(value))}" for key, value in attributes.items())